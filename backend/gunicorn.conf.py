@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for the HyperSearch backend
+Production entry point: gunicorn -c gunicorn.conf.py main:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Views are synchronous and mostly wait on network IO - threaded workers per core
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# Log to stdout/stderr for the container runtime
+accesslog = '-'
+errorlog = '-'
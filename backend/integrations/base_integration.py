@@ -4,13 +4,88 @@ Foundation for all platform integrations
 """
 
 import logging
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any
+from typing import Awaitable, Dict, List, Optional, Any, Union
 from datetime import datetime
 import json
 
+import aiohttp
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - fall back to stdlib json
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON response body, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj: Any) -> bytes:
+    """Serialize request body to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+def json_dumps_str(obj: Any) -> str:
+    """Serialize to a JSON string (aiohttp json_serialize hook), using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+async def _capture_exception(aw: Awaitable[Any]) -> Any:
+    """Await and return the result, or the exception it raised"""
+    try:
+        return await aw
+    except Exception as e:
+        return e
+
+async def run_concurrently(awaitables: Dict[str, Awaitable[Any]]) -> Dict[str, Any]:
+    """
+    Run awaitables concurrently, mapping each key to its result or raised exception
+    Uses asyncio.TaskGroup (3.11+) so cancellation of the caller cancels all children
+    """
+    if hasattr(asyncio, 'TaskGroup'):
+        async with asyncio.TaskGroup() as tg:
+            tasks = {key: tg.create_task(_capture_exception(aw)) for key, aw in awaitables.items()}
+        return {key: task.result() for key, task in tasks.items()}
+    
+    results = await asyncio.gather(*awaitables.values(), return_exceptions=True)
+    return dict(zip(awaitables.keys(), results))
+
+class AsyncTokenBucket:
+    """
+    Proactive rate limiter: acquire() waits until a request fits under the rate
+    Keeps callers below the provider's limit instead of backing off after 429s
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Take one token, sleeping until one is available"""
+        # Lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 class BaseIntegration(ABC):
     """
     Base class for all platform integrations
@@ -35,6 +110,31 @@ class BaseIntegration(ABC):
         self.total_requests = 0
         self.successful_requests = 0
         self.failed_requests = 0
+        
+        # Shared HTTP session, created lazily inside the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the integration's keep-alive HTTP session"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=32,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                # Used by clients that pass json= (e.g. slack_sdk's chat.postMessage)
+                json_serialize=json_dumps_str
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     @abstractmethod
     async def authenticate(self, user_id: str) -> Dict[str, Any]:
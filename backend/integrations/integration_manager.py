@@ -5,11 +5,14 @@ Manages all platform integrations and provides unified interface
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any, Type
+import copy
+import time
+from typing import Callable, Dict, List, Optional, Any, Tuple, Type
 from datetime import datetime
+from dataclasses import dataclass, asdict
 import json
 
-from .base_integration import BaseIntegration
+from .base_integration import BaseIntegration, run_concurrently
 from .microsoft_integration import MicrosoftIntegration
 from .google_integration import GoogleIntegration
 from .meta_integration import MetaIntegration
@@ -20,24 +23,48 @@ from . import INTEGRATION_REGISTRY
 
 logger = logging.getLogger(__name__)
 
+@dataclass(slots=True)
+class ManagerStats:
+    """Integration manager search counters"""
+    total_searches: int = 0
+    successful_searches: int = 0
+    failed_searches: int = 0
+    integrations_active: int = 0
+
 class IntegrationManager:
     """
     Central manager for all platform integrations
     Provides unified interface for authentication and search
     """
     
+    __slots__ = ('config', 'integrations', 'user_tokens', 'stats',
+                 '_result_cache', '_result_cache_ttl', '_result_cache_size',
+                 '_state_version', '_status_cache', '_manager_stats_cache',
+                 '_search_dispatch', '_auth_dispatch', '_test_dispatch')
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.integrations: Dict[str, BaseIntegration] = {}
         self.user_tokens: Dict[str, Dict[str, str]] = {}  # user_id -> {platform: token}
         
+        # Pre-bound integration methods, kept in sync by _load_integration
+        self._search_dispatch: Dict[str, Callable] = {}
+        self._auth_dispatch: Dict[str, Callable] = {}
+        self._test_dispatch: Dict[str, Callable] = {}
+        
         # Integration statistics
-        self.stats = {
-            'total_searches': 0,
-            'successful_searches': 0,
-            'failed_searches': 0,
-            'integrations_active': 0
-        }
+        self.stats = ManagerStats()
+        
+        # Short-lived cache of combined search results
+        # (user_id, platforms, casefolded query) -> (stored_at, result)
+        self._result_cache: Dict[Tuple[str, frozenset, str], Tuple[float, Dict[str, Any]]] = {}
+        self._result_cache_ttl = config.get('search_cache_ttl', 30)  # seconds
+        self._result_cache_size = config.get('search_cache_size', 256)
+        
+        # Status snapshots, reused until _state_version changes
+        self._state_version = 0
+        self._status_cache: Optional[Tuple[int, List[Tuple[str, BaseIntegration, List[str]]]]] = None
+        self._manager_stats_cache: Optional[Tuple[int, Dict[str, Any]]] = None
         
         self._initialize_integrations()
     
@@ -48,8 +75,8 @@ class IntegrationManager:
                 if integration_config.get('enabled', True):
                     self._load_integration(integration_name, integration_config)
             
-            self.stats['integrations_active'] = len(self.integrations)
-            logger.info(f"🔗 Integration Manager initialized with {len(self.integrations)} integrations")
+            self.stats.integrations_active = len(self.integrations)
+            logger.info("🔗 Integration Manager initialized with %d integrations", len(self.integrations))
             
         except Exception as e:
             logger.error(f"Failed to initialize integrations: {e}")
@@ -61,7 +88,11 @@ class IntegrationManager:
             if integration_class:
                 integration = integration_class(config)
                 self.integrations[name] = integration
-                logger.info(f"✅ Loaded integration: {name}")
+                self._search_dispatch[name] = integration.search_all
+                self._auth_dispatch[name] = integration.authenticate
+                self._test_dispatch[name] = integration.test_connection
+                self._invalidate_status()
+                logger.info("✅ Loaded integration: %s", name)
             else:
                 logger.warning(f"Unknown integration: {name}")
                 
@@ -71,11 +102,11 @@ class IntegrationManager:
     async def authenticate_user(self, user_id: str, platform: str) -> Dict[str, Any]:
         """Authenticate user with specific platform"""
         try:
-            if platform not in self.integrations:
+            authenticate = self._auth_dispatch.get(platform)
+            if authenticate is None:
                 return {"error": f"Integration {platform} not available"}
             
-            integration = self.integrations[platform]
-            return await integration.authenticate(user_id)
+            return await authenticate(user_id)
             
         except Exception as e:
             logger.error(f"Authentication failed for {platform}: {e}")
@@ -87,7 +118,12 @@ class IntegrationManager:
             self.user_tokens[user_id] = {}
         
         self.user_tokens[user_id][platform] = token
-        logger.info(f"Token stored for user {user_id} on platform {platform}")
+        self._invalidate_status()
+        
+        # Cached searches ran with the user's old credentials
+        for key in [key for key in self._result_cache if key[0] == user_id]:
+            del self._result_cache[key]
+        logger.info("Token stored for user %s on platform %s", user_id, platform)
     
     def get_user_token(self, user_id: str, platform: str) -> Optional[str]:
         """Get user authentication token for platform"""
@@ -96,37 +132,43 @@ class IntegrationManager:
     async def search_platform(self, platform: str, query: str, user_id: str) -> Dict[str, Any]:
         """Search specific platform"""
         try:
-            if platform not in self.integrations:
+            search_all = self._search_dispatch.get(platform)
+            if search_all is None:
                 return {"error": f"Integration {platform} not available"}
             
-            integration = self.integrations[platform]
             user_token = self.get_user_token(user_id, platform)
             
             # Perform search
             start_time = datetime.utcnow()
-            results = await integration.search_all(query, user_token)
+            results = await search_all(query, user_token)
             search_time = (datetime.utcnow() - start_time).total_seconds()
             
-            # Update statistics
-            self.stats['total_searches'] += 1
-            if results:
-                self.stats['successful_searches'] += 1
-                integration.update_stats(True)
-            else:
-                self.stats['failed_searches'] += 1
-                integration.update_stats(False)
+            total = sum(len(v) for v in results.values() if isinstance(v, list)) if results else 0
+            
+            # Update statistics - a search only counts as successful when at
+            # least one service returned hits, not merely when a dict came back
+            ok = total > 0
+            stats = self.stats
+            stats.total_searches += 1
+            stats.successful_searches += ok
+            stats.failed_searches += not ok
+            self.integrations[platform].update_stats(ok)
+            self._invalidate_status()
             
             return {
                 "platform": platform,
                 "query": query,
                 "results": results,
+                "total": total,
                 "search_time": search_time,
                 "timestamp": datetime.utcnow().isoformat()
             }
             
         except Exception as e:
             logger.error(f"Search failed for platform {platform}: {e}")
-            self.stats['failed_searches'] += 1
+            self.stats.total_searches += 1
+            self.stats.failed_searches += 1
+            self._invalidate_status()
             return {"error": str(e), "platform": platform, "query": query}
     
     async def search_all_platforms(self, query: str, user_id: str, 
@@ -142,25 +184,28 @@ class IntegrationManager:
             if not available_platforms:
                 return {"error": "No available platforms to search"}
             
-            logger.info(f"Searching platforms: {available_platforms} for query: '{query}'")
+            # Serve repeated searches (typeahead, refresh) from cache
+            cache_key = (user_id, frozenset(available_platforms), query.casefold())
+            cached = self._result_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < self._result_cache_ttl:
+                # Deep copy so callers can't mutate the cached entry
+                return {**copy.deepcopy(cached[1]), "cached": True}
             
-            # Run searches concurrently
-            tasks = [
-                self.search_platform(platform, query, user_id)
-                for platform in available_platforms
-            ]
+            logger.info("Searching platforms: %s for query: '%s'", available_platforms, query)
             
+            # Run searches concurrently
             start_time = datetime.utcnow()
-            platform_results = await asyncio.gather(*tasks, return_exceptions=True)
+            platform_results = await run_concurrently({
+                platform: self.search_platform(platform, query, user_id)
+                for platform in available_platforms
+            })
             total_time = (datetime.utcnow() - start_time).total_seconds()
             
             # Combine results
             combined_results = {}
             total_results = 0
             
-            for i, result in enumerate(platform_results):
-                platform = available_platforms[i]
-                
+            for platform, result in platform_results.items():
                 if isinstance(result, Exception):
                     logger.error(f"Platform {platform} search failed: {result}")
                     combined_results[platform] = {"error": str(result)}
@@ -168,13 +213,9 @@ class IntegrationManager:
                     combined_results[platform] = result
                 else:
                     combined_results[platform] = result
-                    # Count total results
-                    if 'results' in result:
-                        for service_results in result['results'].values():
-                            if isinstance(service_results, list):
-                                total_results += len(service_results)
+                    total_results += result.get('total', 0)
             
-            return {
+            search_result = {
                 "query": query,
                 "platforms_searched": available_platforms,
                 "results": combined_results,
@@ -182,22 +223,55 @@ class IntegrationManager:
                 "search_time": total_time,
                 "timestamp": datetime.utcnow().isoformat()
             }
+            # Don't cache a search where every platform failed
+            if not all('error' in result for result in combined_results.values()):
+                self._cache_search_result(cache_key, copy.deepcopy(search_result))
+            
+            return search_result
             
         except Exception as e:
             logger.error(f"Multi-platform search failed: {e}")
             return {"error": str(e), "query": query}
     
+    def _cache_search_result(self, key: Tuple[str, frozenset, str], result: Dict[str, Any]):
+        """Store combined search result, evicting expired/oldest entries when full"""
+        now = time.monotonic()
+        cache = self._result_cache
+        
+        if len(cache) >= self._result_cache_size:
+            for stale_key in [k for k, (stored_at, _) in cache.items() if now - stored_at >= self._result_cache_ttl]:
+                del cache[stale_key]
+            
+            # Dicts keep insertion order, so the first keys are the oldest
+            while len(cache) >= self._result_cache_size:
+                del cache[next(iter(cache))]
+        
+        cache.pop(key, None)
+        cache[key] = (now, result)
+    
+    def _invalidate_status(self):
+        """Mark cached status/stats snapshots as stale"""
+        self._state_version += 1
+    
     def get_available_integrations(self) -> List[Dict[str, Any]]:
         """Get list of available integrations"""
+        # Only the static per-integration parts are snapshotted; status, health and
+        # stats (uptime, request counters) change on their own and are read every call
+        if not self._status_cache or self._status_cache[0] != self._state_version:
+            self._status_cache = (self._state_version, [
+                (name, integration, integration.get_supported_services())
+                for name, integration in self.integrations.items()
+            ])
+        
         return [
             {
                 'name': name,
                 'status': integration.get_integration_status(),
-                'supported_services': integration.get_supported_services(),
+                'supported_services': supported_services,
                 'is_healthy': integration.is_healthy(),
                 'stats': integration.get_stats()
             }
-            for name, integration in self.integrations.items()
+            for name, integration, supported_services in self._status_cache[1]
         ]
     
     def get_user_connected_platforms(self, user_id: str) -> List[str]:
@@ -208,9 +282,9 @@ class IntegrationManager:
         """Test all integrations connectivity"""
         test_results = {}
         
-        for name, integration in self.integrations.items():
+        for name, test_connection in self._test_dispatch.items():
             try:
-                result = await integration.test_connection()
+                result = await test_connection()
                 test_results[name] = result
             except Exception as e:
                 test_results[name] = {
@@ -228,16 +302,19 @@ class IntegrationManager:
     
     def get_manager_stats(self) -> Dict[str, Any]:
         """Get integration manager statistics"""
-        return {
-            'integrations_loaded': len(self.integrations),
-            'integrations_active': self.stats['integrations_active'],
-            'total_searches': self.stats['total_searches'],
-            'successful_searches': self.stats['successful_searches'],
-            'failed_searches': self.stats['failed_searches'],
-            'success_rate': (self.stats['successful_searches'] / self.stats['total_searches'] * 100) if self.stats['total_searches'] > 0 else 0,
-            'connected_users': len(self.user_tokens),
-            'available_platforms': list(self.integrations.keys())
-        }
+        if not self._manager_stats_cache or self._manager_stats_cache[0] != self._state_version:
+            stats = self.stats
+            self._manager_stats_cache = (self._state_version, {
+                'integrations_loaded': len(self.integrations),
+                **asdict(stats),
+                'success_rate': (stats.successful_searches / stats.total_searches * 100) if stats.total_searches > 0 else 0,
+                'connected_users': len(self.user_tokens),
+                'available_platforms': list(self.integrations.keys())
+            })
+        
+        # Callers get their own copy (including the one nested list) so the snapshot stays intact
+        manager_stats = self._manager_stats_cache[1]
+        return {**manager_stats, 'available_platforms': list(manager_stats['available_platforms'])}
     
     def reload_integration(self, name: str) -> bool:
         """Reload specific integration"""
@@ -257,7 +334,8 @@ class IntegrationManager:
             if name in self.integrations:
                 integration = self.integrations[name]
                 integration.enabled = False
-                logger.info(f"Disabled integration: {name}")
+                self._invalidate_status()
+                logger.info("Disabled integration: %s", name)
                 return True
             return False
         except Exception as e:
@@ -270,9 +348,18 @@ class IntegrationManager:
             if name in self.integrations:
                 integration = self.integrations[name]
                 integration.enabled = True
-                logger.info(f"Enabled integration: {name}")
+                self._invalidate_status()
+                logger.info("Enabled integration: %s", name)
                 return True
             return False
         except Exception as e:
             logger.error(f"Failed to enable integration {name}: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    async def shutdown(self):
+        """Release integration resources (HTTP sessions)"""
+        for name, integration in self.integrations.items():
+            try:
+                await integration.close()
+            except Exception as e:
+                logger.error(f"Failed to close integration {name}: {e}")
\ No newline at end of file
@@ -4,19 +4,24 @@ Integration with Facebook, Instagram, Threads, WhatsApp Business
 """
 
 import logging
-import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import json
+from typing import Dict, List, Any
+from types import MappingProxyType
 
 import aiohttp
-import requests
-from facebook import GraphAPI
 
-from .base_integration import BaseIntegration
+from .base_integration import BaseIntegration, json_loads, json_dumps, run_concurrently
 
 logger = logging.getLogger(__name__)
 
+# Returned while Meta has no public Threads search API; read-only, responses get a copy
+_THREADS_PLACEHOLDER = MappingProxyType({
+    'id': 'threads_placeholder',
+    'title': 'Threads Integration Coming Soon',
+    'content': 'Threads API integration will be available when Meta releases full API access.',
+    'source': 'Threads',
+    'type': 'info'
+})
+
 class MetaIntegration(BaseIntegration):
     """
     Meta Platforms Integration
@@ -37,6 +42,9 @@ class MetaIntegration(BaseIntegration):
         self.whatsapp_phone_id = config.get('whatsapp_phone_id')
         self.whatsapp_token = config.get('whatsapp_token')
         
+        # Threads search is a placeholder until the API opens up
+        self._threads_enabled = config.get('threads_enabled', False)
+        
         # Supported services
         self.services = {
             'facebook_pages': True,
@@ -81,13 +89,22 @@ class MetaIntegration(BaseIntegration):
             logger.error(f"Meta authentication failed: {e}")
             return {"error": str(e), "status": "failed"}
     
+    async def _graph(self, session: aiohttp.ClientSession, path: str, access_token: str,
+                     api_version: str = None, **params) -> Dict[str, Any]:
+        """GET a Graph API object over the given aiohttp session"""
+        url = f"https://graph.facebook.com/{api_version or self.facebook_api_version}/{path}"
+        params['access_token'] = access_token
+        
+        async with session.get(url, params=params) as response:
+            response.raise_for_status()
+            return json_loads(await response.read())
+    
     async def search_facebook_pages(self, query: str, access_token: str) -> List[Dict[str, Any]]:
         """Search Facebook Pages content"""
         try:
-            graph = GraphAPI(access_token, version=self.facebook_api_version)
-            
+            session = await self._get_session()
             # Get user's pages
-            pages = graph.get_object('me/accounts')
+            pages = await self._graph(session, 'me/accounts', access_token)
             results = []
             
             for page in pages.get('data', []):
@@ -96,8 +113,10 @@ class MetaIntegration(BaseIntegration):
                 
                 # Search posts on this page
                 try:
-                    page_graph = GraphAPI(page_token, version=self.facebook_api_version)
-                    posts = page_graph.get_object(f'{page_id}/posts', fields='id,message,created_time,permalink_url')
+                    posts = await self._graph(
+                        session, f'{page_id}/posts', page_token,
+                        fields='id,message,created_time,permalink_url'
+                    )
                     
                     for post in posts.get('data', []):
                         message = post.get('message', '')
@@ -126,23 +145,27 @@ class MetaIntegration(BaseIntegration):
     async def search_instagram_business(self, query: str, access_token: str) -> List[Dict[str, Any]]:
         """Search Instagram Business account content"""
         try:
-            graph = GraphAPI(access_token, version=self.instagram_api_version)
+            api_version = self.instagram_api_version
             
+            session = await self._get_session()
             # Get Instagram Business Account
-            pages = graph.get_object('me/accounts')
+            pages = await self._graph(session, 'me/accounts', access_token, api_version)
             results = []
             
             for page in pages.get('data', []):
                 try:
                     # Get Instagram account connected to page
-                    instagram_account = graph.get_object(f"{page['id']}?fields=instagram_business_account")
+                    instagram_account = await self._graph(
+                        session, page['id'], access_token, api_version,
+                        fields='instagram_business_account'
+                    )
                     
                     if 'instagram_business_account' in instagram_account:
                         ig_account_id = instagram_account['instagram_business_account']['id']
                         
                         # Get Instagram media
-                        media_data = graph.get_object(
-                            f'{ig_account_id}/media',
+                        media_data = await self._graph(
+                            session, f'{ig_account_id}/media', access_token, api_version,
                             fields='id,caption,media_type,created_time,permalink,thumbnail_url'
                         )
                         
@@ -186,28 +209,28 @@ class MetaIntegration(BaseIntegration):
                 'Content-Type': 'application/json'
             }
             
-            async with aiohttp.ClientSession() as session:
-                # Get message templates that contain the query
-                templates_url = f"https://graph.facebook.com/{self.facebook_api_version}/{self.whatsapp_phone_id}/message_templates"
-                
-                async with session.get(templates_url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        results = []
-                        
-                        for template in data.get('data', []):
-                            if query.lower() in template.get('name', '').lower():
-                                results.append({
-                                    'id': template.get('id'),
-                                    'title': f"WhatsApp Template: {template.get('name')}",
-                                    'content': template.get('name'),
-                                    'source': 'WhatsApp Business',
-                                    'type': 'message_template',
-                                    'status': template.get('status'),
-                                    'language': template.get('language')
-                                })
-                        
-                        return results
+            session = await self._get_session()
+            # Get message templates that contain the query
+            templates_url = f"https://graph.facebook.com/{self.facebook_api_version}/{self.whatsapp_phone_id}/message_templates"
+            
+            async with session.get(templates_url, headers=headers) as response:
+                if response.status == 200:
+                    data = json_loads(await response.read())
+                    results = []
+                    
+                    for template in data.get('data', []):
+                        if query.lower() in template.get('name', '').lower():
+                            results.append({
+                                'id': template.get('id'),
+                                'title': f"WhatsApp Template: {template.get('name')}",
+                                'content': template.get('name'),
+                                'source': 'WhatsApp Business',
+                                'type': 'message_template',
+                                'status': template.get('status'),
+                                'language': template.get('language')
+                            })
+                    
+                    return results
             
             return []
             
@@ -221,17 +244,10 @@ class MetaIntegration(BaseIntegration):
             # Threads API is still limited - this is a placeholder implementation
             # Currently, Threads content might be accessible through Instagram Business API
             
-            logger.info(f"Threads search requested for: {query}")
+            logger.info("Threads search requested for: %s", query)
             
             # Placeholder implementation
-            return [{
-                'id': 'threads_placeholder',
-                'title': 'Threads Integration Coming Soon',
-                'content': 'Threads API integration will be available when Meta releases full API access.',
-                'source': 'Threads',
-                'type': 'info',
-                'created_time': datetime.utcnow().isoformat()
-            }]
+            return [dict(_THREADS_PLACEHOLDER)]
             
         except Exception as e:
             logger.error(f"Threads search failed: {e}")
@@ -240,21 +256,28 @@ class MetaIntegration(BaseIntegration):
     async def search_all(self, query: str, access_token: str) -> Dict[str, List[Dict[str, Any]]]:
         """Search across all Meta platforms"""
         try:
-            # Run searches concurrently
-            tasks = [
-                self.search_facebook_pages(query, access_token),
-                self.search_instagram_business(query, access_token),
-                self.search_whatsapp_business(query),
-                self.search_threads(query, access_token)
-            ]
+            # Run searches concurrently, skipping services with nothing to fetch
+            searches = {
+                'facebook': self.search_facebook_pages(query, access_token),
+                'instagram': self.search_instagram_business(query, access_token)
+            }
+            if self.whatsapp_phone_id and self.whatsapp_token:
+                searches['whatsapp'] = self.search_whatsapp_business(query)
+            if self._threads_enabled:
+                searches['threads'] = self.search_threads(query, access_token)
             
-            facebook_results, instagram_results, whatsapp_results, threads_results = await asyncio.gather(*tasks)
+            results = await run_concurrently(searches)
+            
+            for service, service_results in results.items():
+                if isinstance(service_results, Exception):
+                    logger.error(f"Meta {service} search failed: {service_results}")
+                    results[service] = []
             
             return {
-                'facebook': facebook_results,
-                'instagram': instagram_results, 
-                'whatsapp': whatsapp_results,
-                'threads': threads_results
+                'facebook': results['facebook'],
+                'instagram': results['instagram'],
+                'whatsapp': results.get('whatsapp', []),
+                'threads': results['threads'] if self._threads_enabled else [dict(_THREADS_PLACEHOLDER)]
             }
             
         except Exception as e:
@@ -279,17 +302,17 @@ class MetaIntegration(BaseIntegration):
                 'text': {'body': message}
             }
             
-            async with aiohttp.ClientSession() as session:
-                url = f"https://graph.facebook.com/{self.facebook_api_version}/{self.whatsapp_phone_id}/messages"
-                
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {"success": True, "message_id": data.get('messages', [{}])[0].get('id')}
-                    else:
-                        error_data = await response.json()
-                        return {"error": error_data}
-                        
+            session = await self._get_session()
+            url = f"https://graph.facebook.com/{self.facebook_api_version}/{self.whatsapp_phone_id}/messages"
+            
+            async with session.post(url, headers=headers, data=json_dumps(payload)) as response:
+                if response.status == 200:
+                    data = json_loads(await response.read())
+                    return {"success": True, "message_id": data.get('messages', [{}])[0].get('id')}
+                else:
+                    error_data = json_loads(await response.read())
+                    return {"error": error_data}
+                    
         except Exception as e:
             logger.error(f"WhatsApp message sending failed: {e}")
             return {"error": str(e)}
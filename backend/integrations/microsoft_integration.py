@@ -5,27 +5,172 @@ Comprehensive integration with Microsoft ecosystem
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import json
+import os
+import time
+from typing import Awaitable, Callable, ClassVar, Dict, List, Mapping, Optional, Any, Set, Tuple
+from datetime import datetime, timedelta, timezone
+import hashlib
+import random
+from email.utils import parsedate_to_datetime
+from types import MappingProxyType
+from urllib.parse import quote
 
 import aiohttp
-from msal import ConfidentialClientApplication
+from msal import ConfidentialClientApplication, SerializableTokenCache
 from msgraph import GraphServiceClient
 from azure.identity import ClientSecretCredential
 
-from .base_integration import BaseIntegration
+from .base_integration import BaseIntegration, json_loads, json_dumps, run_concurrently
 from ..utils.auth import OAuthHandler
 from ..utils.cache import CacheManager
 
 logger = logging.getLogger(__name__)
 
+GRAPH_API_URL = 'https://graph.microsoft.com/v1.0'
+GRAPH_DEFAULT_SCOPE = ['https://graph.microsoft.com/.default']
+
+# Graph throttling/transient statuses worth retrying
+GRAPH_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+GRAPH_MAX_RETRY_DELAY = 30  # seconds
+
+# UTC timestamp format for calendarView bounds
+GRAPH_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Graph $batch allows at most 20 sub-requests per POST
+GRAPH_BATCH_LIMIT = 20
+
+# Only the fields the result parsers read
+SEARCH_HIT_FIELDS = ["hitId", "summary", "lastModifiedTime", "webUrl", "createdDateTime", "lastModifiedDateTime"]
+OUTLOOK_SELECT = 'id,subject,bodyPreview,from,receivedDateTime,importance,hasAttachments'
+ONEDRIVE_SELECT = 'id,name,file,size,createdDateTime,lastModifiedDateTime,webUrl'
+# Pre-authenticated download URLs are ~1-2 KB each, so only request them when enabled
+ONEDRIVE_DOWNLOAD_URL_FIELD = '@microsoft.graph.downloadUrl'
+CALENDAR_SELECT = 'id,subject,body,start,end,location,organizer,attendees,importance,webLink'
+
+# Static parts of the Search API request entries, shared across calls (never mutated)
+SEARCH_REQUEST_HEADERS = {"Content-Type": "application/json"}
+TEAMS_ENTITY_TYPES = ("message",)
+SHAREPOINT_ENTITY_TYPES = ("site", "driveItem")
+
+# Static parts of the GET request URLs; only the quoted query varies per call
+OUTLOOK_SEARCH_PREFIX = '/me/messages?$search=%22'
+OUTLOOK_SEARCH_SUFFIX = f'%22&$top=25&$select={OUTLOOK_SELECT}'
+ONEDRIVE_SEARCH_PREFIX = '/me/drive/root/search(q=%27'
+ONEDRIVE_SEARCH_SUFFIX = f'%27)?$top=25&$select={ONEDRIVE_SELECT}'
+ONEDRIVE_SEARCH_SUFFIX_WITH_DOWNLOAD = f'{ONEDRIVE_SEARCH_SUFFIX},{ONEDRIVE_DOWNLOAD_URL_FIELD}'
+
+# Shared read-only default for nested .get() chains in the parsers
+_EMPTY = MappingProxyType({})
+
+class GraphRequestError(Exception):
+    """Non-success status returned for a Graph (sub-)request"""
+    
+    def __init__(self, status: int, request_id: str):
+        super().__init__(f"Graph request '{request_id}' failed: HTTP {status}")
+        self.status = status
+        self.request_id = request_id
+
+# Failures that mean "Graph returned nothing usable"; anything else is a bug and propagates
+GRAPH_REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, GraphRequestError, ValueError)
+
+class GraphBatcher:
+    """
+    Coalesces Graph requests submitted within a short window into $batch POSTs
+    Requests are grouped per user token, since a batch carries a single Authorization header
+    """
+    
+    def __init__(self, send_batch: Callable[[str, List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+                 window: float = 0.01, max_batch: int = GRAPH_BATCH_LIMIT):
+        self._send_batch = send_batch
+        self._window = window
+        self._max_batch = min(max_batch, GRAPH_BATCH_LIMIT)
+        self._pending: Dict[str, List[Tuple[asyncio.Future, Dict[str, Any]]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._inflight: Set[asyncio.Task] = set()
+    
+    def submit(self, request: Dict[str, Any], user_token: str) -> Awaitable[Dict[str, Any]]:
+        """Queue a $batch-style request entry; resolves to its child response (id, status, headers, body)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(user_token, [])
+        queue.append((future, request))
+        
+        if len(queue) >= self._max_batch:
+            self._flush(user_token)
+        elif user_token not in self._timers:
+            self._timers[user_token] = loop.call_later(self._window, self._flush, user_token)
+        
+        return future
+    
+    def _flush(self, user_token: str):
+        """Send everything queued for a token as one batch"""
+        timer = self._timers.pop(user_token, None)
+        if timer is not None:
+            timer.cancel()
+        
+        entries = self._pending.pop(user_token, None)
+        if not entries:
+            return
+        
+        task = asyncio.ensure_future(self._dispatch(user_token, entries))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+    
+    async def _dispatch(self, user_token: str, entries: List[Tuple[asyncio.Future, Dict[str, Any]]]):
+        """POST one batch and fan child responses out to the waiting futures"""
+        # Callers may reuse ids (e.g. two users' 'teams'), so renumber within the batch
+        requests = [{**request, 'id': str(index)} for index, (_, request) in enumerate(entries)]
+        
+        try:
+            data = await self._send_batch(user_token, requests)
+        except Exception as e:
+            for future, _ in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        responses = {child.get('id'): child for child in data.get('responses', [])}
+        for index, (future, request) in enumerate(entries):
+            if future.done():
+                continue
+            child = responses.get(str(index))
+            if child is None:
+                future.set_exception(GraphRequestError(502, request['id']))
+            else:
+                future.set_result(child)
+
 class MicrosoftIntegration(BaseIntegration):
     """
     Microsoft 365 Integration
     Supports: Teams, SharePoint, Outlook, OneDrive, Power BI, Azure AD
     """
     
+    # Immutable status parts, built once per class
+    _SERVICES: ClassVar[Tuple[str, ...]] = ('teams', 'sharepoint', 'outlook', 'onedrive', 'calendar', 'contacts', 'powerbi', 'azure_ad')
+    _CAPABILITIES: ClassVar[Tuple[str, ...]] = (
+        'Teams messaging search',
+        'SharePoint document search',
+        'Outlook email search',
+        'OneDrive file search',
+        'Calendar events',
+        'Azure AD integration',
+        'Real-time notifications'
+    )
+    _USER_SCOPES: ClassVar[Tuple[str, ...]] = (
+        "https://graph.microsoft.com/User.Read",
+        "https://graph.microsoft.com/Mail.Read",
+        "https://graph.microsoft.com/Files.Read",
+        "https://graph.microsoft.com/Team.ReadBasic.All",
+        "https://graph.microsoft.com/Sites.Read.All",
+        "https://graph.microsoft.com/Calendars.Read"
+    )
+    _STATUS_BASE: ClassVar[Mapping[str, Any]] = MappingProxyType({
+        'provider': 'Microsoft 365',
+        'services': dict.fromkeys(_SERVICES, True),
+        'auth_method': 'OAuth2 + MSAL',
+        'capabilities': _CAPABILITIES
+    })
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.client_id = config.get('client_id')
@@ -37,16 +182,55 @@ class MicrosoftIntegration(BaseIntegration):
         self.msal_app = None
         self.graph_client = None
         
-        # Supported services
-        self.services = {
-            'teams': True,
-            'sharepoint': True,
-            'outlook': True,
-            'onedrive': True,
-            'calendar': True,
-            'contacts': True,
-            'powerbi': True,
-            'azure_ad': True
+        # App-only (client credentials) token: (access_token, refresh_at epoch)
+        self._app_token: Optional[Tuple[str, float]] = None
+        self._app_token_lock = asyncio.Lock()
+        self.token_cache_path = config.get('token_cache_path')
+        self._token_cache = SerializableTokenCache()
+        if self.token_cache_path and os.path.exists(self.token_cache_path):
+            with open(self.token_cache_path, 'r') as cache_file:
+                self._token_cache.deserialize(cache_file.read())
+        
+        # Authorization URLs by user_id
+        self._auth_url_cache: Dict[str, str] = {}
+        self._auth_url_cache_size = config.get('auth_url_cache_size', 1024)
+        
+        # Short-lived Graph response cache
+        self.cache = CacheManager()
+        search_ttl = config.get('search_cache_ttl', 45)  # seconds
+        self._cache_ttls = {
+            'teams': search_ttl,
+            'sharepoint': search_ttl,
+            'outlook': search_ttl,
+            'onedrive': search_ttl,
+            'calendar': config.get('calendar_cache_ttl', 120)
+        }
+        
+        # Cap on concurrent in-flight Graph requests across all users
+        self._graph_sem = asyncio.Semaphore(config.get('max_inflight_requests', 32))
+        
+        # OneDrive download URLs are opt-in; they dominate the response size
+        self._onedrive_search_suffix = (
+            ONEDRIVE_SEARCH_SUFFIX_WITH_DOWNLOAD if config.get('onedrive_download_urls', False)
+            else ONEDRIVE_SEARCH_SUFFIX
+        )
+        
+        # In-flight service fetches by cache key
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Coalesce concurrent Graph requests into $batch POSTs
+        self._batcher = GraphBatcher(
+            self._post_batch,
+            window=config.get('batch_window_ms', 10) / 1000
+        )
+        
+        # Response parsers by Graph request id
+        self._parsers = {
+            'teams': self._parse_teams,
+            'sharepoint': self._parse_sharepoint,
+            'outlook': self._parse_outlook,
+            'onedrive': self._parse_onedrive,
+            'calendar': self._parse_calendar
         }
         
         self._initialize_clients()
@@ -58,7 +242,8 @@ class MicrosoftIntegration(BaseIntegration):
             self.msal_app = ConfidentialClientApplication(
                 client_id=self.client_id,
                 client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
+                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                token_cache=self._token_cache
             )
             
             # Microsoft Graph client
@@ -70,7 +255,7 @@ class MicrosoftIntegration(BaseIntegration):
             
             self.graph_client = GraphServiceClient(
                 credentials=credential,
-                scopes=['https://graph.microsoft.com/.default']
+                scopes=GRAPH_DEFAULT_SCOPE
             )
             
             logger.info("📊 Microsoft 365 integration initialized")
@@ -78,22 +263,68 @@ class MicrosoftIntegration(BaseIntegration):
         except Exception as e:
             logger.error(f"Failed to initialize Microsoft clients: {e}")
     
+    async def _get_app_token(self) -> Optional[str]:
+        """Get app-only Graph token, acquiring it only when missing or near expiry"""
+        if self._app_token and time.time() < self._app_token[1]:
+            return self._app_token[0]
+        
+        async with self._app_token_lock:
+            if self._app_token and time.time() < self._app_token[1]:
+                return self._app_token[0]
+            
+            # MSAL is synchronous and may hit the network on a cache miss
+            result = await asyncio.to_thread(
+                self.msal_app.acquire_token_for_client, scopes=GRAPH_DEFAULT_SCOPE
+            )
+            if 'access_token' not in result:
+                logger.error(f"Microsoft app token acquisition failed: {result.get('error_description', result.get('error'))}")
+                return None
+            
+            self._app_token = (result['access_token'], time.time() + result.get('expires_in', 3600) - 60)
+            self._persist_token_cache()
+            
+            return self._app_token[0]
+    
+    def _persist_token_cache(self):
+        """Write MSAL token cache to disk so restarts reuse tokens"""
+        if self.token_cache_path and self._token_cache.has_state_changed:
+            try:
+                with open(self.token_cache_path, 'w') as cache_file:
+                    cache_file.write(self._token_cache.serialize())
+            except OSError as e:
+                logger.warning(f"Failed to persist Microsoft token cache: {e}")
+    
+    async def test_connection(self) -> Dict[str, Any]:
+        """Test connection by acquiring an app-only Graph token"""
+        try:
+            token = await self._get_app_token()
+            return {
+                'status': 'connected' if token else 'error',
+                'message': f'{self.name} integration is active' if token else 'Failed to acquire Graph token',
+                'timestamp': datetime.utcnow().isoformat()
+            }
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'timestamp': datetime.utcnow().isoformat()
+            }
+    
     async def authenticate(self, user_id: str) -> Dict[str, Any]:
         """Authenticate user with Microsoft 365"""
         try:
-            # Get authorization URL
-            auth_url = self.msal_app.get_authorization_request_url(
-                scopes=[
-                    "https://graph.microsoft.com/User.Read",
-                    "https://graph.microsoft.com/Mail.Read",
-                    "https://graph.microsoft.com/Files.Read",
-                    "https://graph.microsoft.com/Team.ReadBasic.All",
-                    "https://graph.microsoft.com/Sites.Read.All",
-                    "https://graph.microsoft.com/Calendars.Read"
-                ],
-                redirect_uri=self.redirect_uri,
-                state=user_id
-            )
+            # Authorization URL depends only on user_id (state), so build it once per user
+            auth_url = self._auth_url_cache.get(user_id)
+            if auth_url is None:
+                auth_url = self.msal_app.get_authorization_request_url(
+                    scopes=self._USER_SCOPES,
+                    redirect_uri=self.redirect_uri,
+                    state=user_id
+                )
+                if len(self._auth_url_cache) >= self._auth_url_cache_size:
+                    # Evict the oldest entry
+                    self._auth_url_cache.pop(next(iter(self._auth_url_cache)))
+                self._auth_url_cache[user_id] = auth_url
             
             return {
                 "auth_url": auth_url,
@@ -105,269 +336,358 @@ class MicrosoftIntegration(BaseIntegration):
             logger.error(f"Microsoft authentication failed: {e}")
             return {"error": str(e), "status": "failed"}
     
-    async def search_teams(self, query: str, user_token: str) -> List[Dict[str, Any]]:
-        """Search Microsoft Teams messages and files"""
-        try:
-            headers = {
-                'Authorization': f'Bearer {user_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Search Teams messages
-            search_payload = {
+    # Graph request builders - each returns a $batch-style request entry so the
+    # same definition serves both standalone calls and batched search_all
+    
+    @staticmethod
+    def _search_query_request(request_id: str, entity_types: Tuple[str, ...], query: str) -> Dict[str, Any]:
+        """Build Microsoft Search API request entry; only the query part is allocated per call"""
+        return {
+            "id": request_id,
+            "method": "POST",
+            "url": "/search/query",
+            "headers": SEARCH_REQUEST_HEADERS,
+            "body": {
                 "requests": [{
-                    "entityTypes": ["message"],
+                    "entityTypes": entity_types,
                     "query": {
                         "queryString": query
                     },
+                    "fields": SEARCH_HIT_FIELDS,
                     "from": 0,
                     "size": 25
                 }]
             }
+        }
+    
+    def _teams_request(self, query: str) -> Dict[str, Any]:
+        """Build Teams message search request"""
+        return self._search_query_request("teams", TEAMS_ENTITY_TYPES, query)
+    
+    def _sharepoint_request(self, query: str) -> Dict[str, Any]:
+        """Build SharePoint site/document search request"""
+        return self._search_query_request("sharepoint", SHAREPOINT_ENTITY_TYPES, query)
+    
+    def _outlook_request(self, query: str) -> Dict[str, Any]:
+        """Build Outlook message search request"""
+        return {
+            "id": "outlook",
+            "method": "GET",
+            # Escape embedded double quotes for KQL, then percent-encode everything
+            "url": OUTLOOK_SEARCH_PREFIX + quote(query.replace('"', '\\"'), safe='') + OUTLOOK_SEARCH_SUFFIX
+        }
+    
+    def _onedrive_request(self, query: str) -> Dict[str, Any]:
+        """Build OneDrive file search request"""
+        return {
+            "id": "onedrive",
+            "method": "GET",
+            # OData string literals escape single quotes by doubling them
+            "url": ONEDRIVE_SEARCH_PREFIX + quote(query.replace("'", "''"), safe='') + self._onedrive_search_suffix
+        }
+    
+    def _calendar_request(self, days_ahead: int = 7) -> Dict[str, Any]:
+        """Build calendar view request for the next N days"""
+        # Get events for next N days, both bounds from a single clock read
+        now = datetime.now(timezone.utc)
+        start_time = now.strftime(GRAPH_DATETIME_FORMAT)
+        end_time = (now + timedelta(days=days_ahead)).strftime(GRAPH_DATETIME_FORMAT)
+        
+        return {
+            "id": "calendar",
+            "method": "GET",
+            "url": f"/me/calendarview?startDateTime={start_time}&endDateTime={end_time}&$top=50&$select={CALENDAR_SELECT}"
+        }
+    
+    # Graph response parsers
+    
+    @staticmethod
+    def _iter_search_hits(data: Dict[str, Any]):
+        """Yield hits from Microsoft Search API response"""
+        for search_response in data.get('value', ()):
+            for container in search_response.get('hitsContainers', ()):
+                yield from container.get('hits', ())
+    
+    def _parse_teams(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape Teams search hits into results"""
+        return [
+            {
+                'id': hit.get('hitId'),
+                'title': hit.get('summary', 'Teams Message'),
+                'content': hit.get('summary'),
+                'source': 'Microsoft Teams',
+                'type': 'teams_message',
+                'created_time': hit.get('lastModifiedTime'),
+                'url': hit.get('webUrl')
+            }
+            for hit in self._iter_search_hits(data)
+        ]
+    
+    def _parse_sharepoint(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape SharePoint search hits into results"""
+        return [
+            {
+                'id': hit.get('hitId'),
+                'title': hit.get('summary', 'SharePoint Item'),
+                'content': hit.get('summary'),
+                'source': 'SharePoint',
+                'type': 'sharepoint_document',
+                'created_time': hit.get('createdDateTime'),
+                'modified_time': hit.get('lastModifiedDateTime'),
+                'url': hit.get('webUrl')
+            }
+            for hit in self._iter_search_hits(data)
+        ]
+    
+    def _parse_outlook(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape Outlook messages into results"""
+        return [
+            {
+                'id': email.get('id'),
+                'title': email.get('subject', 'No Subject'),
+                'content': email.get('bodyPreview', ''),
+                'source': 'Outlook',
+                'type': 'email',
+                'sender': email.get('from', _EMPTY).get('emailAddress', _EMPTY).get('address'),
+                'created_time': email.get('receivedDateTime'),
+                'importance': email.get('importance'),
+                'has_attachments': email.get('hasAttachments', False)
+            }
+            for email in data.get('value', ())
+        ]
+    
+    def _parse_onedrive(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape OneDrive drive items into results"""
+        return [
+            {
+                'id': file.get('id'),
+                'title': file.get('name'),
+                'content': file.get('name'),  # File name as content preview
+                'source': 'OneDrive',
+                'type': 'file',
+                'file_type': file.get('file', _EMPTY).get('mimeType'),
+                'size': file.get('size'),
+                'created_time': file.get('createdDateTime'),
+                'modified_time': file.get('lastModifiedDateTime'),
+                'url': file.get('webUrl'),
+                'download_url': file.get(ONEDRIVE_DOWNLOAD_URL_FIELD)
+            }
+            for file in data.get('value', ())
+        ]
+    
+    def _parse_calendar(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape calendar view events into results"""
+        return [
+            {
+                'id': event.get('id'),
+                'title': event.get('subject'),
+                'content': event.get('body', _EMPTY).get('content', ''),
+                'source': 'Outlook Calendar',
+                'type': 'calendar_event',
+                'start_time': event.get('start', _EMPTY).get('dateTime'),
+                'end_time': event.get('end', _EMPTY).get('dateTime'),
+                'location': event.get('location', _EMPTY).get('displayName'),
+                'organizer': event.get('organizer', _EMPTY).get('emailAddress', _EMPTY).get('address'),
+                'attendees_count': len(event.get('attendees', ())),
+                'importance': event.get('importance'),
+                'url': event.get('webLink')
+            }
+            for event in data.get('value', ())
+        ]
+    
+    @staticmethod
+    def _retry_after_delay(retry_after: Optional[str], attempt: int) -> float:
+        """Delay before the next attempt: Retry-After (seconds or HTTP-date) or exponential backoff"""
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+        
+        if delay is None:
+            delay = 2 ** attempt
+        
+        return min(max(delay, 0), GRAPH_MAX_RETRY_DELAY) + random.uniform(0, 0.5)
+    
+    async def _graph_request(self, method: str, url: str, *, headers: Dict[str, str],
+                             body: Any = None, max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Send Graph request, backing off on 429/5xx per Retry-After
+        Raises aiohttp.ClientResponseError on terminal failures
+        """
+        session = await self._get_session()
+        data = json_dumps(body) if body is not None else None
+        
+        for attempt in range(max_retries + 1):
+            # Hold the slot only for the request itself, not while backing off
+            async with self._graph_sem:
+                async with session.request(method, url, headers=headers, data=data) as response:
+                    if response.status in GRAPH_RETRY_STATUSES and attempt < max_retries:
+                        delay = self._retry_after_delay(response.headers.get('Retry-After'), attempt)
+                        logger.warning(f"Graph returned HTTP {response.status}, retrying in {delay:.1f}s")
+                    else:
+                        response.raise_for_status()
+                        return json_loads(await response.read())
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://graph.microsoft.com/v1.0/search/query',
-                    headers=headers,
-                    json=search_payload
-                ) as response:
-                    data = await response.json()
-                    
-                    results = []
-                    if 'value' in data:
-                        for search_response in data['value']:
-                            if 'hitsContainers' in search_response:
-                                for container in search_response['hitsContainers']:
-                                    for hit in container.get('hits', []):
-                                        results.append({
-                                            'id': hit.get('hitId'),
-                                            'title': hit.get('summary', 'Teams Message'),
-                                            'content': hit.get('summary'),
-                                            'source': 'Microsoft Teams',
-                                            'type': 'teams_message',
-                                            'created_time': hit.get('lastModifiedTime'),
-                                            'url': hit.get('webUrl')
-                                        })
-                    
-                    return results
-                    
-        except Exception as e:
+            await asyncio.sleep(delay)
+    
+    async def _post_batch(self, user_token: str, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """POST a list of request entries to the Graph $batch endpoint"""
+        headers = {
+            'Authorization': f'Bearer {user_token}',
+            'Content-Type': 'application/json'
+        }
+        
+        return await self._graph_request(
+            'POST',
+            f'{GRAPH_API_URL}/$batch',
+            headers=headers,
+            body={"requests": requests}
+        )
+    
+    async def _send_graph_request(self, request: Dict[str, Any], user_token: str,
+                                  max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Send a single Graph request entry through the batcher and return the decoded body
+        Throttled sub-requests are resubmitted per their own Retry-After
+        """
+        for attempt in range(max_retries + 1):
+            child = await self._batcher.submit(request, user_token)
+            status = child.get('status', 0)
+            
+            if status in GRAPH_RETRY_STATUSES and attempt < max_retries:
+                delay = self._retry_after_delay((child.get('headers') or _EMPTY).get('Retry-After'), attempt)
+                logger.warning(f"Graph {request['id']} returned HTTP {status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            
+            if not 200 <= status < 300:
+                raise GraphRequestError(status, request['id'])
+            
+            return child.get('body') or {}
+    
+    def _cache_key(self, service: str, user_token: str, query: str = '') -> str:
+        """Build response cache key without storing the raw token"""
+        digest = hashlib.blake2b(f"{service}|{user_token}|{query}".encode('utf-8'), digest_size=16).hexdigest()
+        return f"microsoft:{service}:{digest}"
+    
+    async def _fetch_service(self, request: Dict[str, Any], user_token: str, cache_key: str) -> List[Dict[str, Any]]:
+        """Read-through cached fetch of a single service; identical concurrent misses share one request"""
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # cache_key covers the user token, so callers only share results they could fetch themselves
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_uncached(request, user_token, cache_key))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        
+        # Shield so one caller's cancellation doesn't fail the others
+        return await asyncio.shield(task)
+    
+    async def _fetch_uncached(self, request: Dict[str, Any], user_token: str, cache_key: str) -> List[Dict[str, Any]]:
+        """Fetch, parse and cache a single service"""
+        service = request['id']
+        data = await self._send_graph_request(request, user_token)
+        results = self._parsers[service](data)
+        await self.cache.set(cache_key, results, ttl=self._cache_ttls[service])
+        
+        return results
+    
+    async def search_teams(self, query: str, user_token: str) -> List[Dict[str, Any]]:
+        """Search Microsoft Teams messages and files"""
+        try:
+            return await self._fetch_service(
+                self._teams_request(query), user_token, self._cache_key('teams', user_token, query)
+            )
+        except GRAPH_REQUEST_ERRORS as e:
             logger.error(f"Teams search failed: {e}")
             return []
     
     async def search_sharepoint(self, query: str, user_token: str) -> List[Dict[str, Any]]:
         """Search SharePoint sites and documents"""
         try:
-            headers = {
-                'Authorization': f'Bearer {user_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Search SharePoint
-            search_payload = {
-                "requests": [{
-                    "entityTypes": ["site", "driveItem"],
-                    "query": {
-                        "queryString": query
-                    },
-                    "from": 0,
-                    "size": 25
-                }]
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://graph.microsoft.com/v1.0/search/query',
-                    headers=headers,
-                    json=search_payload
-                ) as response:
-                    data = await response.json()
-                    
-                    results = []
-                    if 'value' in data:
-                        for search_response in data['value']:
-                            if 'hitsContainers' in search_response:
-                                for container in search_response['hitsContainers']:
-                                    for hit in container.get('hits', []):
-                                        results.append({
-                                            'id': hit.get('hitId'),
-                                            'title': hit.get('summary', 'SharePoint Item'),
-                                            'content': hit.get('summary'),
-                                            'source': 'SharePoint',
-                                            'type': 'sharepoint_document',
-                                            'created_time': hit.get('createdDateTime'),
-                                            'modified_time': hit.get('lastModifiedDateTime'),
-                                            'url': hit.get('webUrl')
-                                        })
-                    
-                    return results
-                    
-        except Exception as e:
+            return await self._fetch_service(
+                self._sharepoint_request(query), user_token, self._cache_key('sharepoint', user_token, query)
+            )
+        except GRAPH_REQUEST_ERRORS as e:
             logger.error(f"SharePoint search failed: {e}")
             return []
     
     async def search_outlook(self, query: str, user_token: str) -> List[Dict[str, Any]]:
         """Search Outlook emails"""
         try:
-            headers = {
-                'Authorization': f'Bearer {user_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Search Outlook emails
-            search_url = f"https://graph.microsoft.com/v1.0/me/messages?$search=\"{query}\"&$top=25"
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(search_url, headers=headers) as response:
-                    data = await response.json()
-                    
-                    results = []
-                    if 'value' in data:
-                        for email in data['value']:
-                            results.append({
-                                'id': email.get('id'),
-                                'title': email.get('subject', 'No Subject'),
-                                'content': email.get('bodyPreview', ''),
-                                'source': 'Outlook',
-                                'type': 'email',
-                                'sender': email.get('from', {}).get('emailAddress', {}).get('address'),
-                                'created_time': email.get('receivedDateTime'),
-                                'importance': email.get('importance'),
-                                'has_attachments': email.get('hasAttachments', False)
-                            })
-                    
-                    return results
-                    
-        except Exception as e:
+            return await self._fetch_service(
+                self._outlook_request(query), user_token, self._cache_key('outlook', user_token, query)
+            )
+        except GRAPH_REQUEST_ERRORS as e:
             logger.error(f"Outlook search failed: {e}")
             return []
     
     async def search_onedrive(self, query: str, user_token: str) -> List[Dict[str, Any]]:
         """Search OneDrive files"""
         try:
-            headers = {
-                'Authorization': f'Bearer {user_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Search OneDrive
-            search_url = f"https://graph.microsoft.com/v1.0/me/drive/root/search(q='{query}')?$top=25"
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(search_url, headers=headers) as response:
-                    data = await response.json()
-                    
-                    results = []
-                    if 'value' in data:
-                        for file in data['value']:
-                            results.append({
-                                'id': file.get('id'),
-                                'title': file.get('name'),
-                                'content': file.get('name'),  # File name as content preview
-                                'source': 'OneDrive',
-                                'type': 'file',
-                                'file_type': file.get('file', {}).get('mimeType'),
-                                'size': file.get('size'),
-                                'created_time': file.get('createdDateTime'),
-                                'modified_time': file.get('lastModifiedDateTime'),
-                                'url': file.get('webUrl'),
-                                'download_url': file.get('@microsoft.graph.downloadUrl')
-                            })
-                    
-                    return results
-                    
-        except Exception as e:
+            return await self._fetch_service(
+                self._onedrive_request(query), user_token, self._cache_key('onedrive', user_token, query)
+            )
+        except GRAPH_REQUEST_ERRORS as e:
             logger.error(f"OneDrive search failed: {e}")
             return []
     
     async def get_calendar_events(self, user_token: str, days_ahead: int = 7) -> List[Dict[str, Any]]:
         """Get upcoming calendar events"""
         try:
-            headers = {
-                'Authorization': f'Bearer {user_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Get events for next N days
-            start_time = datetime.utcnow().isoformat() + 'Z'
-            end_time = (datetime.utcnow() + timedelta(days=days_ahead)).isoformat() + 'Z'
-            
-            calendar_url = (
-                f"https://graph.microsoft.com/v1.0/me/calendarview?"
-                f"startDateTime={start_time}&endDateTime={end_time}&$top=50"
+            return await self._fetch_service(
+                self._calendar_request(days_ahead), user_token, self._cache_key('calendar', user_token, str(days_ahead))
             )
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(calendar_url, headers=headers) as response:
-                    data = await response.json()
-                    
-                    events = []
-                    if 'value' in data:
-                        for event in data['value']:
-                            events.append({
-                                'id': event.get('id'),
-                                'title': event.get('subject'),
-                                'content': event.get('body', {}).get('content', ''),
-                                'source': 'Outlook Calendar',
-                                'type': 'calendar_event',
-                                'start_time': event.get('start', {}).get('dateTime'),
-                                'end_time': event.get('end', {}).get('dateTime'),
-                                'location': event.get('location', {}).get('displayName'),
-                                'organizer': event.get('organizer', {}).get('emailAddress', {}).get('address'),
-                                'attendees_count': len(event.get('attendees', [])),
-                                'importance': event.get('importance'),
-                                'url': event.get('webLink')
-                            })
-                    
-                    return events
-                    
-        except Exception as e:
+        except GRAPH_REQUEST_ERRORS as e:
             logger.error(f"Calendar events retrieval failed: {e}")
             return []
     
     async def search_all(self, query: str, user_token: str) -> Dict[str, List[Dict[str, Any]]]:
-        """Search across all Microsoft 365 services"""
+        """Search across all Microsoft 365 services; cache misses coalesce into one Graph $batch"""
         try:
-            # Run searches concurrently
-            tasks = [
-                self.search_teams(query, user_token),
-                self.search_sharepoint(query, user_token), 
-                self.search_outlook(query, user_token),
-                self.search_onedrive(query, user_token)
-            ]
+            query_lower = query.lower()
+            requests = {
+                'teams': self._teams_request(query),
+                'sharepoint': self._sharepoint_request(query),
+                'outlook': self._outlook_request(query),
+                'onedrive': self._onedrive_request(query)
+            }
+            cache_keys = {service: self._cache_key(service, user_token, query) for service in requests}
+            if 'meeting' in query_lower or 'calendar' in query_lower:
+                requests['calendar'] = self._calendar_request()
+                cache_keys['calendar'] = self._cache_key('calendar', user_token, '7')
             
-            teams_results, sharepoint_results, outlook_results, onedrive_results = await asyncio.gather(*tasks)
+            fetched = await run_concurrently({
+                service: self._fetch_service(request, user_token, cache_keys[service])
+                for service, request in requests.items()
+            })
             
-            return {
-                'teams': teams_results,
-                'sharepoint': sharepoint_results,
-                'outlook': outlook_results,
-                'onedrive': onedrive_results,
-                'calendar': await self.get_calendar_events(user_token) if 'meeting' in query.lower() or 'calendar' in query.lower() else []
-            }
+            results = {service: [] for service in self._parsers}
+            for service, outcome in fetched.items():
+                if isinstance(outcome, Exception):
+                    logger.error(f"Microsoft {service} search failed: {outcome}")
+                else:
+                    results[service] = outcome
+            
+            return results
             
         except Exception as e:
             logger.error(f"Microsoft 365 search failed: {e}")
             return {}
     
-    def get_supported_services(self) -> List[str]:
+    def get_supported_services(self) -> Tuple[str, ...]:
         """Get list of supported Microsoft services"""
-        return list(self.services.keys())
+        return self._SERVICES
     
     def get_integration_status(self) -> Dict[str, Any]:
         """Get Microsoft integration status"""
-        return {
-            'provider': 'Microsoft 365',
-            'status': 'active' if self.msal_app and self.graph_client else 'inactive',
-            'services': self.services,
-            'auth_method': 'OAuth2 + MSAL',
-            'capabilities': [
-                'Teams messaging search',
-                'SharePoint document search', 
-                'Outlook email search',
-                'OneDrive file search',
-                'Calendar events',
-                'Azure AD integration',
-                'Real-time notifications'
-            ]
-        }
\ No newline at end of file
+        return {**self._STATUS_BASE, 'status': 'active' if self.msal_app and self.graph_client else 'inactive'}
\ No newline at end of file
@@ -5,55 +5,140 @@ Integration with Notion pages, databases, and blocks
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
+from typing import ClassVar, Dict, List, Mapping, Optional, Any, Tuple
 from datetime import datetime
-import json
+from types import MappingProxyType
 
 import aiohttp
-from notion_client import Client as NotionClient
-from notion_client.errors import APIErrorCode, APIResponseError
 
-from .base_integration import BaseIntegration
+from .base_integration import BaseIntegration, json_loads, json_dumps
+from ..utils.cache import CacheManager
 
 logger = logging.getLogger(__name__)
 
+NOTION_API_URL = 'https://api.notion.com'
+NOTION_VERSION = '2022-06-28'
+
+# Failures that mean "Notion returned nothing usable"; anything else is a bug and propagates
+NOTION_REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+def _plain_text(rich_text: Optional[List[Dict[str, Any]]]) -> str:
+    """Concatenate plain_text of a Notion rich text array"""
+    return ''.join(t.get('plain_text', '') for t in rich_text or ())
+
+def _select_text(prop_data: Dict[str, Any]) -> str:
+    select_data = prop_data.get('select')
+    return select_data.get('name', '') if select_data else ''
+
+# Property type -> preview text extractor for database entries
+_PROPERTY_TEXT_HANDLERS = {
+    'rich_text': lambda prop_data: _plain_text(prop_data.get('rich_text')),
+    'select': _select_text
+}
+
 class NotionIntegration(BaseIntegration):
     """
     Notion Workspace Integration
     Supports: Pages, Databases, Blocks, Comments
     """
     
+    # Immutable status parts, built once per class
+    _SERVICES: ClassVar[Tuple[str, ...]] = ('pages', 'databases', 'blocks', 'comments')
+    _CAPABILITIES: ClassVar[Tuple[str, ...]] = (
+        'Page content search',
+        'Database search and queries',
+        'Block-level content access',
+        'Comment integration',
+        'Real-time synchronization',
+        'Workspace management'
+    )
+    _STATUS_BASE: ClassVar[Mapping[str, Any]] = MappingProxyType({
+        'provider': 'Notion Workspace',
+        'services': dict.fromkeys(_SERVICES, True),
+        'auth_method': 'OAuth2 + Integration Token',
+        'capabilities': _CAPABILITIES
+    })
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.integration_token = config.get('integration_token')
         
-        # Notion client
-        self.notion_client = None
-        
-        # Supported services
-        self.services = {
-            'pages': True,
-            'databases': True,
-            'blocks': True,
-            'comments': True
-        }
+        # Database schema cache (title property names)
+        self.cache = CacheManager()
+        self.schema_cache_ttl = config.get('schema_cache_ttl', 3600)  # seconds
         
         self._initialize_client()
     
     def _initialize_client(self):
         """Initialize Notion client"""
+        if self.integration_token:
+            logger.info("📝 Notion integration initialized")
+        else:
+            logger.warning("Notion integration token not provided")
+    
+    async def _notion_request(self, method: str, path: str, token: str,
+                              json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Call the Notion REST API over the shared session"""
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Notion-Version': NOTION_VERSION,
+            'Content-Type': 'application/json'
+        }
+        
+        data = json_dumps(json_body) if json_body is not None else None
+        
+        session = await self._get_session()
+        async with session.request(method, f"{NOTION_API_URL}{path}", headers=headers, data=data) as response:
+            response.raise_for_status()
+            return json_loads(await response.read())
+    
+    async def _notion_post(self, path: str, json_body: Dict[str, Any], token: str) -> Dict[str, Any]:
+        """POST to the Notion REST API"""
+        return await self._notion_request('POST', path, token, json_body)
+    
+    async def _notion_get(self, path: str, token: str) -> Dict[str, Any]:
+        """GET from the Notion REST API"""
+        return await self._notion_request('GET', path, token)
+    
+    async def _get_title_property(self, database_id: str, token: str) -> Optional[str]:
+        """Get name of a database's title property (schema cached)"""
+        cache_key = f"notion:title_property:{database_id}"
+        title_property = await self.cache.get(cache_key)
+        if title_property:
+            return title_property
+        
+        database = await self._notion_get(f'/v1/databases/{database_id}', token)
+        for prop_name, prop_data in database.get('properties', {}).items():
+            if prop_data.get('type') == 'title':
+                await self.cache.set(cache_key, prop_name, ttl=self.schema_cache_ttl)
+                return prop_name
+        
+        return None
+    
+    async def test_connection(self) -> Dict[str, Any]:
+        """Test connection by fetching the integration's bot user"""
         try:
-            if self.integration_token:
-                self.notion_client = NotionClient(auth=self.integration_token)
-                
-                # Test connection by getting current user
-                user_info = self.notion_client.users.me()
-                logger.info(f"📝 Notion integration initialized for user: {user_info.get('name', 'Unknown')}")
-            else:
-                logger.warning("Notion integration token not provided")
-                
+            if not self.integration_token:
+                return {
+                    'status': 'error',
+                    'message': 'Notion integration token not provided',
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            
+            user_info = await self._notion_get('/v1/users/me', self.integration_token)
+            
+            return {
+                'status': 'connected',
+                'message': f"Notion integration active for user: {user_info.get('name', 'Unknown')}",
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            
         except Exception as e:
-            logger.error(f"Failed to initialize Notion client: {e}")
+            return {
+                'status': 'error',
+                'message': str(e),
+                'timestamp': datetime.utcnow().isoformat()
+            }
     
     async def authenticate(self, user_id: str) -> Dict[str, Any]:
         """Authenticate user with Notion"""
@@ -81,16 +166,16 @@ class NotionIntegration(BaseIntegration):
     async def search_pages(self, query: str, user_token: str = None) -> List[Dict[str, Any]]:
         """Search Notion pages"""
         try:
-            client = NotionClient(auth=user_token) if user_token else self.notion_client
-            if not client:
+            token = user_token or self.integration_token
+            if not token:
                 return []
             
             # Search pages
-            response = client.search(
-                query=query,
-                filter={'property': 'object', 'value': 'page'},
-                page_size=25
-            )
+            response = await self._notion_post('/v1/search', {
+                'query': query,
+                'filter': {'property': 'object', 'value': 'page'},
+                'page_size': 25
+            }, token)
             
             results = []
             for page in response.get('results', []):
@@ -111,26 +196,23 @@ class NotionIntegration(BaseIntegration):
             
             return results
             
-        except APIResponseError as e:
-            logger.error(f"Notion pages search failed: {e}")
-            return []
-        except Exception as e:
+        except NOTION_REQUEST_ERRORS as e:
             logger.error(f"Notion pages search failed: {e}")
             return []
     
     async def search_databases(self, query: str, user_token: str = None) -> List[Dict[str, Any]]:
         """Search Notion databases"""
         try:
-            client = NotionClient(auth=user_token) if user_token else self.notion_client
-            if not client:
+            token = user_token or self.integration_token
+            if not token:
                 return []
             
             # Search databases
-            response = client.search(
-                query=query,
-                filter={'property': 'object', 'value': 'database'},
-                page_size=25
-            )
+            response = await self._notion_post('/v1/search', {
+                'query': query,
+                'filter': {'property': 'object', 'value': 'database'},
+                'page_size': 25
+            }, token)
             
             results = []
             for database in response.get('results', []):
@@ -151,70 +233,66 @@ class NotionIntegration(BaseIntegration):
             
             return results
             
-        except APIResponseError as e:
-            logger.error(f"Notion databases search failed: {e}")
-            return []
-        except Exception as e:
+        except NOTION_REQUEST_ERRORS as e:
             logger.error(f"Notion databases search failed: {e}")
             return []
     
     async def search_database_entries(self, database_id: str, query: str, user_token: str = None) -> List[Dict[str, Any]]:
         """Search entries in a specific Notion database"""
         try:
-            client = NotionClient(auth=user_token) if user_token else self.notion_client
-            if not client:
+            token = user_token or self.integration_token
+            if not token:
+                return []
+            
+            title_property = await self._get_title_property(database_id, token)
+            if not title_property:
                 return []
             
-            # Query database
-            response = client.databases.query(
-                database_id=database_id,
-                page_size=25
+            # Query database, letting Notion match the title server-side
+            response = await self._notion_post(
+                f'/v1/databases/{database_id}/query',
+                {
+                    'filter': {'property': title_property, 'title': {'contains': query}},
+                    'page_size': 25
+                },
+                token
             )
             
             results = []
             for entry in response.get('results', []):
                 title = self._extract_page_title(entry)
                 
-                # Simple text matching for query
-                if query.lower() in title.lower():
-                    results.append({
-                        'id': entry['id'],
-                        'title': title,
-                        'content': self._extract_entry_content(entry),
-                        'source': 'Notion Database Entry',
-                        'type': 'database_entry',
-                        'url': entry.get('url'),
-                        'created_time': entry.get('created_time'),
-                        'updated_time': entry.get('last_edited_time'),
-                        'database_id': database_id
-                    })
+                results.append({
+                    'id': entry['id'],
+                    'title': title,
+                    'content': self._extract_entry_content(entry),
+                    'source': 'Notion Database Entry',
+                    'type': 'database_entry',
+                    'url': entry.get('url'),
+                    'created_time': entry.get('created_time'),
+                    'updated_time': entry.get('last_edited_time'),
+                    'database_id': database_id
+                })
             
             return results
             
-        except APIResponseError as e:
-            logger.error(f"Notion database entries search failed: {e}")
-            return []
-        except Exception as e:
+        except NOTION_REQUEST_ERRORS as e:
             logger.error(f"Notion database entries search failed: {e}")
             return []
     
     def _extract_page_title(self, page: Dict[str, Any]) -> str:
         """Extract title from Notion page"""
         try:
-            properties = page.get('properties', {})
-            
-            # Look for title property
-            for prop_name, prop_data in properties.items():
+            # Stop at the first title property
+            for prop_data in (page.get('properties') or {}).values():
                 if prop_data.get('type') == 'title':
-                    title_array = prop_data.get('title', [])
-                    if title_array:
-                        return ''.join([t.get('plain_text', '') for t in title_array])
+                    title = _plain_text(prop_data.get('title'))
+                    if title:
+                        return title
+                    break
             
             # Fallback to page title if available
-            if 'title' in page:
-                return ''.join([t.get('plain_text', '') for t in page['title']])
-            
-            return 'Untitled Page'
+            return _plain_text(page.get('title')) or 'Untitled Page'
             
         except Exception as e:
             logger.error(f"Failed to extract page title: {e}")
@@ -223,10 +301,7 @@ class NotionIntegration(BaseIntegration):
     def _extract_database_title(self, database: Dict[str, Any]) -> str:
         """Extract title from Notion database"""
         try:
-            title_array = database.get('title', [])
-            if title_array:
-                return ''.join([t.get('plain_text', '') for t in title_array])
-            return 'Untitled Database'
+            return _plain_text(database.get('title')) or 'Untitled Database'
             
         except Exception as e:
             logger.error(f"Failed to extract database title: {e}")
@@ -235,24 +310,13 @@ class NotionIntegration(BaseIntegration):
     def _extract_entry_content(self, entry: Dict[str, Any]) -> str:
         """Extract content preview from database entry"""
         try:
-            content_parts = []
-            properties = entry.get('properties', {})
-            
-            # Extract text from various property types
-            for prop_name, prop_data in properties.items():
-                prop_type = prop_data.get('type')
-                
-                if prop_type == 'rich_text':
-                    text_array = prop_data.get('rich_text', [])
-                    text = ''.join([t.get('plain_text', '') for t in text_array])
-                    if text:
-                        content_parts.append(f"{prop_name}: {text}")
-                elif prop_type == 'select':
-                    select_data = prop_data.get('select')
-                    if select_data:
-                        content_parts.append(f"{prop_name}: {select_data.get('name', '')}")
-            
-            return '; '.join(content_parts) if content_parts else 'No content preview available'
+            content = '; '.join(
+                f"{prop_name}: {text}"
+                for prop_name, prop_data in (entry.get('properties') or {}).items()
+                if (handler := _PROPERTY_TEXT_HANDLERS.get(prop_data.get('type')))
+                and (text := handler(prop_data))
+            )
+            return content or 'No content preview available'
             
         except Exception as e:
             logger.error(f"Failed to extract entry content: {e}")
@@ -278,23 +342,10 @@ class NotionIntegration(BaseIntegration):
             logger.error(f"Notion search failed: {e}")
             return {}
     
-    def get_supported_services(self) -> List[str]:
+    def get_supported_services(self) -> Tuple[str, ...]:
         """Get list of supported Notion services"""
-        return list(self.services.keys())
+        return self._SERVICES
     
     def get_integration_status(self) -> Dict[str, Any]:
         """Get Notion integration status"""
-        return {
-            'provider': 'Notion Workspace',
-            'status': 'active' if self.notion_client else 'inactive',
-            'services': self.services,
-            'auth_method': 'OAuth2 + Integration Token',
-            'capabilities': [
-                'Page content search',
-                'Database search and queries',
-                'Block-level content access',
-                'Comment integration',
-                'Real-time synchronization',
-                'Workspace management'
-            ]
-        }
\ No newline at end of file
+        return {**self._STATUS_BASE, 'status': 'active' if self.integration_token else 'inactive'}
\ No newline at end of file
@@ -5,18 +5,49 @@ Integration with Slack channels, messages, and files
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
+import hashlib
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Any, Tuple
 from datetime import datetime
-import json
+from urllib.parse import urlencode
 
 import aiohttp
-from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.errors import SlackApiError
 
-from .base_integration import BaseIntegration
+from .base_integration import AsyncTokenBucket, BaseIntegration, run_concurrently
 
 logger = logging.getLogger(__name__)
 
+SLACK_OAUTH_URL = 'https://slack.com/oauth/v2/authorize'
+SLACK_OAUTH_SCOPE = ','.join([
+    'channels:history',
+    'channels:read',
+    'files:read',
+    'groups:history',
+    'groups:read',
+    'im:history',
+    'im:read',
+    'mpim:history',
+    'mpim:read',
+    'search:read',
+    'users:read'
+])
+
+# Slack Web API method -> rate-limit tier, see api.slack.com/docs/rate-limits
+_METHOD_TIERS = {
+    'auth.test': 'tier4',
+    'users.info': 'tier4',
+    'search.messages': 'tier2',
+    'search.files': 'tier2',
+    'conversations.list': 'tier2',
+    'chat.postMessage': 'tier3'
+}
+
+# Queries mentioning these (as substrings) also search channel names/topics
+_CHANNEL_QUERY_RE = re.compile(r'channel|room|group', re.IGNORECASE)
+
 class SlackIntegration(BaseIntegration):
     """
     Slack Workspace Integration
@@ -31,6 +62,36 @@ class SlackIntegration(BaseIntegration):
         # Slack client
         self.slack_client = None
         
+        # Per-tier request budgets (requests per minute). Slack applies them per method and
+        # workspace, so each (token digest, method) pair gets its own bucket, most recently used last
+        self._tier_rates = {
+            'tier2': config.get('tier2_rate_limit', 20),
+            'tier3': config.get('tier3_rate_limit', 50),
+            'tier4': config.get('tier4_rate_limit', 100)
+        }
+        self._rate_limits: Dict[Tuple[str, str], AsyncTokenBucket] = {}
+        self._rate_limit_pool_size = config.get('rate_limit_pool_size', 2048)
+        # Longest a call waits for its rate budget before giving up
+        self._rate_limit_timeout = config.get('rate_limit_timeout', 10)  # seconds
+        
+        # Cap on concurrent Slack API calls from this integration
+        self._api_sem = asyncio.Semaphore(config.get('max_concurrent_requests', 8))
+        
+        # Per-user clients, most recently used last, keyed by token digest
+        self._user_clients: Dict[str, AsyncWebClient] = {}
+        self._user_client_pool_size = config.get('user_client_pool_size', 512)
+        
+        # conversations.list results by token digest: (fetched_at monotonic, channels,
+        # casefolded search text per channel), most recently used last
+        self._channels_cache: Dict[str, Tuple[float, List[Dict[str, Any]], List[str]]] = {}
+        self._channels_ttl = config.get('channels_cache_ttl', 600)  # seconds
+        self._channels_cache_size = config.get('channels_cache_size', 256)
+        
+        # users.info results by user ID: (fetched_at monotonic, user), most recently used last
+        self._user_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._user_ttl = config.get('user_cache_ttl', 3600)  # seconds
+        self._user_cache_size = config.get('user_cache_size', 4096)
+        
         # Supported services
         self.services = {
             'channels': True,
@@ -43,48 +104,118 @@ class SlackIntegration(BaseIntegration):
         self._initialize_client()
     
     def _initialize_client(self):
-        """Initialize Slack client"""
+        """Initialize Slack client (auth is verified asynchronously by test_connection)"""
         try:
             if self.bot_token:
-                self.slack_client = WebClient(token=self.bot_token)
-                
-                # Test connection
-                response = self.slack_client.auth_test()
-                if response['ok']:
-                    logger.info(f"💬 Slack integration initialized for team: {response.get('team')}")
-                else:
-                    logger.error("Slack authentication failed")
+                self.slack_client = AsyncWebClient(token=self.bot_token)
+                logger.info("💬 Slack integration initialized")
             else:
                 logger.warning("Slack bot token not provided")
                 
         except Exception as e:
             logger.error(f"Failed to initialize Slack client: {e}")
     
+    @staticmethod
+    def _token_key(user_token: Optional[str]) -> str:
+        """Cache key for a user token (a digest, so raw tokens are never stored as keys) or the bot"""
+        if not user_token:
+            return '__bot__'
+        return hashlib.blake2b(user_token.encode('utf-8'), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _lru_get(cache: Dict[Any, Any], key: Any) -> Any:
+        """Cached entry for key, marked most recently used"""
+        entry = cache.pop(key, None)
+        if entry is not None:
+            cache[key] = entry
+        return entry
+    
+    @staticmethod
+    def _lru_put(cache: Dict[Any, Any], key: Any, entry: Any, max_size: int):
+        """Store entry as most recently used, evicting the least recently used beyond max_size"""
+        cache.pop(key, None)
+        cache[key] = entry
+        while len(cache) > max_size:
+            cache.pop(next(iter(cache)))
+    
+    def _rate_limiter(self, token: Optional[str], method: str) -> AsyncTokenBucket:
+        """Token bucket for one API method of one token's workspace, created on first use"""
+        key = (self._token_key(token), method)
+        limiter = self._lru_get(self._rate_limits, key)
+        if limiter is None:
+            per_minute = self._tier_rates[_METHOD_TIERS[method]]
+            limiter = AsyncTokenBucket(rate=per_minute / 60, capacity=per_minute)
+            self._lru_put(self._rate_limits, key, limiter, self._rate_limit_pool_size)
+        return limiter
+    
+    async def _api_call(self, client: AsyncWebClient, method: str, call: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """
+        Call a Slack API method within its rate budget and the concurrency cap
+        The budget is awaited (up to rate_limit_timeout) before taking a semaphore slot,
+        so throttled callers don't block calls to other methods or workspaces
+        """
+        await asyncio.wait_for(self._rate_limiter(client.token, method).acquire(), self._rate_limit_timeout)
+        async with self._api_sem:
+            return await call(**kwargs)
+    
+    async def _get_client(self, user_token: Optional[str] = None) -> Optional[AsyncWebClient]:
+        """Get client for the user token (or the bot) on the integration's shared HTTP session"""
+        session = await self._get_session()
+        if user_token:
+            key = self._token_key(user_token)
+            client = self._lru_get(self._user_clients, key)
+            if client is None:
+                client = AsyncWebClient(token=user_token, session=session)
+                self._lru_put(self._user_clients, key, client, self._user_client_pool_size)
+            return client
+        
+        if self.slack_client and self.slack_client.session is None:
+            self.slack_client.session = session
+        return self.slack_client
+    
+    async def test_connection(self) -> Dict[str, Any]:
+        """Test connection by checking the bot token"""
+        try:
+            client = await self._get_client()
+            if not client:
+                return {
+                    'status': 'error',
+                    'message': 'Slack bot token not provided',
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            
+            response = await self._api_call(client, 'auth.test', client.auth_test)
+            if not response['ok']:
+                return {
+                    'status': 'error',
+                    'message': 'Slack authentication failed',
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+            
+            return {
+                'status': 'connected',
+                'message': f"Slack integration active for team: {response.get('team')}",
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'timestamp': datetime.utcnow().isoformat()
+            }
+    
     async def authenticate(self, user_id: str) -> Dict[str, Any]:
         """Authenticate user with Slack"""
         try:
             # Slack OAuth URL
-            scope = [
-                'channels:history',
-                'channels:read',
-                'files:read',
-                'groups:history',
-                'groups:read',
-                'im:history',
-                'im:read',
-                'mpim:history',
-                'mpim:read',
-                'search:read',
-                'users:read'
-            ]
-            
-            auth_url = (
-                f"https://slack.com/oauth/v2/authorize?"
-                f"client_id={self.client_id}&"
-                f"scope={','.join(scope)}&"
-                f"state={user_id}&"
-                f"redirect_uri={self.redirect_uri}"
-            )
+            params = urlencode({
+                'client_id': self.client_id,
+                'scope': SLACK_OAUTH_SCOPE,
+                'state': user_id,
+                'redirect_uri': self.redirect_uri
+            })
+            auth_url = f"{SLACK_OAUTH_URL}?{params}"
             
             return {
                 "auth_url": auth_url,
@@ -96,15 +227,44 @@ class SlackIntegration(BaseIntegration):
             logger.error(f"Slack authentication failed: {e}")
             return {"error": str(e), "status": "failed"}
     
+    async def _resolve_user(self, user_id: str, client: AsyncWebClient) -> Dict[str, Any]:
+        """Get Slack user info, cached by user ID"""
+        cached = self._lru_get(self._user_cache, user_id)
+        if cached and time.monotonic() - cached[0] < self._user_ttl:
+            return cached[1]
+        
+        try:
+            response = await self._api_call(client, 'users.info', client.users_info, user=user_id)
+        except SlackApiError as e:
+            logger.warning(f"Slack user lookup failed for {user_id}: {e.response['error']}")
+            return {}
+        except asyncio.TimeoutError:
+            logger.warning(f"Slack user lookup for {user_id} timed out waiting for rate budget")
+            return {}
+        
+        user = response.get('user') or {}
+        self._lru_put(self._user_cache, user_id, (time.monotonic(), user), self._user_cache_size)
+        return user
+    
+    async def _resolve_user_names(self, user_ids: List[Optional[str]], client: AsyncWebClient) -> Dict[str, Optional[str]]:
+        """Resolve display names for the unique user IDs concurrently"""
+        unique_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+        users = await asyncio.gather(*(self._resolve_user(user_id, client) for user_id in unique_ids))
+        return {
+            user_id: user.get('real_name') or user.get('name')
+            for user_id, user in zip(unique_ids, users)
+        }
+    
     async def search_messages(self, query: str, user_token: str = None) -> List[Dict[str, Any]]:
         """Search Slack messages"""
         try:
-            client = WebClient(token=user_token) if user_token else self.slack_client
+            client = await self._get_client(user_token)
             if not client:
                 return []
             
             # Search messages
-            response = client.search_messages(
+            response = await self._api_call(
+                client, 'search.messages', client.search_messages,
                 query=query,
                 count=25,
                 sort='timestamp',
@@ -113,19 +273,27 @@ class SlackIntegration(BaseIntegration):
             
             results = []
             if response['ok'] and 'messages' in response:
-                for match in response['messages']['matches']:
+                matches = response['messages']['matches']
+                
+                # Look up only authors the search response didn't name
+                user_names = await self._resolve_user_names(
+                    [match.get('user') for match in matches if not match.get('username')], client
+                )
+                
+                for match in matches:
                     message = match
                     channel_info = message.get('channel', {})
+                    username = message.get('username') or user_names.get(message.get('user'))
                     
                     results.append({
                         'id': message.get('ts'),
-                        'title': f"Message from {message.get('username', 'Unknown')}",
+                        'title': f"Message from {username or 'Unknown'}",
                         'content': message.get('text', ''),
                         'source': 'Slack',
                         'type': 'message',
                         'channel_name': channel_info.get('name'),
                         'channel_id': channel_info.get('id'),
-                        'user': message.get('username'),
+                        'user': username,
                         'timestamp': message.get('ts'),
                         'permalink': message.get('permalink')
                     })
@@ -142,12 +310,13 @@ class SlackIntegration(BaseIntegration):
     async def search_files(self, query: str, user_token: str = None) -> List[Dict[str, Any]]:
         """Search Slack files"""
         try:
-            client = WebClient(token=user_token) if user_token else self.slack_client
+            client = await self._get_client(user_token)
             if not client:
                 return []
             
             # Search files
-            response = client.search_files(
+            response = await self._api_call(
+                client, 'search.files', client.search_files,
                 query=query,
                 count=25,
                 sort='timestamp',
@@ -156,7 +325,10 @@ class SlackIntegration(BaseIntegration):
             
             results = []
             if response['ok'] and 'files' in response:
-                for match in response['files']['matches']:
+                matches = response['files']['matches']
+                user_names = await self._resolve_user_names([match.get('user') for match in matches], client)
+                
+                for match in matches:
                     file_info = match
                     
                     results.append({
@@ -168,6 +340,7 @@ class SlackIntegration(BaseIntegration):
                         'file_type': file_info.get('filetype'),
                         'size': file_info.get('size'),
                         'user': file_info.get('user'),
+                        'user_name': user_names.get(file_info.get('user')),
                         'created_time': file_info.get('created'),
                         'url': file_info.get('url_private'),
                         'permalink': file_info.get('permalink')
@@ -182,64 +355,107 @@ class SlackIntegration(BaseIntegration):
             logger.error(f"Slack file search failed: {e}")
             return []
     
+    async def _iter_channels(self, client: AsyncWebClient) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every channel, following conversations.list cursors"""
+        cursor = None
+        while True:
+            response = await self._api_call(
+                client, 'conversations.list', client.conversations_list,
+                types="public_channel,private_channel",
+                limit=1000,
+                cursor=cursor
+            )
+            
+            for channel in response['channels']:
+                yield channel
+            
+            cursor = (response.get('response_metadata') or {}).get('next_cursor')
+            if not cursor:
+                return
+    
     async def get_channels(self, user_token: str = None) -> List[Dict[str, Any]]:
-        """Get Slack channels"""
+        """Get Slack channels (cached per token for channels_cache_ttl)"""
+        channels, _ = await self._get_channels_with_text(user_token)
+        return channels
+    
+    async def _get_channels_with_text(self, user_token: str = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Channels together with their casefolded title/topic search text"""
+        cache_key = self._token_key(user_token)
+        cached = self._lru_get(self._channels_cache, cache_key)
+        if cached and time.monotonic() - cached[0] < self._channels_ttl:
+            return cached[1], cached[2]
+        
         try:
-            client = WebClient(token=user_token) if user_token else self.slack_client
+            client = await self._get_client(user_token)
             if not client:
-                return []
+                return [], []
             
-            # Get channels
-            response = client.conversations_list(
-                types="public_channel,private_channel",
-                limit=100
-            )
+            # Get all channels (slack_sdk raises SlackApiError on non-ok pages)
+            results = [
+                {
+                    'id': channel['id'],
+                    'title': f"#{channel['name']}",
+                    'content': channel.get('topic', {}).get('value', ''),
+                    'source': 'Slack Channels',
+                    'type': 'channel',
+                    'name': channel['name'],
+                    'is_private': channel.get('is_private', False),
+                    'member_count': channel.get('num_members', 0),
+                    'created_time': channel.get('created')
+                }
+                async for channel in self._iter_channels(client)
+            ]
             
-            results = []
-            if response['ok']:
-                for channel in response['channels']:
-                    results.append({
-                        'id': channel['id'],
-                        'title': f"#{channel['name']}",
-                        'content': channel.get('topic', {}).get('value', ''),
-                        'source': 'Slack Channels',
-                        'type': 'channel',
-                        'name': channel['name'],
-                        'is_private': channel.get('is_private', False),
-                        'member_count': channel.get('num_members', 0),
-                        'created_time': channel.get('created')
-                    })
+            # Casefold title/topic once per fetch for search_all's channel filter
+            search_text = [f"{c['title']}\n{c['content']}".casefold() for c in results]
+            self._lru_put(
+                self._channels_cache, cache_key, (time.monotonic(), results, search_text), self._channels_cache_size
+            )
             
-            return results
+            return results, search_text
             
         except SlackApiError as e:
             logger.error(f"Slack channels retrieval failed: {e.response['error']}")
-            return []
+            return [], []
         except Exception as e:
             logger.error(f"Slack channels retrieval failed: {e}")
-            return []
+            return [], []
+    
+    async def _search_channels(self, query: str, user_token: str = None) -> List[Dict[str, Any]]:
+        """Channels whose name or topic contains the query"""
+        channels, search_text = await self._get_channels_with_text(user_token)
+        query_folded = query.casefold()
+        return [channel for channel, text in zip(channels, search_text) if query_folded in text]
+    
+    async def refresh_channels(self, user_token: str = None) -> List[Dict[str, Any]]:
+        """Drop cached channels for the token and fetch them again"""
+        self._channels_cache.pop(self._token_key(user_token), None)
+        return await self.get_channels(user_token)
     
     async def search_all(self, query: str, user_token: str = None) -> Dict[str, List[Dict[str, Any]]]:
         """Search across all Slack services"""
         try:
-            # Run searches concurrently
-            tasks = [
-                self.search_messages(query, user_token),
-                self.search_files(query, user_token)
-            ]
-            
-            messages_results, files_results = await asyncio.gather(*tasks)
+            # Run searches concurrently; each API call is throttled and bounded in _api_call
+            searches = {
+                'messages': self.search_messages(query, user_token),
+                'files': self.search_files(query, user_token)
+            }
             
             # Also get channels if query might be channel-related
-            channels_results = []
-            if any(keyword in query.lower() for keyword in ['channel', 'room', 'group']):
-                channels_results = await self.get_channels(user_token)
-                channels_results = [c for c in channels_results if query.lower() in c['title'].lower() or query.lower() in c['content'].lower()]
+            if _CHANNEL_QUERY_RE.search(query):
+                searches['channels'] = self._search_channels(query, user_token)
+            
+            results = await run_concurrently(searches)
+            
+            for service, service_results in results.items():
+                if isinstance(service_results, Exception):
+                    logger.error(f"Slack {service} search failed: {service_results}")
+                    results[service] = []
             
             return {
-                'messages': messages_results,
-                'files': files_results,
-                'channels': channels_results
+                'messages': results['messages'],
+                'files': results['files'],
+                'channels': results.get('channels', [])
             }
             
         except Exception as e:
@@ -249,11 +465,12 @@ class SlackIntegration(BaseIntegration):
     async def send_message(self, channel: str, message: str, user_token: str = None) -> Dict[str, Any]:
         """Send message to Slack channel"""
         try:
-            client = WebClient(token=user_token) if user_token else self.slack_client
+            client = await self._get_client(user_token)
             if not client:
                 return {"error": "Slack client not available"}
             
-            response = client.chat_postMessage(
+            response = await self._api_call(
+                client, 'chat.postMessage', client.chat_postMessage,
                 channel=channel,
                 text=message
             )
@@ -5,31 +5,63 @@ Enterprise-grade AI search platform with cognitive agents
 
 import os
 import sys
+import asyncio
+import queue
+import atexit
+import shutil
 import logging
-from datetime import datetime
+import logging.handlers
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 
+import redis
 from flask import Flask, request, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+try:
+    import orjson
+except ImportError:  # orjson is optional - fall back to Flask's stdlib encoder
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional (unavailable on Windows) - keep the default loop
+    uvloop = None
+
 # Import HyperSearch components
 from cognitive.agent_manager import CognitiveAgentManager
 from search.multimodal_engine import MultimodalSearchEngine
 from monitoring.metrics import track_api_metrics, update_system_metrics
 from localization import get_message, get_supported_languages
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('/app/logs/hypersearch.log')
-    ]
-)
+# Configure logging - request threads only enqueue records, a background
+# listener thread formats and writes them to stdout and the log file
+Path('/app/logs').mkdir(parents=True, exist_ok=True)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.StreamHandler(sys.stdout),
+    logging.handlers.RotatingFileHandler('/app/logs/hypersearch.log', maxBytes=50 * 1024 * 1024, backupCount=5)
+]
+for log_handler in log_handlers:
+    log_handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+# QueueHandler.prepare() bakes its formatter's output into record.msg, so it must
+# pass the bare message through and leave the line prefix to the listener's handlers
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
 # Initialize Flask application
@@ -40,10 +72,24 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 app.config.update(
     SECRET_KEY=os.getenv('SECRET_KEY', 'hypersearch-dev-key-change-in-production'),
     MAX_CONTENT_LENGTH=100 * 1024 * 1024,  # 100MB max upload
-    JSON_SORT_KEYS=False,
-    JSONIFY_PRETTYPRINT_REGULAR=True
+    JSON_SORT_KEYS=False
 )
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Compact, unsorted JSON via orjson; unknown types use Flask's default handler"""
+    
+    # Datetimes pass through to Flask's default so they keep the RFC 822 wire format
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._OPTIONS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Enable CORS for frontend integration
 CORS(app, origins=[
     "http://localhost:3000",
@@ -51,14 +97,50 @@ CORS(app, origins=[
     os.getenv('FRONTEND_URL', 'http://localhost:3000')
 ])
 
-# Rate limiting
+# Rate limiting - one pooled Redis client per worker, one Lua call per check
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+limiter_pool = redis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=int(os.getenv('LIMITER_REDIS_MAX_CONNECTIONS', 64)),
+    socket_keepalive=True
+)
 limiter = Limiter(
-    app,
-    key_func=get_remote_address,
+    get_remote_address,
+    app=app,
     default_limits=["1000 per hour"],
-    storage_uri=os.getenv('REDIS_URL', 'redis://localhost:6379')
+    storage_uri=REDIS_URL,
+    storage_options={'connection_pool': limiter_pool},
+    strategy='moving-window'
 )
 
+# Response timestamps have second precision - format each second once
+_timestamp_cache = (0, '')
+
+def utc_timestamp() -> str:
+    """Current UTC time as ISO 8601, reformatted at most once per second"""
+    global _timestamp_cache
+    now = int(time.time())
+    cached_second, cached_iso = _timestamp_cache
+    if now != cached_second:
+        cached_iso = datetime.fromtimestamp(now, tz=timezone.utc).isoformat()
+        # Single tuple assignment so worker threads never see a torn pair
+        _timestamp_cache = (now, cached_iso)
+    return cached_iso
+
+# Localized error bodies are constant per message key and client language
+@lru_cache(maxsize=256)
+def _error_body(key: str, accept_language: str) -> bytes:
+    return app.json.dumps({'error': get_message(key)}).encode('utf-8')
+
+def error_response(key: str, status: int):
+    """JSON error response with a cached, pre-serialized localized message"""
+    body = _error_body(key, request.headers.get('Accept-Language', ''))
+    return app.response_class(body, status=status, mimetype='application/json')
+
+# Event loops created by the async components use libuv when available
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 # Initialize core components
 try:
     cognitive_manager = CognitiveAgentManager()
@@ -77,7 +159,7 @@ def health_check():
     try:
         health_status = {
             'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': utc_timestamp(),
             'version': '1.0.0',
             'environment': os.getenv('FLASK_ENV', 'development'),
             'components': {
@@ -103,7 +185,7 @@ def health_check():
         return jsonify({
             'status': 'unhealthy',
             'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         }), 500
 
 # Cognitive agents endpoints
@@ -114,7 +196,7 @@ def get_agents():
     """Get list of active cognitive agents"""
     try:
         if not cognitive_manager:
-            return jsonify({'error': get_message('error.server_error')}), 500
+            return error_response('error.server_error', 500)
             
         agents = cognitive_manager.get_all_agents()
         return jsonify({
@@ -125,7 +207,7 @@ def get_agents():
         
     except Exception as e:
         logger.error(f"Failed to get agents: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 @app.route('/api/agents/<agent_id>/status', methods=['GET'])
 @track_api_metrics
@@ -133,17 +215,17 @@ def get_agent_status(agent_id):
     """Get specific agent status and performance metrics"""
     try:
         if not cognitive_manager:
-            return jsonify({'error': get_message('error.server_error')}), 500
+            return error_response('error.server_error', 500)
             
         agent_status = cognitive_manager.get_agent_status(agent_id)
         if not agent_status:
-            return jsonify({'error': get_message('error.resource.not_found')}), 404
+            return error_response('error.resource.not_found', 404)
             
         return jsonify(agent_status), 200
         
     except Exception as e:
         logger.error(f"Failed to get agent {agent_id} status: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 @app.route('/api/agents/<agent_id>/task', methods=['POST'])
 @limiter.limit("10 per minute")
@@ -152,11 +234,11 @@ def assign_task_to_agent(agent_id):
     """Assign a task to a specific cognitive agent"""
     try:
         if not cognitive_manager:
-            return jsonify({'error': get_message('error.server_error')}), 500
+            return error_response('error.server_error', 500)
             
         task_data = request.get_json()
         if not task_data or 'task_type' not in task_data:
-            return jsonify({'error': get_message('api.error.invalid_request')}), 400
+            return error_response('api.error.invalid_request', 400)
             
         result = cognitive_manager.assign_task(agent_id, task_data)
         if result['success']:
@@ -166,7 +248,7 @@ def assign_task_to_agent(agent_id):
             
     except Exception as e:
         logger.error(f"Failed to assign task to agent {agent_id}: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 # Search endpoints
 @app.route('/api/search', methods=['POST'])
@@ -176,11 +258,11 @@ def search():
     """Main multimodal search endpoint"""
     try:
         if not search_engine:
-            return jsonify({'error': get_message('error.server_error')}), 500
+            return error_response('error.server_error', 500)
             
         search_data = request.get_json()
         if not search_data or 'query' not in search_data:
-            return jsonify({'error': get_message('api.error.invalid_request')}), 400
+            return error_response('api.error.invalid_request', 400)
             
         # Extract search parameters
         query = search_data['query']
@@ -204,13 +286,13 @@ def search():
             'query': query,
             'search_type': search_type,
             'modalities': modalities,
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': utc_timestamp(),
             'processing_time': results.get('processing_time', 0)
         }), 200
         
     except Exception as e:
         logger.error(f"Search failed: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 @app.route('/api/search/suggestions', methods=['POST'])
 @limiter.limit("100 per minute")
@@ -219,7 +301,7 @@ def search_suggestions():
     """Get search suggestions and auto-completions"""
     try:
         if not search_engine:
-            return jsonify({'error': get_message('error.server_error')}), 500
+            return error_response('error.server_error', 500)
             
         data = request.get_json()
         partial_query = data.get('query', '') if data else ''
@@ -232,7 +314,7 @@ def search_suggestions():
         
     except Exception as e:
         logger.error(f"Failed to get suggestions: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 # Analytics and metrics endpoints
 @app.route('/api/analytics/overview', methods=['GET'])
@@ -253,7 +335,7 @@ def analytics_overview():
         
     except Exception as e:
         logger.error(f"Failed to get analytics: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 # Configuration endpoints
 @app.route('/api/config/languages', methods=['GET'])
@@ -269,9 +351,12 @@ def get_languages():
         
     except Exception as e:
         logger.error(f"Failed to get languages: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 # File upload endpoint
+UPLOAD_DIR = Path(os.getenv('UPLOAD_DIR', '/app/uploads'))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 @app.route('/api/upload', methods=['POST'])
 @limiter.limit("10 per minute")
 @track_api_metrics
@@ -285,33 +370,48 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
             
-        # TODO: Implement file processing with search engine
-        # For now, return mock response
-        return jsonify({
-            'file_id': 'mock-file-id',
-            'filename': file.filename,
-            'size': len(file.read()),
-            'status': 'uploaded',
-            'message': 'File uploaded successfully (mock implementation)'
-        }), 200
+        # Stream to disk in 1MB chunks instead of buffering the whole upload
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, dir=UPLOAD_DIR) as tmp:
+                tmp_path = tmp.name
+                shutil.copyfileobj(file.stream, tmp, length=UPLOAD_CHUNK_SIZE)
+                size = tmp.tell()
+            
+            # TODO: Implement file processing with search engine
+            return jsonify({
+                'file_id': Path(tmp_path).name,
+                'filename': file.filename,
+                'size': size,
+                'status': 'uploaded',
+                'message': 'File uploaded successfully'
+            }), 200
+        finally:
+            # Nothing consumes the file after this request yet, so don't leave it on disk
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
         
     except Exception as e:
         logger.error(f"File upload failed: {e}")
-        return jsonify({'error': get_message('error.server_error')}), 500
+        return error_response('error.server_error', 500)
 
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': get_message('error.resource.not_found')}), 404
+    return error_response('error.resource.not_found', 404)
 
 @app.errorhandler(429)
 def rate_limit_exceeded(error):
-    return jsonify({'error': get_message('error.rate.limit.exceeded')}), 429
+    return error_response('error.rate.limit.exceeded', 429)
 
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal server error: {error}")
-    return jsonify({'error': get_message('error.server_error')}), 500
+    return error_response('error.server_error', 500)
 
 # Metrics endpoint for Prometheus
 @app.route('/metrics', methods=['GET'])
@@ -325,7 +425,7 @@ def metrics():
 
 # Main application entry point
 if __name__ == '__main__':
-    # Development server configuration
+    # Development server only - production runs under Gunicorn (gunicorn -c gunicorn.conf.py main:app)
     debug_mode = os.getenv('FLASK_ENV') == 'development'
     port = int(os.getenv('PORT', 5000))
     host = os.getenv('HOST', '0.0.0.0')
@@ -336,9 +436,6 @@ if __name__ == '__main__':
     logger.info(f"🧠 Cognitive Agents: {'✅ Enabled' if cognitive_manager else '❌ Disabled'}")
     logger.info(f"🔍 Search Engine: {'✅ Enabled' if search_engine else '❌ Disabled'}")
     
-    # Create logs directory if it doesn't exist
-    Path('/app/logs').mkdir(parents=True, exist_ok=True)
-    
     app.run(
         host=host,
         port=port,
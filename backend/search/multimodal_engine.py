@@ -1,14 +1,26 @@
 """
 HyperSearch Multimodal Search Engine
 Advanced AI-powered search with cognitive agents integration
+
+Numeric buffers (embeddings, scores) are float32 ndarrays allocated with
+np.empty/np.zeros and filled in place, or collected with np.fromiter/np.stack;
+never build them from Python lists such as np.array([0.] * n).
 """
 
+import os
 import logging
 import asyncio
+import queue
+import re
+import threading
 import time
-from typing import Dict, List, Optional, Any, Union
+from functools import partial
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Any, Tuple, Union
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
+from pathlib import Path
 import json
 import hashlib
 
@@ -16,9 +28,17 @@ import hashlib
 import openai
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:  # ONNX Runtime is optional - fall back to SentenceTransformer
+    ort = None
+
 # Search and processing imports
 from PIL import Image
 import cv2
@@ -28,7 +48,25 @@ from docx import Document
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Query keywords (matched as substrings) that suggest each extra modality
+_MODALITY_PATTERNS = {
+    'image': re.compile(r'image|picture|photo|visual'),
+    'audio': re.compile(r'audio|sound|music|voice'),
+    'video': re.compile(r'video|movie|clip|footage'),
+    'code': re.compile(r'code|programming|function|algorithm')
+}
+
+# Related terms for semantic query expansion (simplified)
+_SYNONYM_MAP = {
+    'search': ('find', 'discover', 'locate'),
+    'information': ('data', 'knowledge', 'details'),
+    'analysis': ('examination', 'study', 'evaluation')
+}
+
+# Payload keys read by SearchResult.from_qdrant; anything else stored on a point stays server-side
+DEFAULT_PAYLOAD_FIELDS = ('title', 'content', 'modality', 'source', 'metadata')
+
+@dataclass(slots=True)
 class SearchResult:
     """Search result structure"""
     id: str
@@ -39,8 +77,22 @@ class SearchResult:
     metadata: Dict[str, Any]
     source: Optional[str] = None
     timestamp: Optional[datetime] = None
+    
+    @classmethod
+    def from_qdrant(cls, hit) -> "SearchResult":
+        """Build from a Qdrant scored point"""
+        payload = hit.payload or {}
+        return cls(
+            id=str(hit.id),
+            title=payload.get("title", "Untitled"),
+            content=payload.get("content", ""),
+            modality=payload.get("modality", "text"),
+            confidence=float(hit.score),
+            metadata=payload.get("metadata", {}),
+            source=payload.get("source")
+        )
 
-@dataclass
+@dataclass(slots=True)
 class SearchQuery:
     """Search query structure"""
     text: str
@@ -49,6 +101,290 @@ class SearchQuery:
     filters: Dict[str, Any]
     use_cognitive_agents: bool = True
     max_results: int = 50
+    # Subset of DEFAULT_PAYLOAD_FIELDS to fetch, e.g. without 'content' for previews
+    payload_fields: Optional[List[str]] = None
+
+class OnnxEmbeddingModel:
+    """
+    Sentence encoder running a dynamically int8-quantized ONNX export of the model
+    Mean pooling + L2 normalization match the SentenceTransformer pipeline
+    """
+    
+    QUANTIZED_FILE = "model_quantized.onnx"
+    
+    def __init__(self, model_name: str, model_dir: str, max_seq_length: int = 256, max_batch: int = 32):
+        # Bare names refer to the sentence-transformers organization on the Hub
+        hub_name = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+        export_dir = Path(model_dir) / hub_name.replace('/', '__')
+        if not (export_dir / self.QUANTIZED_FILE).exists():
+            self._export_quantized(hub_name, export_dir)
+        
+        self.max_seq_length = max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            str(export_dir / self.QUANTIZED_FILE),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+        
+        # Token embeddings of up to max_batch x max_seq_length are written into one
+        # preallocated buffer through IO binding instead of a fresh array per call
+        output = self.session.get_outputs()[0]
+        self._output_name = output.name
+        hidden_size = output.shape[-1] if isinstance(output.shape[-1], int) else None
+        self._hidden_size = hidden_size
+        self._output_buffer = (
+            np.empty(max_batch * max_seq_length * hidden_size, dtype=np.float32) if hidden_size else None
+        )
+        self._output_buffer_lock = threading.Lock()
+    
+    def _run(self, inputs: Dict[str, np.ndarray]) -> Tuple[np.ndarray, bool]:
+        """
+        Run the model, writing token embeddings into the shared buffer when it fits and is free
+        Returns (token_embeddings, whether the buffer lock is held and must be released)
+        """
+        batch_size, seq_length = inputs["input_ids"].shape
+        shape = (batch_size, seq_length, self._hidden_size)
+        size = batch_size * seq_length * (self._hidden_size or 0)
+        
+        if self._output_buffer is None or size > self._output_buffer.size or not self._output_buffer_lock.acquire(blocking=False):
+            return self.session.run([self._output_name], inputs)[0], False
+        
+        token_embeddings = self._output_buffer[:size].reshape(shape)
+        binding = self.session.io_binding()
+        for name, value in inputs.items():
+            binding.bind_cpu_input(name, value)
+        binding.bind_output(self._output_name, "cpu", 0, np.float32, list(shape), token_embeddings.ctypes.data)
+        try:
+            self.session.run_with_iobinding(binding)
+        except Exception:
+            self._output_buffer_lock.release()
+            raise
+        return token_embeddings, True
+    
+    @staticmethod
+    def _export_quantized(hub_name: str, export_dir: Path):
+        """Export the model to ONNX and quantize its weights to int8 (runs once)"""
+        logger.info(f"Exporting {hub_name} to quantized ONNX in {export_dir}")
+        model = ORTModelForFeatureExtraction.from_pretrained(hub_name, export=True)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(hub_name).save_pretrained(export_dir)
+        
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        quantizer.quantize(
+            save_dir=export_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        )
+    
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        """Encode sentences into L2-normalized float32 embeddings, shape (N, dim)"""
+        tokens = self.tokenizer(
+            list(sentences),
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        inputs = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+        token_embeddings, holds_buffer = self._run(inputs)
+        
+        try:
+            # Mean over real (non-padding) tokens; produces a new array, so the buffer can be reused after
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        finally:
+            if holds_buffer:
+                self._output_buffer_lock.release()
+        
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        
+        return embeddings.astype(np.float32, copy=False)
+
+class DynamicBatcher:
+    """
+    Groups concurrent encode requests into batched model calls
+    A worker thread collects requests for up to max_wait seconds (or max_batch
+    texts) and encodes them together; callers on any event loop await the result
+    """
+    
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch: int = 32, max_wait: float = 0.005):
+        self._encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.SimpleQueue[Tuple[str, Future]]" = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+    
+    def submit(self, text: str) -> Awaitable[np.ndarray]:
+        """Queue text for encoding; resolves to its embedding"""
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return asyncio.wrap_future(future)
+    
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # Skip requests whose callers have gone away
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            try:
+                embeddings = self._encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+class QueryCache:
+    """
+    Bounded LRU + TTL cache of query embeddings and their vector search results
+    Lookups match the exact normalized query first, then the nearest cached
+    embedding by cosine similarity
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # key -> (embedding, results, stored_at, max_results the results were fetched with)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, List[SearchResult], float, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        
+        # Stacked (N, dim) embeddings for the similarity scan, rebuilt lazily after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._matrix_limits: Optional[np.ndarray] = None
+        
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(text: str, max_results: int) -> str:
+        """Cache key for the whitespace/case-normalized query text"""
+        normalized = ' '.join(text.casefold().split())
+        return hashlib.sha256(f"{max_results}|{normalized}".encode('utf-8')).hexdigest()
+    
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl_seconds
+    
+    def get(self, key: str) -> Optional[List[SearchResult]]:
+        """Results for an exact query match"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[2]):
+                del self._entries[key]
+                self._matrix = None
+                return None
+            
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def get_similar(self, embedding: np.ndarray, max_results: int) -> Optional[List[SearchResult]]:
+        """
+        Results for the most similar cached query, if it clears the threshold
+        Only entries fetched with at least max_results are considered; their results are cut to size
+        """
+        with self._lock:
+            if self._matrix is None:
+                expired = [key for key, entry in self._entries.items() if self._expired(entry[2])]
+                for key in expired:
+                    del self._entries[key]
+                if not self._entries:
+                    return None
+                
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([entry[0] for entry in self._entries.values()])
+                self._matrix_limits = np.fromiter((entry[3] for entry in self._entries.values()),
+                                                  dtype=np.int64, count=len(self._entries))
+            
+            # Embeddings are L2-normalized, so one matrix-vector product gives all cosines
+            similarities = self._matrix @ embedding
+            # Entries fetched with a smaller limit can't answer this query
+            similarities[self._matrix_limits < max_results] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            
+            results = self.get(self._matrix_keys[best])
+            return results[:max_results] if results is not None else None
+    
+    def put(self, key: str, embedding: np.ndarray, results: List[SearchResult], max_results: int):
+        """Store a normalized query embedding with its results and the limit they were fetched with"""
+        with self._lock:
+            self._entries[key] = (embedding, results, time.monotonic(), max_results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+    
+    def record(self, hit: bool):
+        """Count a lookup outcome"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def clear(self):
+        """Drop all entries (call whenever the vector collection changes)"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+            self._matrix_limits = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hit_rate, 4)
+            }
+
+class SearchHistoryEntry(NamedTuple):
+    """Search history record (tuple-backed to keep per-entry overhead low)"""
+    query: str
+    search_type: str
+    modalities: List[str]
+    result_count: int
+    processing_time: float
+    timestamp_ns: int  # time.time_ns()
 
 class MultimodalSearchEngine:
     """Advanced multimodal search engine with cognitive capabilities"""
@@ -57,7 +393,14 @@ class MultimodalSearchEngine:
         self.config = config or self._load_default_config()
         self.embedding_model = None
         self.vector_client = None
-        self.search_history = []
+        # Most recent searches; the deque evicts the oldest in O(1)
+        self.search_history: deque = deque(maxlen=self.config.get("search_history_size", 1000))
+        
+        # Blocking vector database calls run here, off the event loop
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=self.config.get("io_workers", 8),
+            thread_name_prefix="vector-io"
+        )
         self.performance_metrics = {
             "total_searches": 0,
             "avg_response_time": 0.0,
@@ -65,29 +408,100 @@ class MultimodalSearchEngine:
             "cache_hit_rate": 0.0
         }
         
+        # Query embedding + vector result cache
+        self.query_cache = QueryCache(
+            max_size=self.config.get("query_cache_size", 1024),
+            ttl_seconds=self.config.get("cache_ttl", 3600),
+            similarity_threshold=self.config.get("query_cache_similarity", 0.95)
+        )
+        
+        # Full search() responses: key -> (stored_at monotonic, response)
+        self._response_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._response_cache_size = self.config.get("response_cache_size", 256)
+        self._response_cache_ttl = self.config.get("response_cache_ttl", 60)  # seconds
+        
+        # Modality search handlers
+        self._modality_dispatch = {
+            "text": self._text_search,
+            "image": self._image_search,
+            "audio": self._audio_search,
+            "video": self._video_search,
+            "code": self._code_search
+        }
+        
         # Initialize components
         self._initialize_embedding_model()
         self._initialize_vector_database()
         
+        # HNSW beam width + rescoring of quantized candidates with the full vectors
+        self._search_params = models.SearchParams(
+            hnsw_ef=self.config.get("hnsw_ef", 64),
+            quantization=models.QuantizationSearchParams(
+                rescore=True,
+                oversampling=self.config.get("quantization_oversampling", 2.0)
+            )
+        )
+        
+        # Concurrent queries share batched encode calls
+        self._encode_batcher = None
+        if self.embedding_model:
+            # Unit-length embeddings let the collection use DOT instead of COSINE
+            encode = self.embedding_model.encode
+            if isinstance(self.embedding_model, SentenceTransformer):
+                encode = partial(encode, normalize_embeddings=True)
+            self._encode_batcher = DynamicBatcher(
+                encode,
+                max_batch=self.config.get("batch_max_size", 32),
+                max_wait=self.config.get("batch_max_wait_ms", 5) / 1000
+            )
+        
         logger.info("🔍 Multimodal Search Engine initialized")
     
     def _load_default_config(self) -> Dict[str, Any]:
         """Load default configuration"""
         return {
             "embedding_model": "all-MiniLM-L6-v2",
+            "embedding_backend": "onnx",
+            "onnx_model_dir": "/app/models/onnx",
             "vector_db_url": "http://localhost:6333",
             "vector_collection": "hypersearch",
             "max_results": 50,
             "similarity_threshold": 0.7,
             "enable_semantic_search": True,
             "enable_cognitive_processing": True,
-            "cache_ttl": 3600  # 1 hour
+            "cache_ttl": 3600,  # 1 hour
+            "query_cache_size": 1024,
+            "query_cache_similarity": 0.95,
+            "batch_max_size": 32,
+            "batch_max_wait_ms": 5,
+            "hnsw_m": 16,
+            "hnsw_ef_construct": 128,
+            "hnsw_ef": 64,
+            "quantization_oversampling": 2.0,
+            "vector_db_prefer_grpc": True,
+            "vector_db_grpc_port": 6334,
+            "io_workers": 8,
+            "search_history_size": 1000,
+            "response_cache_size": 256,
+            "response_cache_ttl": 60
         }
     
     def _initialize_embedding_model(self):
-        """Initialize sentence transformer model"""
+        """Initialize embedding model (quantized ONNX when available, else sentence transformer)"""
         try:
             model_name = self.config.get("embedding_model", "all-MiniLM-L6-v2")
+            if ort is not None and self.config.get("embedding_backend", "onnx") == "onnx":
+                try:
+                    self.embedding_model = OnnxEmbeddingModel(
+                        model_name,
+                        self.config.get("onnx_model_dir", "/app/models/onnx"),
+                        max_batch=self.config.get("batch_max_size", 32)
+                    )
+                    logger.info(f"✅ Embedding model loaded (ONNX int8): {model_name}")
+                    return
+                except Exception as e:
+                    logger.warning(f"ONNX embedding model unavailable, using SentenceTransformer: {e}")
+            
             self.embedding_model = SentenceTransformer(model_name)
             logger.info(f"✅ Embedding model loaded: {model_name}")
         except Exception as e:
@@ -98,7 +512,12 @@ class MultimodalSearchEngine:
         """Initialize Qdrant vector database connection"""
         try:
             db_url = self.config.get("vector_db_url", "http://localhost:6333")
-            self.vector_client = QdrantClient(url=db_url)
+            # gRPC keeps one multiplexed channel open instead of HTTP/JSON per call
+            self.vector_client = QdrantClient(
+                url=db_url,
+                prefer_grpc=self.config.get("vector_db_prefer_grpc", True),
+                grpc_port=self.config.get("vector_db_grpc_port", 6334)
+            )
             
             # Ensure collection exists
             collection_name = self.config.get("vector_collection", "hypersearch")
@@ -111,7 +530,21 @@ class MultimodalSearchEngine:
                     collection_name=collection_name,
                     vectors_config=models.VectorParams(
                         size=384,  # Size for all-MiniLM-L6-v2
-                        distance=models.Distance.COSINE
+                        # Stored and query vectors are L2-normalized, so DOT equals cosine
+                        # without the per-candidate norm computation
+                        distance=models.Distance.DOT
+                    ),
+                    hnsw_config=models.HnswConfigDiff(
+                        m=self.config.get("hnsw_m", 16),
+                        ef_construct=self.config.get("hnsw_ef_construct", 128)
+                    ),
+                    # int8 copies of the vectors stay in RAM; originals are used for rescoring
+                    quantization_config=models.ScalarQuantization(
+                        scalar=models.ScalarQuantizationConfig(
+                            type=models.ScalarType.INT8,
+                            quantile=0.99,
+                            always_ram=True
+                        )
                     )
                 )
                 logger.info(f"✅ Created vector collection: {collection_name}")
@@ -125,18 +558,29 @@ class MultimodalSearchEngine:
                     search_type: str = "comprehensive",
                     modalities: List[str] = None,
                     filters: Dict[str, Any] = None,
-                    use_cognitive_agents: bool = True) -> Dict[str, Any]:
+                    use_cognitive_agents: bool = True,
+                    payload_fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """Perform multimodal search with cognitive processing"""
         start_time = time.time()
         
         try:
+            # Exact repeats within the TTL skip all search work
+            response_key = self._response_cache_key(query, search_type, modalities, filters,
+                                                    use_cognitive_agents, payload_fields)
+            cached = self._get_cached_response(response_key)
+            if cached is not None:
+                processing_time = time.time() - start_time
+                self._update_search_metrics(processing_time, cached["total_found"])
+                return {**cached, "processing_time": processing_time, "cached": True}
+            
             # Prepare search query
             search_query = SearchQuery(
                 text=query,
                 query_type=search_type,
                 modalities=modalities or ['text'],
                 filters=filters or {},
-                use_cognitive_agents=use_cognitive_agents
+                use_cognitive_agents=use_cognitive_agents,
+                payload_fields=payload_fields
             )
             
             logger.info(f"🔍 Processing search: '{query}' (type: {search_type})")
@@ -169,18 +613,21 @@ class MultimodalSearchEngine:
             # Store in history
             self._add_to_search_history(search_query, combined_results, processing_time)
             
-            return {
+            response = {
                 "results": combined_results,
                 "query_analysis": cognitive_analysis,
                 "processing_time": processing_time,
                 "modalities_processed": search_query.modalities,
                 "total_found": len(combined_results),
                 "search_metadata": {
-                    "timestamp": datetime.utcnow().isoformat(),
+                    "timestamp": datetime.fromtimestamp(time.time_ns() / 1e9, tz=timezone.utc).isoformat(),
                     "search_type": search_type,
                     "cognitive_enhanced": use_cognitive_agents
                 }
             }
+            self._cache_response(response_key, response)
+            
+            return response
             
         except Exception as e:
             logger.error(f"Search failed: {e}")
@@ -190,6 +637,53 @@ class MultimodalSearchEngine:
                 "processing_time": time.time() - start_time
             }
     
+    @staticmethod
+    def _response_cache_key(query: str, search_type: str, modalities: Optional[List[str]],
+                            filters: Optional[Dict[str, Any]], use_cognitive_agents: bool,
+                            payload_fields: Optional[List[str]] = None) -> str:
+        """Cache key over every search() argument that affects the response"""
+        key_data = json.dumps(
+            [query, search_type, sorted(modalities or ['text']), filters or {}, use_cognitive_agents,
+             sorted(payload_fields or DEFAULT_PAYLOAD_FIELDS)],
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+    
+    def _get_cached_response(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached search response, if still fresh"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, response = entry
+        if time.monotonic() - stored_at >= self._response_cache_ttl:
+            self._response_cache.pop(key, None)
+            return None
+        
+        return response
+    
+    def _cache_response(self, key: str, response: Dict[str, Any]):
+        """Store search response, evicting expired/oldest entries when full"""
+        now = time.monotonic()
+        cache = self._response_cache
+        
+        if len(cache) >= self._response_cache_size:
+            for stale_key in [k for k, (stored_at, _) in cache.items() if now - stored_at >= self._response_cache_ttl]:
+                cache.pop(stale_key, None)
+            
+            # Dicts keep insertion order, so the first keys are the oldest
+            while len(cache) >= self._response_cache_size:
+                cache.pop(next(iter(cache)), None)
+        
+        cache.pop(key, None)
+        cache[key] = (now, response)
+    
+    def clear_caches(self):
+        """Drop cached responses and query embeddings (call whenever indexed content changes)"""
+        self._response_cache.clear()
+        self.query_cache.clear()
+    
     async def _cognitive_query_analysis(self, query: SearchQuery) -> Dict[str, Any]:
         """Analyze query with cognitive agents"""
         try:
@@ -217,31 +711,48 @@ class MultimodalSearchEngine:
             if not self.embedding_model or not self.vector_client:
                 return []
             
+            # Exact repeat of a cached query skips the model and the database
+            cache_key = QueryCache.make_key(query.text, query.max_results)
+            cached = self.query_cache.get(cache_key)
+            if cached is not None:
+                self._record_cache_lookup(True)
+                return cached
+            
             # Generate query embedding
-            query_embedding = self.embedding_model.encode([query.text])[0]
+            # float32 end to end - no float64 upcast (no-op for both encoders)
+            query_embedding = np.asarray(await self._encode_batcher.submit(query.text), dtype=np.float32)
+            
+            # Near-duplicate of a cached query skips the database
+            # Re-normalized here as well: DOT scores are only cosines for unit vectors
+            normalized_embedding = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+            cached = self.query_cache.get_similar(normalized_embedding, query.max_results)
+            if cached is not None:
+                self._record_cache_lookup(True)
+                return cached
+            self._record_cache_lookup(False)
             
             # Search in vector database
-            search_results = self.vector_client.search(
-                collection_name=self.config.get("vector_collection", "hypersearch"),
-                query_vector=query_embedding.tolist(),
-                limit=query.max_results,
-                score_threshold=self.config.get("similarity_threshold", 0.7)
+            search_results = await asyncio.get_running_loop().run_in_executor(
+                self._io_pool,
+                lambda: self.vector_client.search(
+                    collection_name=self.config.get("vector_collection", "hypersearch"),
+                    # qdrant-client accepts the ndarray directly
+                    query_vector=normalized_embedding,
+                    limit=query.max_results,
+                    score_threshold=self.config.get("similarity_threshold", 0.7),
+                    search_params=self._search_params,
+                    with_payload=models.PayloadSelectorInclude(
+                        include=list(query.payload_fields or DEFAULT_PAYLOAD_FIELDS)
+                    )
+                )
             )
             
             # Convert to SearchResult objects
-            results = []
-            for hit in search_results:
-                result = SearchResult(
-                    id=str(hit.id),
-                    title=hit.payload.get("title", "Untitled"),
-                    content=hit.payload.get("content", ""),
-                    modality=hit.payload.get("modality", "text"),
-                    confidence=float(hit.score),
-                    metadata=hit.payload.get("metadata", {}),
-                    source=hit.payload.get("source")
-                )
-                results.append(result)
+            results = [SearchResult.from_qdrant(hit) for hit in search_results]
             
+            # Only full-payload results are cached; they also serve projected requests
+            if not query.payload_fields:
+                self.query_cache.put(cache_key, normalized_embedding, results, query.max_results)
             return results
             
         except Exception as e:
@@ -250,27 +761,25 @@ class MultimodalSearchEngine:
     
     async def _multimodal_search(self, query: SearchQuery) -> Dict[str, List[SearchResult]]:
         """Search across different modalities"""
-        results = {}
+        # Pre-fill in query order so the combined ranking sees modalities as requested
+        results = {modality: [] for modality in query.modalities}
+        searches = {}
         
         for modality in query.modalities:
-            try:
-                if modality == "text":
-                    results[modality] = await self._text_search(query)
-                elif modality == "image":
-                    results[modality] = await self._image_search(query)
-                elif modality == "audio":
-                    results[modality] = await self._audio_search(query)
-                elif modality == "video":
-                    results[modality] = await self._video_search(query)
-                elif modality == "code":
-                    results[modality] = await self._code_search(query)
-                else:
-                    logger.warning(f"Unsupported modality: {modality}")
-                    results[modality] = []
-                    
-            except Exception as e:
-                logger.error(f"Modality search failed for {modality}: {e}")
+            search_fn = self._modality_dispatch.get(modality)
+            if search_fn is None:
+                logger.warning(f"Unsupported modality: {modality}")
+            else:
+                searches[modality] = search_fn(query)
+        
+        # Independent modality searches overlap instead of running one after another
+        outcomes = await asyncio.gather(*searches.values(), return_exceptions=True)
+        for modality, outcome in zip(searches, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Modality search failed for {modality}: {outcome}")
                 results[modality] = []
+            else:
+                results[modality] = outcome
         
         return results
     
@@ -310,38 +819,14 @@ class MultimodalSearchEngine:
     
     def _suggest_modalities(self, query_text: str) -> List[str]:
         """Suggest relevant modalities based on query"""
-        modalities = ['text']  # Always include text
-        
-        # Simple heuristics for modality suggestion
+        # Simple heuristics for modality suggestion - text is always included
         query_lower = query_text.lower()
-        
-        if any(word in query_lower for word in ['image', 'picture', 'photo', 'visual']):
-            modalities.append('image')
-        if any(word in query_lower for word in ['audio', 'sound', 'music', 'voice']):
-            modalities.append('audio')
-        if any(word in query_lower for word in ['video', 'movie', 'clip', 'footage']):
-            modalities.append('video')
-        if any(word in query_lower for word in ['code', 'programming', 'function', 'algorithm']):
-            modalities.append('code')
-            
-        return modalities
+        return ['text'] + [modality for modality, pattern in _MODALITY_PATTERNS.items() if pattern.search(query_lower)]
     
     def _expand_query_semantically(self, query_text: str) -> List[str]:
         """Expand query with semantic variations"""
         # Simple expansion - in production would use more sophisticated NLP
-        words = query_text.lower().split()
-        expansions = []
-        
-        # Add synonyms and related terms (simplified)
-        synonym_map = {
-            'search': ['find', 'discover', 'locate'],
-            'information': ['data', 'knowledge', 'details'],
-            'analysis': ['examination', 'study', 'evaluation']
-        }
-        
-        for word in words:
-            if word in synonym_map:
-                expansions.extend(synonym_map[word])
+        expansions = [term for word in query_text.lower().split() for term in _SYNONYM_MAP.get(word, ())]
         
         return expansions[:5]  # Limit to 5 expansions
     
@@ -350,20 +835,21 @@ class MultimodalSearchEngine:
                                  modality_results: Dict[str, List[SearchResult]],
                                  cognitive_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Combine and rank all search results"""
-        all_results = vector_results.copy()
+        # One list built from vector and modality results, no intermediate copy
+        all_results = [*vector_results, *(r for results in modality_results.values() for r in results)]
         
-        # Add modality results
-        for modality, results in modality_results.items():
-            all_results.extend(results)
+        if not all_results:
+            return []
         
-        # Remove duplicates and sort by confidence
-        unique_results = {}
-        for result in all_results:
-            if result.id not in unique_results or result.confidence > unique_results[result.id].confidence:
-                unique_results[result.id] = result
+        # Sort by confidence (descending, stable) so the first occurrence of each id is its best
+        confidences = np.fromiter((r.confidence for r in all_results), dtype=np.float64, count=len(all_results))
+        order = np.argsort(-confidences, kind="stable")
+        ids = np.array([all_results[i].id for i in order])
         
-        # Sort by confidence (descending)
-        sorted_results = sorted(unique_results.values(), key=lambda r: r.confidence, reverse=True)
+        # Positions (in sorted order) of each id's best result; ascending positions keep confidence order
+        _, first_positions = np.unique(ids, return_index=True)
+        top_positions = np.sort(first_positions)[:self.config.get("max_results", 50)]
+        sorted_results = [all_results[i] for i in order[top_positions]]
         
         # Convert to dictionary format
         return [
@@ -376,9 +862,14 @@ class MultimodalSearchEngine:
                 "metadata": r.metadata,
                 "source": r.source
             }
-            for r in sorted_results[:self.config.get("max_results", 50)]
+            for r in sorted_results
         ]
     
+    def _record_cache_lookup(self, hit: bool):
+        """Count a query cache lookup and refresh the reported hit rate"""
+        self.query_cache.record(hit)
+        self.performance_metrics["cache_hit_rate"] = self.query_cache.hit_rate
+    
     def _update_search_metrics(self, processing_time: float, result_count: int):
         """Update search performance metrics"""
         self.performance_metrics["total_searches"] += 1
@@ -391,20 +882,14 @@ class MultimodalSearchEngine:
     
     def _add_to_search_history(self, query: SearchQuery, results: List[Dict], processing_time: float):
         """Add search to history"""
-        history_entry = {
-            "query": query.text,
-            "search_type": query.query_type,
-            "modalities": query.modalities,
-            "result_count": len(results),
-            "processing_time": processing_time,
-            "timestamp": datetime.utcnow()
-        }
-        
-        self.search_history.append(history_entry)
-        
-        # Keep history manageable
-        if len(self.search_history) > 1000:
-            self.search_history = self.search_history[-800:]
+        self.search_history.append(SearchHistoryEntry(
+            query=query.text,
+            search_type=query.query_type,
+            modalities=query.modalities,
+            result_count=len(results),
+            processing_time=processing_time,
+            timestamp_ns=time.time_ns()
+        ))
     
     # Public utility methods
     def get_search_count(self) -> int:
@@ -426,7 +911,8 @@ class MultimodalSearchEngine:
             "embedding_model": "loaded" if self.embedding_model else "unavailable",
             "vector_database": "connected" if self.vector_client else "disconnected",
             "total_searches": self.get_search_count(),
-            "avg_response_time": self.get_avg_response_time()
+            "avg_response_time": self.get_avg_response_time(),
+            "query_cache": self.query_cache.get_stats()
         }
     
     async def get_suggestions(self, partial_query: str) -> List[str]:
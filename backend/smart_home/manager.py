@@ -6,12 +6,19 @@ Enterprise-grade smart home device management and automation
 import logging
 import asyncio
 import json
-from typing import Dict, List, Optional, Any, Union
-from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict
+import bisect
+import inspect
+import time
+from collections import deque
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Any, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
 from enum import Enum
 import uuid
 
+import aiohttp
+
 from .device_registry import DeviceRegistry, SmartDevice
 from .samsung_smartthings import SmartThingsIntegration
 from .philips_hue import PhilipsHueIntegration
@@ -22,6 +29,45 @@ from ..monitoring.metrics import track_smart_home_metrics
 
 logger = logging.getLogger(__name__)
 
+# Platform capability flags, computed once per integration instead of hasattr() per call
+CAP_DISCOVER = 1
+CAP_CONTROL = 2
+CAP_SYNC = 4
+CAP_STATUS = 8
+CAP_ENERGY = 16
+CAP_AUTH = 32
+CAP_SHUTDOWN = 64
+# control_device takes user_id, so commands run under that user's own credentials
+CAP_USER_CONTROL = 128
+
+_CAPABILITY_METHODS = {
+    CAP_DISCOVER: 'discover_devices',
+    CAP_CONTROL: 'control_device',
+    CAP_SYNC: 'sync_devices',
+    CAP_STATUS: 'get_status',
+    CAP_ENERGY: 'get_energy_data',
+    CAP_AUTH: 'authenticate',
+    CAP_SHUTDOWN: 'shutdown'
+}
+
+def _now_ms() -> int:
+    """Current UNIX time in milliseconds, the timestamp format of manager responses"""
+    return time.time_ns() // 1_000_000
+
+def _datetime_ms(value: datetime) -> int:
+    """UNIX milliseconds for a naive UTC datetime"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def _platform_capabilities(platform: Any) -> int:
+    """Bitmask of the CAP_* operations an integration implements"""
+    caps = 0
+    for flag, method in _CAPABILITY_METHODS.items():
+        if hasattr(platform, method):
+            caps |= flag
+    if caps & CAP_CONTROL and 'user_id' in inspect.signature(platform.control_device).parameters:
+        caps |= CAP_USER_CONTROL
+    return caps
+
 class PlatformStatus(Enum):
     """Smart home platform status"""
     CONNECTED = "connected"
@@ -30,7 +76,7 @@ class PlatformStatus(Enum):
     ERROR = "error"
     MAINTENANCE = "maintenance"
 
-@dataclass
+@dataclass(slots=True)
 class SmartHomeStats:
     """Smart home system statistics"""
     total_devices: int = 0
@@ -40,6 +86,18 @@ class SmartHomeStats:
     energy_saved_today: float = 0.0
     commands_processed_today: int = 0
     last_updated: datetime = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary without asdict()'s reflective deep copy"""
+        return {
+            "total_devices": self.total_devices,
+            "active_devices": self.active_devices,
+            "platforms_connected": self.platforms_connected,
+            "automations_active": self.automations_active,
+            "energy_saved_today": self.energy_saved_today,
+            "commands_processed_today": self.commands_processed_today,
+            "last_updated": self.last_updated
+        }
 
 class SmartHomeManager:
     """
@@ -49,15 +107,38 @@ class SmartHomeManager:
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
+        # Integrations are built on first use from the factories of enabled platforms
         self.platforms: Dict[str, Any] = {}
+        self._platform_factories: Dict[str, Callable[[], Any]] = {}
+        self._platform_caps: Dict[str, int] = {}
+        # Platforms whose integration failed to construct: name -> error, never retried
+        self._failed_platforms: Dict[str, str] = {}
+        
+        # One connection pool (keep-alive, DNS cache) shared by every platform integration
+        self._http: Optional[aiohttp.ClientSession] = None
         self.device_registry = DeviceRegistry()
         self.automation_engine = AutomationEngine()
         self.cache_manager = CacheManager()
         
         # System statistics
         self.stats = SmartHomeStats()
+        # Serialized stats, rebuilt only after a change through _update_stats
+        self._stats_dict: Dict[str, Any] = {}
+        self._stats_dirty = True
         self.startup_time = datetime.utcnow()
-        self.command_history: List[Dict[str, Any]] = []
+        # Bounded history; timestamps are kept alongside in append (time) order for bisect
+        self.command_history: deque = deque(maxlen=1000)
+        self._history_ts: deque = deque(maxlen=1000)
+        
+        # Command logs are queued on the request path and moved into the history by a background task
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=config.get('command_log_queue_size', 10000))
+        self._log_consumer_task: Optional[asyncio.Task] = None
+        
+        # Caps in-flight discovery calls so large fan-outs don't starve connection pools
+        self._discover_sem = asyncio.Semaphore(config.get('max_concurrent_discoveries', 8))
+        
+        # Single-flight refill of the cached platform status
+        self._platform_status_lock = asyncio.Lock()
         
         # Initialize platforms
         self._initialize_platforms()
@@ -65,72 +146,110 @@ class SmartHomeManager:
         logger.info("🏠 Smart Home Manager initialized")
     
     def _initialize_platforms(self):
-        """Initialize all configured smart home platforms"""
+        """Register factories for all configured smart home platforms"""
         try:
             # Samsung SmartThings
             smartthings_config = self.config.get('samsung_smartthings', {})
             if smartthings_config.get('enabled', True):
-                self.platforms['smartthings'] = SmartThingsIntegration(smartthings_config)
-                logger.info("✅ Samsung SmartThings integration initialized")
+                self._platform_factories['smartthings'] = lambda: SmartThingsIntegration(
+                    smartthings_config, session=self._get_http()
+                )
             
             # Philips Hue
             hue_config = self.config.get('philips_hue', {})
             if hue_config.get('enabled', True):
-                self.platforms['hue'] = PhilipsHueIntegration(hue_config)
-                logger.info("✅ Philips Hue integration initialized")
+                self._platform_factories['hue'] = lambda: PhilipsHueIntegration(
+                    hue_config, session=self._get_http()
+                )
             
             # Tuya Platform
             tuya_config = self.config.get('tuya', {})
             if tuya_config.get('enabled', True):
-                self.platforms['tuya'] = TuyaIntegration(tuya_config)
-                logger.info("✅ Tuya integration initialized")
+                self._platform_factories['tuya'] = lambda: TuyaIntegration(tuya_config)
             
-            self.stats.platforms_connected = len(self.platforms)
+            self.stats.platforms_connected = len(self._platform_factories)
             
         except Exception as e:
             logger.error(f"Failed to initialize smart home platforms: {e}")
     
+    def _get_http(self) -> aiohttp.ClientSession:
+        """Shared HTTP session, created inside the running event loop on first use"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.config.get('http_pool_size', 100),
+                    ttl_dns_cache=300
+                )
+            )
+        return self._http
+    
+    def _get_platform(self, platform_name: str) -> Optional[Any]:
+        """Integration for an enabled platform, constructed on first access"""
+        platform = self.platforms.get(platform_name)
+        if platform is None and platform_name in self._platform_factories and platform_name not in self._failed_platforms:
+            try:
+                platform = self._platform_factories[platform_name]()
+            except Exception as e:
+                logger.error(f"Failed to initialize {platform_name} integration: {e}")
+                self._failed_platforms[platform_name] = str(e)
+                self._update_stats(platforms_connected=self.stats.platforms_connected - 1)
+                return None
+            self.platforms[platform_name] = platform
+            self._platform_caps[platform_name] = _platform_capabilities(platform)
+            logger.info(f"✅ {platform_name} integration initialized")
+        return platform
+    
+    def _all_platforms(self) -> List[Tuple[str, Any]]:
+        """Every enabled platform that could be constructed, building any not yet used"""
+        platform_items = []
+        for platform_name in self._platform_factories:
+            platform = self._get_platform(platform_name)
+            if platform is not None:
+                platform_items.append((platform_name, platform))
+        return platform_items
+    
     async def discover_all_devices(self, user_id: str) -> Dict[str, List[Dict[str, Any]]]:
         """Discover devices from all connected platforms"""
         try:
             logger.info(f"🔍 Discovering devices for user {user_id}")
             
             all_devices = {}
-            discovery_tasks = []
+            platform_items = self._all_platforms()
             
             # Run device discovery concurrently across all platforms
-            for platform_name, platform in self.platforms.items():
-                task = self._discover_platform_devices(platform_name, platform, user_id)
-                discovery_tasks.append(task)
-            
-            # Wait for all discovery tasks
-            platform_results = await asyncio.gather(*discovery_tasks, return_exceptions=True)
+            platform_results = await asyncio.gather(
+                *(self._discover_platform_devices(platform_name, platform, user_id)
+                  for platform_name, platform in platform_items),
+                return_exceptions=True
+            )
             
             # Process results
-            for i, result in enumerate(platform_results):
-                platform_name = list(self.platforms.keys())[i]
-                
+            smart_devices = []
+            for (platform_name, platform), result in zip(platform_items, platform_results):
                 if isinstance(result, Exception):
                     logger.error(f"Device discovery failed for {platform_name}: {result}")
                     all_devices[platform_name] = []
                 else:
                     all_devices[platform_name] = result
-                    
-                    # Register devices in central registry
-                    for device in result:
-                        smart_device = SmartDevice.from_api_data(device, platform_name)
-                        await self.device_registry.register_device(smart_device)
+                    smart_devices.append([SmartDevice.from_api_data(device, platform_name) for device in result])
+            
+            # Register devices in central registry, one at a time: DeviceRegistry offers
+            # neither a bulk call nor a guarantee that concurrent registration is safe
+            for smart_device in chain.from_iterable(smart_devices):
+                await self.device_registry.register_device(smart_device)
             
             # Update statistics
-            total_devices = sum(len(devices) for devices in all_devices.values())
-            self.stats.total_devices = total_devices
-            self.stats.active_devices = await self.device_registry.get_active_device_count()
-            self.stats.last_updated = datetime.utcnow()
+            total_devices = sum(map(len, all_devices.values()))
+            self._update_stats(
+                total_devices=total_devices,
+                active_devices=await self.device_registry.get_active_device_count(),
+                last_updated=datetime.utcnow()
+            )
             
             # Track metrics
             track_smart_home_metrics("device_discovery", {
                 "user_id": user_id,
-                "platforms": len(self.platforms),
+                "platforms": len(platform_items),
                 "devices_found": total_devices,
                 "success": True
             })
@@ -149,8 +268,9 @@ class SmartHomeManager:
     async def _discover_platform_devices(self, platform_name: str, platform: Any, user_id: str) -> List[Dict[str, Any]]:
         """Discover devices from specific platform"""
         try:
-            if hasattr(platform, 'discover_devices'):
-                return await platform.discover_devices(user_id)
+            if self._platform_caps[platform_name] & CAP_DISCOVER:
+                async with self._discover_sem:
+                    return await platform.discover_devices(user_id)
             else:
                 logger.warning(f"Platform {platform_name} doesn't support device discovery")
                 return []
@@ -167,16 +287,19 @@ class SmartHomeManager:
                 return {"error": "Device not found", "device_id": device_id}
             
             # Get platform integration
-            platform = self.platforms.get(device.platform)
+            platform = self._get_platform(device.platform)
             if not platform:
                 return {"error": f"Platform {device.platform} not available", "device_id": device_id}
             
             logger.info(f"🎮 Controlling device {device_id}: {command}")
             
             # Execute command
-            start_time = datetime.utcnow()
-            result = await platform.control_device(device_id, command, parameters or {})
-            execution_time = (datetime.utcnow() - start_time).total_seconds()
+            start_ns = time.perf_counter_ns()
+            if self._platform_caps[device.platform] & CAP_USER_CONTROL:
+                result = await platform.control_device(device_id, command, parameters or {}, user_id=user_id)
+            else:
+                result = await platform.control_device(device_id, command, parameters or {})
+            execution_time = (time.perf_counter_ns() - start_ns) / 1e9
             
             # Log command execution
             command_log = {
@@ -188,12 +311,12 @@ class SmartHomeManager:
                 "timestamp": datetime.utcnow(),
                 "user_id": user_id
             }
-            self.command_history.append(command_log)
+            self._record_command(command_log)
             
             # Update device state if successful
             if result.get('success', False):
                 await self.device_registry.update_device_state(device_id, result.get('new_state', {}))
-                self.stats.commands_processed_today += 1
+                self._update_stats(commands_processed_today=self.stats.commands_processed_today + 1)
             
             # Track metrics
             track_smart_home_metrics("device_control", {
@@ -211,6 +334,26 @@ class SmartHomeManager:
             logger.error(f"Device control failed for {device_id}: {e}")
             return {"error": str(e), "device_id": device_id}
     
+    def _record_command(self, command_log: Dict[str, Any]):
+        """Queue a command for the history consumer, dropping it if the queue is full"""
+        if self._log_consumer_task is None:
+            self._log_consumer_task = asyncio.create_task(self._drain_logs())
+        
+        try:
+            self._log_queue.put_nowait(command_log)
+        except asyncio.QueueFull:
+            logger.warning("Command log queue full, dropping entry")
+    
+    def _append_history(self, command_log: Dict[str, Any]):
+        """Append a command to the bounded history"""
+        self.command_history.append(command_log)
+        self._history_ts.append(command_log['timestamp'])
+    
+    async def _drain_logs(self):
+        """Background consumer moving queued command logs into the history"""
+        while True:
+            self._append_history(await self._log_queue.get())
+    
     async def activate_scene(self, scene_name: str, user_id: str = None) -> Dict[str, Any]:
         """Activate smart home scene across multiple platforms"""
         try:
@@ -221,21 +364,28 @@ class SmartHomeManager:
             if not scene_config:
                 return {"error": f"Scene '{scene_name}' not found"}
             
-            # Execute scene actions across platforms
-            scene_results = []
-            for action in scene_config.get('actions', []):
-                platform = action.get('platform')
-                device_id = action.get('device_id')
-                command = action.get('command')
-                parameters = action.get('parameters', {})
-                
-                if platform in self.platforms:
-                    result = await self.control_device(device_id, command, parameters, user_id)
-                    scene_results.append({
-                        "device_id": device_id,
-                        "platform": platform,
-                        "result": result
-                    })
+            # Execute scene actions across platforms concurrently
+            actions = [
+                action for action in scene_config.get('actions', [])
+                if action.get('platform') in self._platform_factories
+            ]
+            results = await asyncio.gather(
+                *(
+                    self.control_device(action.get('device_id'), action.get('command'),
+                                        action.get('parameters', {}), user_id)
+                    for action in actions
+                ),
+                return_exceptions=True
+            )
+            
+            scene_results = [
+                {
+                    "device_id": action.get('device_id'),
+                    "platform": action.get('platform'),
+                    "result": {"success": False, "error": str(result)} if isinstance(result, Exception) else result
+                }
+                for action, result in zip(actions, results)
+            ]
             
             # Calculate success rate
             successful_actions = sum(1 for r in scene_results if r['result'].get('success', False))
@@ -248,7 +398,7 @@ class SmartHomeManager:
                 "successful_actions": successful_actions,
                 "success_rate": success_rate,
                 "results": scene_results,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": _now_ms()
             }
             
         except Exception as e:
@@ -273,13 +423,33 @@ class SmartHomeManager:
             logger.error(f"Device search failed: {e}")
             return []
     
-    def get_platform_status(self) -> Dict[str, Dict[str, Any]]:
-        """Get status of all smart home platforms"""
+    async def get_platform_status(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get status of all smart home platforms
+        Cached for platform_status_ttl seconds so polling dashboards don't hit every integration
+        """
+        cached = await self.cache_manager.get('platform_status')
+        if cached is not None:
+            return cached
+        
+        async with self._platform_status_lock:
+            # Another caller may have refilled the cache while we waited
+            cached = await self.cache_manager.get('platform_status')
+            if cached is not None:
+                return cached
+            
+            platform_status = self._collect_platform_status()
+            await self.cache_manager.set('platform_status', platform_status,
+                                         ttl=self.config.get('platform_status_ttl', 2))
+            return platform_status
+    
+    def _collect_platform_status(self) -> Dict[str, Dict[str, Any]]:
+        """Query each platform for its current status"""
         platform_status = {}
         
         for platform_name, platform in self.platforms.items():
             try:
-                if hasattr(platform, 'get_status'):
+                if self._platform_caps[platform_name] & CAP_STATUS:
                     status = platform.get_status()
                 else:
                     status = {"status": "unknown", "message": "Status check not implemented"}
@@ -289,33 +459,48 @@ class SmartHomeManager:
                 platform_status[platform_name] = {
                     "status": "error",
                     "message": str(e),
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": _now_ms()
                 }
         
         return platform_status
     
+    def _update_stats(self, **changes: Any):
+        """Set stats fields and mark the serialized view stale"""
+        for field, value in changes.items():
+            setattr(self.stats, field, value)
+        self._stats_dirty = True
+    
+    def _stats_view(self) -> Dict[str, Any]:
+        """Serialized stats, refreshed only if a field changed since the last call"""
+        if self._stats_dirty:
+            self._stats_dict = self.stats.to_dict()
+            self._stats_dirty = False
+        return self._stats_dict
+    
     def get_system_stats(self) -> Dict[str, Any]:
         """Get smart home system statistics"""
-        uptime = (datetime.utcnow() - self.startup_time).total_seconds()
+        now = datetime.utcnow()
+        uptime = (now - self.startup_time).total_seconds()
+        recent_start = bisect.bisect_left(self._history_ts, now - timedelta(hours=1))
         
         return {
-            "system_stats": asdict(self.stats),
-            "platform_count": len(self.platforms),
-            "platform_names": list(self.platforms.keys()),
+            "system_stats": self._stats_view(),
+            "platform_count": len(self._platform_factories),
+            "platform_names": list(self._platform_factories),
+            "failed_platforms": dict(self._failed_platforms),
             "uptime_seconds": uptime,
-            "recent_commands": len([cmd for cmd in self.command_history 
-                                   if cmd['timestamp'] > datetime.utcnow() - timedelta(hours=1)]),
+            "recent_commands": len(self._history_ts) - recent_start,
             "system_health": "healthy" if self.stats.platforms_connected > 0 else "degraded"
         }
     
     async def authenticate_platform(self, platform: str, user_id: str) -> Dict[str, Any]:
         """Authenticate user with specific smart home platform"""
         try:
-            if platform not in self.platforms:
+            integration = self._get_platform(platform)
+            if integration is None:
                 return {"error": f"Platform {platform} not supported"}
             
-            integration = self.platforms[platform]
-            if hasattr(integration, 'authenticate'):
+            if self._platform_caps[platform] & CAP_AUTH:
                 return await integration.authenticate(user_id)
             else:
                 return {"error": f"Platform {platform} doesn't support authentication"}
@@ -329,30 +514,33 @@ class SmartHomeManager:
         try:
             logger.info("🔄 Synchronizing all smart home platforms")
             
-            sync_results = {}
-            sync_tasks = []
-            
-            for platform_name, platform in self.platforms.items():
-                if hasattr(platform, 'sync_devices'):
-                    task = platform.sync_devices(user_id)
-                    sync_tasks.append((platform_name, task))
+            platforms = [
+                (platform_name, platform) for platform_name, platform in self._all_platforms()
+                if self._platform_caps[platform_name] & CAP_SYNC
+            ]
+            platform_names = [platform_name for platform_name, _ in platforms]
+            
+            # Platform syncs and the registry refresh overlap on the network
+            *results, refresh_result = await asyncio.gather(
+                *(platform.sync_devices(user_id) for _, platform in platforms),
+                self.device_registry.refresh_all_devices(),
+                return_exceptions=True
+            )
             
-            # Wait for all sync operations
-            for platform_name, task in sync_tasks:
-                try:
-                    result = await task
-                    sync_results[platform_name] = result
-                except Exception as e:
-                    logger.error(f"Sync failed for {platform_name}: {e}")
-                    sync_results[platform_name] = {"error": str(e)}
+            sync_results = {}
+            for platform_name, result in zip(platform_names, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Sync failed for {platform_name}: {result}")
+                    result = {"error": str(result)}
+                sync_results[platform_name] = result
             
-            # Update device registry with latest states
-            await self.device_registry.refresh_all_devices()
+            if isinstance(refresh_result, Exception):
+                logger.error(f"Device registry refresh failed: {refresh_result}")
             
             return {
                 "success": True,
                 "sync_results": sync_results,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": _now_ms()
             }
             
         except Exception as e:
@@ -370,32 +558,27 @@ class SmartHomeManager:
     async def get_energy_analytics(self, timeframe: str = "today") -> Dict[str, Any]:
         """Get energy usage analytics"""
         try:
-            # Collect energy data from all platforms
-            energy_data = {}
-            
-            for platform_name, platform in self.platforms.items():
-                if hasattr(platform, 'get_energy_data'):
-                    platform_energy = await platform.get_energy_data(timeframe)
-                    energy_data[platform_name] = platform_energy
-            
-            # Calculate totals and savings
-            total_consumption = sum(
-                data.get('total_kwh', 0) 
-                for data in energy_data.values() 
-                if isinstance(data, dict)
-            )
-            
-            total_cost = sum(
-                data.get('total_cost', 0) 
-                for data in energy_data.values() 
-                if isinstance(data, dict)
+            # Collect energy data from all platforms concurrently
+            platforms = [
+                (platform_name, platform) for platform_name, platform in self._all_platforms()
+                if self._platform_caps[platform_name] & CAP_ENERGY
+            ]
+            results = await asyncio.gather(
+                *(platform.get_energy_data(timeframe) for _, platform in platforms),
+                return_exceptions=True
             )
+            energy_data = {
+                platform_name: {"error": str(result)} if isinstance(result, Exception) else result
+                for (platform_name, _), result in zip(platforms, results)
+            }
             
-            estimated_savings = sum(
-                data.get('estimated_savings', 0) 
-                for data in energy_data.values() 
-                if isinstance(data, dict)
-            )
+            # Calculate totals and savings in one pass
+            total_consumption = total_cost = estimated_savings = 0.0
+            for data in energy_data.values():
+                if isinstance(data, dict):
+                    total_consumption += data.get('total_kwh', 0)
+                    total_cost += data.get('total_cost', 0)
+                    estimated_savings += data.get('estimated_savings', 0)
             
             return {
                 "timeframe": timeframe,
@@ -403,7 +586,7 @@ class SmartHomeManager:
                 "total_cost": round(total_cost, 2),
                 "estimated_savings": round(estimated_savings, 2),
                 "platform_breakdown": energy_data,
-                "last_updated": datetime.utcnow().isoformat()
+                "last_updated": _now_ms()
             }
             
         except Exception as e:
@@ -426,11 +609,7 @@ class SmartHomeManager:
                 "timestamp": datetime.utcnow(),
                 "processing_time": result.get('processing_time', 0)
             }
-            self.command_history.append(command_log)
-            
-            # Keep command history manageable
-            if len(self.command_history) > 1000:
-                self.command_history = self.command_history[-800:]
+            self._record_command(command_log)
             
             return result
             
@@ -438,17 +617,18 @@ class SmartHomeManager:
             logger.error(f"Smart command execution failed: {e}")
             return {"error": str(e), "command": command}
     
-    def get_health_status(self) -> Dict[str, Any]:
+    async def get_health_status(self) -> Dict[str, Any]:
         """Get smart home system health status"""
         try:
-            platform_health = self.get_platform_status()
+            platform_health = await self.get_platform_status()
             
             healthy_platforms = sum(
                 1 for status in platform_health.values() 
                 if status.get('status') == 'connected'
             )
             
-            system_health = "healthy" if healthy_platforms > 0 else "unhealthy"
+            # Only platforms in use are checked; none in use yet is not a failure
+            system_health = "healthy" if healthy_platforms > 0 or not self.platforms else "unhealthy"
             if healthy_platforms < len(self.platforms):
                 system_health = "degraded"
             
@@ -459,7 +639,7 @@ class SmartHomeManager:
                 "devices_active": self.stats.active_devices,
                 "devices_total": self.stats.total_devices,
                 "uptime": (datetime.utcnow() - self.startup_time).total_seconds(),
-                "last_command": self.command_history[-1]['timestamp'].isoformat() if self.command_history else None,
+                "last_command": _datetime_ms(self.command_history[-1]['timestamp']) if self.command_history else None,
                 "platform_details": platform_health
             }
             
@@ -468,7 +648,7 @@ class SmartHomeManager:
             return {
                 "status": "error",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": _now_ms()
             }
     
     async def shutdown(self):
@@ -476,16 +656,33 @@ class SmartHomeManager:
         try:
             logger.info("🛑 Shutting down Smart Home Manager")
             
-            # Shutdown all platforms
-            shutdown_tasks = []
-            for platform_name, platform in self.platforms.items():
-                if hasattr(platform, 'shutdown'):
-                    shutdown_tasks.append(platform.shutdown())
-            
-            await asyncio.gather(*shutdown_tasks, return_exceptions=True)
+            # Shutdown all platforms, saving final statistics alongside
+            shutdown_tasks = [
+                platform.shutdown() for platform_name, platform in self.platforms.items()
+                if self._platform_caps[platform_name] & CAP_SHUTDOWN
+            ]
+            shutdown_tasks.append(self.cache_manager.set('smart_home_final_stats', self._stats_view()))
             
-            # Save final statistics
-            await self.cache_manager.set('smart_home_final_stats', asdict(self.stats))
+            # A hung platform must not block process exit; wait_for cancels what is left
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*shutdown_tasks, return_exceptions=True),
+                    timeout=self.config.get('shutdown_timeout', 5.0)
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Smart home platform shutdown timed out, forcing")
+            
+            # Platforms are down, so nothing else uses the shared session
+            if self._http is not None and not self._http.closed:
+                await self._http.close()
+            self._http = None
+            
+            # Stop the log consumer and keep whatever it hadn't picked up yet
+            if self._log_consumer_task is not None:
+                self._log_consumer_task.cancel()
+                self._log_consumer_task = None
+            while not self._log_queue.empty():
+                self._append_history(self._log_queue.get_nowait())
             
             logger.info("✅ Smart Home Manager shutdown complete")
             
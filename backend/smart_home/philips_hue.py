@@ -5,37 +5,117 @@ Advanced Hue lighting control with OpenHue API support
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import json
-import colorsys
+import time
+from typing import Callable, Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from functools import lru_cache
 
 import aiohttp
 from aiohttp import ClientSession, ClientTimeout
+from yarl import URL
 import zeroconf
-from zeroconf import ServiceBrowser, Listener
+from zeroconf import ServiceListener
+from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo, AsyncZeroconf
+
+from ..integrations.base_integration import AsyncTokenBucket, json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
-class HueBridgeListener(Listener):
-    """Zeroconf listener for Hue bridge discovery"""
+# Bridge answers when it is shedding load; retried with exponential backoff
+HUE_RETRY_STATUSES = frozenset({429, 503})
+
+# Request bodies are pre-serialized with json_dumps (orjson when available)
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Event stream connections stay open indefinitely; no total or read deadline
+EVENTSTREAM_TIMEOUT = ClientTimeout(total=None, sock_read=None)
+
+MEETHUE_DISCOVERY_URL = "https://discovery.meethue.com/"
+MEETHUE_TIMEOUT = ClientTimeout(total=2.0, connect=1.0)
+
+# Response timestamps are reused for up to half a second: [computed_at, iso string]
+_last_iso_ts = [0.0, ""]
+
+def _percent_to_hue(value: float) -> int:
+    """Clamp 0-100 and scale to the Hue 0-254 range with integer math"""
+    return (min(100, max(0, int(value))) * 254) // 100
+
+def _degrees_to_hue(value: float) -> int:
+    """Clamp 0-360 degrees and scale to the Hue 0-65535 range with integer math"""
+    return (min(360, max(0, int(value))) * 65535) // 360
+
+@lru_cache(maxsize=512)
+def _rgb_to_hsb(r: int, g: int, b: int) -> Tuple[int, int, int]:
+    """8-bit RGB to Hue (hue 0-65535, sat 0-254, bri 0-254) in integer math; scene palettes hit the cache"""
+    maxc = max(r, g, b)
+    minc = min(r, g, b)
+    bri = (maxc * 254) // 255
+    if maxc == minc:
+        return 0, 0, bri
+    
+    d = maxc - minc
+    sat = (d * 254) // maxc
+    
+    # Hue position in sixths of the color wheel (d units per sixth)
+    if r == maxc:
+        n = g - b
+        if n < 0:
+            n += 6 * d
+    elif g == maxc:
+        n = 2 * d + b - r
+    else:
+        n = 4 * d + r - g
+    
+    return (n * 65535) // (6 * d), sat, bri
+
+def _iso_now() -> str:
+    """Current UTC time as a naive ISO string, recomputed at most every 0.5s"""
+    now = time.time()
+    if now - _last_iso_ts[0] > 0.5:
+        _last_iso_ts[0] = now
+        _last_iso_ts[1] = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None).isoformat()
+    return _last_iso_ts[1]
+
+class HueBridgeListener(ServiceListener):
+    """
+    Zeroconf listener for Hue bridge discovery
+    Callbacks run on the event loop (AsyncServiceBrowser); service info is resolved in tasks
+    """
     
     def __init__(self):
-        self.bridges = []
+        self.bridges: Dict[str, Dict[str, Any]] = {}  # bridge_id -> bridge
+        self.found = asyncio.Event()
+        self._pending = set()
     
     def add_service(self, zc: zeroconf.Zeroconf, type_: str, name: str) -> None:
-        info = zc.get_service_info(type_, name)
-        if info and 'hue-bridgeid' in info.properties:
+        task = asyncio.get_running_loop().create_task(self._resolve(zc, type_, name))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+    
+    def update_service(self, zc: zeroconf.Zeroconf, type_: str, name: str) -> None:
+        pass
+    
+    def remove_service(self, zc: zeroconf.Zeroconf, type_: str, name: str) -> None:
+        pass
+    
+    async def _resolve(self, zc: zeroconf.Zeroconf, type_: str, name: str):
+        info = AsyncServiceInfo(type_, name)
+        if not await info.async_request(zc, 2000):
+            return
+        
+        if b'hue-bridgeid' in info.properties:
             bridge_id = info.properties[b'hue-bridgeid'].decode('utf-8')
             bridge_ip = str(info.parsed_addresses()[0]) if info.parsed_addresses() else None
             
-            if bridge_ip:
-                self.bridges.append({
+            if bridge_ip and bridge_id not in self.bridges:
+                self.bridges[bridge_id] = {
                     'id': bridge_id,
                     'ip': bridge_ip,
                     'port': info.port,
                     'name': info.name
-                })
+                }
+                self.found.set()
 
 class PhilipsHueIntegration:
     """
@@ -43,8 +123,11 @@ class PhilipsHueIntegration:
     Advanced lighting control with bridge discovery and OpenHue API
     """
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[ClientSession] = None):
         self.config = config
+        # Keep-alive HTTP session: shared one from the caller, else created lazily
+        self._session = session
+        self._owns_session = session is None
         self.auto_discover = config.get('auto_discover', True)
         self.bridge_ip = config.get('bridge_ip')
         self.username = config.get('username')  # Hue bridge username
@@ -53,59 +136,193 @@ class PhilipsHueIntegration:
         self.bridges: Dict[str, Dict[str, Any]] = {}
         self.authenticated_bridges: Dict[str, str] = {}  # bridge_id -> username
         
-        # Device cache
-        self.light_cache: Dict[str, Dict[str, Any]] = {}
-        self.sensor_cache: Dict[str, Dict[str, Any]] = {}
+        # Device cache, LRU-bounded so churning bridges can't grow it without limit
+        self.light_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.sensor_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.light_cache_size = config.get('light_cache_size', 512)
+        self.sensor_cache_size = config.get('sensor_cache_size', 128)
+        # Bridges not seen by discovery for this long are forgotten
+        self.bridge_ttl = config.get('bridge_ttl', 24 * 3600)
         self.scene_cache: Dict[str, Dict[str, Any]] = {}
+        self._scene_to_bridge: Dict[str, str] = {}  # scene_id -> bridge_id
+        
+        # Parsed API base per (bridge_ip, username); request URLs are built with yarl's / operator
+        self._bridge_bases: Dict[Tuple[str, str], URL] = {}
+        # Full bridge payloads are only kept on cached devices when debugging
+        self.retain_raw = config.get('retain_raw', False)
+        
+        # Recent /lights and /sensors responses: (bridge_id, resource) -> (fetched_at, data)
+        self._snapshot: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._snapshot_ttl = config.get('snapshot_ttl', 5.0)
+        
+        # Per-bridge command budgets: (bridge_id, 'lights' | 'groups') -> bucket
+        self._bridge_limiters: Dict[Tuple[str, str], AsyncTokenBucket] = {}
+        self._command_rates = {
+            'lights': config.get('light_commands_per_second', 10.0),
+            'groups': config.get('group_commands_per_second', 1.0)
+        }
+        self.max_retries = config.get('max_retries', 3)
+        
+        # Pushed state updates (Hue v2 event stream) instead of polling, one task per bridge
+        self.use_event_stream = config.get('event_stream', True)
+        self.event_stream_retry = config.get('event_stream_retry', 5.0)
+        self._event_tasks: Dict[str, asyncio.Task] = {}
+        self._event_subscribers: List[asyncio.Queue] = []
+        self.event_queue_size = config.get('event_queue_size', 256)
+        
+        # Command -> payload builder; only the requested command's payload is computed
+        self._command_builders: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            "turn_on": lambda p: {"on": True},
+            "turn_off": lambda p: {"on": False},
+            "set_brightness": lambda p: {
+                "on": True,
+                "bri": _percent_to_hue(p.get('brightness', 50))
+            },
+            "set_color": lambda p: {
+                "on": True,
+                "hue": _degrees_to_hue(p.get('hue', 0)),
+                "sat": _percent_to_hue(p.get('saturation', 100))
+            },
+            "set_color_temp": lambda p: {
+                "on": True,
+                "ct": p.get('color_temp', 300)  # Mireds
+            },
+            "set_rgb": lambda p: {
+                "on": True,
+                **self._rgb_to_hue(p.get('red', 255), p.get('green', 255), p.get('blue', 255))
+            }
+        }
         
         # Statistics
         self.commands_sent = 0
         self.successful_commands = 0
         self.discovery_attempts = 0
+        self._meethue_last_failure = float('-inf')
+        self.meethue_cooldown = config.get('meethue_cooldown', 60.0)
+        
+        # Caps how many bridges are queried at once
+        self._bridge_sem = asyncio.Semaphore(config.get('max_concurrent_bridges', 4))
         
-        # Start bridge discovery if enabled
-        if self.auto_discover:
-            asyncio.create_task(self._discover_bridges())
+        # Bridge discovery runs from start() - not here, where there may be no event loop - and then
+        # every rediscovery_interval seconds (0 disables), which refreshes IPs and ages out bridge_ttl
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self.rediscovery_interval = config.get('rediscovery_interval', 3600)
+        self._rediscovery_task: Optional[asyncio.Task] = None
         
         logger.info("💡 Philips Hue integration initialized")
     
+    async def start(self):
+        """
+        Run bridge discovery (if auto_discover) and schedule periodic rediscovery
+        Called lazily by discover_devices/authenticate_bridge, or use `async with PhilipsHueIntegration(config)`
+        """
+        async with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            if self.auto_discover:
+                await self._discover_bridges()
+                if self.rediscovery_interval > 0:
+                    self._rediscovery_task = asyncio.create_task(self._rediscover_bridges())
+    
+    async def _rediscover_bridges(self):
+        """Re-run bridge discovery every rediscovery_interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.rediscovery_interval)
+            await self._discover_bridges()
+    
+    async def __aenter__(self) -> "PhilipsHueIntegration":
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
+    
+    async def _get_session(self) -> ClientSession:
+        """Get the keep-alive HTTP session used for all bridge requests"""
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=8,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True
+                ),
+                timeout=ClientTimeout(total=5)
+            )
+            self._owns_session = True
+        return self._session
+    
+    def _bridge_base(self, bridge_ip: str, username: str) -> URL:
+        """Parsed http://<bridge>/api/<username> URL, built once per bridge user"""
+        key = (bridge_ip, username)
+        base = self._bridge_bases.get(key)
+        if base is None:
+            base = self._bridge_bases[key] = URL(f"http://{bridge_ip}/api/{username}")
+        return base
+    
+    def _bridge_limiter(self, bridge_id: str, endpoint: str) -> AsyncTokenBucket:
+        """Token bucket for one bridge endpoint class, created on first use"""
+        key = (bridge_id, endpoint)
+        limiter = self._bridge_limiters.get(key)
+        if limiter is None:
+            rate = self._command_rates[endpoint]
+            limiter = self._bridge_limiters[key] = AsyncTokenBucket(rate=rate, capacity=rate)
+        return limiter
+    
+    async def _bridge_put(self, bridge_id: str, endpoint: str, url: URL, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        """
+        PUT to a bridge within its command budget, backing off while it reports overload
+        Returns (status, parsed JSON on 200 else response text)
+        """
+        session = await self._get_session()
+        for attempt in range(self.max_retries + 1):
+            await self._bridge_limiter(bridge_id, endpoint).acquire()
+            async with session.put(url, data=json_dumps(payload), headers=JSON_HEADERS) as response:
+                if response.status == 200:
+                    return response.status, json_loads(await response.read())
+                if response.status not in HUE_RETRY_STATUSES or attempt == self.max_retries:
+                    return response.status, await response.text()
+            await asyncio.sleep(min(2 ** attempt, 8))
+    
     async def _discover_bridges(self) -> List[Dict[str, Any]]:
         """Discover Hue bridges on network using mDNS"""
         try:
             self.discovery_attempts += 1
             logger.info("🔍 Discovering Hue bridges on network...")
             
-            # Method 1: Zeroconf (mDNS) discovery
-            zc = zeroconf.Zeroconf()
+            # Method 1: Zeroconf (mDNS) discovery, on the event loop
+            aiozc = AsyncZeroconf()
             listener = HueBridgeListener()
-            browser = ServiceBrowser(zc, "_hue._tcp.local.", listener)
-            
-            # Wait for discovery
-            await asyncio.sleep(3)
+            browser = AsyncServiceBrowser(aiozc.zeroconf, "_hue._tcp.local.", listener)
             
-            # Method 2: Hue discovery service
-            async with ClientSession() as session:
-                try:
-                    async with session.get("https://discovery.meethue.com/", timeout=ClientTimeout(total=5)) as response:
-                        if response.status == 200:
-                            discovery_data = await response.json()
-                            for bridge_info in discovery_data:
-                                listener.bridges.append({
-                                    'id': bridge_info.get('id'),
-                                    'ip': bridge_info.get('internalipaddress'),
-                                    'port': 80,
-                                    'name': f"Hue Bridge {bridge_info.get('id', '')[:6]}"
-                                })
-                except:
-                    logger.warning("Hue discovery service unavailable")
-            
-            # Store discovered bridges
-            for bridge in listener.bridges:
+            try:
+                # Method 2: Hue discovery service, in parallel with mDNS
+                cloud_bridges, _ = await asyncio.gather(
+                    self._discover_cloud_bridges(),
+                    self._wait_for_mdns_bridge(listener)
+                )
+            finally:
+                # Cleanup
+                await browser.async_cancel()
+                await aiozc.async_close()
+            
+            # Store discovered bridges; mDNS entries win over meethue.com ones (they carry the port)
+            discovered = dict(listener.bridges)
+            for bridge in cloud_bridges:
                 if bridge['id'] and bridge['ip']:
-                    self.bridges[bridge['id']] = bridge
+                    discovered.setdefault(bridge['id'], bridge)
+            
+            now = time.time()
+            for bridge in discovered.values():
+                bridge['last_seen'] = now
+            self.bridges.update(discovered)
             
-            # Cleanup
-            zc.close()
+            # Forget bridges that have been gone for longer than bridge_ttl
+            for bridge_id in [bridge_id for bridge_id, bridge in self.bridges.items()
+                              if now - bridge.get('last_seen', now) > self.bridge_ttl]:
+                del self.bridges[bridge_id]
             
             logger.info(f"💡 Discovered {len(self.bridges)} Hue bridges")
             return list(self.bridges.values())
@@ -114,9 +331,53 @@ class PhilipsHueIntegration:
             logger.error(f"Hue bridge discovery failed: {e}")
             return []
     
+    async def _wait_for_mdns_bridge(self, listener: HueBridgeListener, timeout: float = 3.0):
+        """Wait until mDNS reports the first bridge, or the timeout passes"""
+        try:
+            await asyncio.wait_for(listener.found.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _fetch_meethue(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Bridge list from the meethue.com discovery service
+        Retries transient errors with backoff; after a failure the service is skipped for a cooldown
+        """
+        if time.monotonic() - self._meethue_last_failure < self.meethue_cooldown:
+            return None
+        
+        session = await self._get_session()
+        for attempt in range(3):
+            try:
+                async with session.get(MEETHUE_DISCOVERY_URL, timeout=MEETHUE_TIMEOUT) as response:
+                    if response.status == 200:
+                        return json_loads(await response.read())
+                    logger.warning(f"Hue discovery service returned HTTP {response.status}")
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Hue discovery service unavailable (attempt {attempt + 1}): {e}")
+                if attempt < 2:
+                    await asyncio.sleep(0.25 * 2 ** attempt)
+        
+        self._meethue_last_failure = time.monotonic()
+        return None
+    
+    async def _discover_cloud_bridges(self) -> List[Dict[str, Any]]:
+        """Bridges registered with the meethue.com discovery service"""
+        return [
+            {
+                'id': bridge_info.get('id'),
+                'ip': bridge_info.get('internalipaddress'),
+                'port': 80,
+                'name': f"Hue Bridge {bridge_info.get('id', '')[:6]}"
+            }
+            for bridge_info in await self._fetch_meethue() or []
+        ]
+    
     async def authenticate_bridge(self, bridge_id: str, user_id: str) -> Dict[str, Any]:
         """Authenticate with Hue bridge (link button process)"""
         try:
+            await self.start()
             bridge = self.bridges.get(bridge_id)
             if not bridge:
                 return {"error": "Bridge not found", "bridge_id": bridge_id}
@@ -129,111 +390,138 @@ class PhilipsHueIntegration:
                 "generateclientkey": True
             }
             
-            async with ClientSession() as session:
-                async with session.post(f"http://{bridge_ip}/api", json=auth_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
+            session = await self._get_session()
+            async with session.post(f"http://{bridge_ip}/api", data=json_dumps(auth_data), headers=JSON_HEADERS) as response:
+                if response.status == 200:
+                    result = json_loads(await response.read())
+                    
+                    if isinstance(result, list) and len(result) > 0:
+                        first_result = result[0]
                         
-                        if isinstance(result, list) and len(result) > 0:
-                            first_result = result[0]
-                            
-                            if 'error' in first_result:
-                                error = first_result['error']
-                                if error.get('type') == 101:  # Link button not pressed
-                                    return {
-                                        "status": "link_button_required",
-                                        "message": "Please press the link button on your Hue bridge and try again",
-                                        "bridge_id": bridge_id,
-                                        "bridge_ip": bridge_ip
-                                    }
-                                else:
-                                    return {"error": error.get('description', 'Authentication failed')}
-                            
-                            elif 'success' in first_result:
-                                username = first_result['success']['username']
-                                self.authenticated_bridges[bridge_id] = username
-                                
+                        if 'error' in first_result:
+                            error = first_result['error']
+                            if error.get('type') == 101:  # Link button not pressed
                                 return {
-                                    "success": True,
-                                    "username": username,
+                                    "status": "link_button_required",
+                                    "message": "Please press the link button on your Hue bridge and try again",
                                     "bridge_id": bridge_id,
                                     "bridge_ip": bridge_ip
                                 }
-                    
-                    return {"error": f"Authentication failed: HTTP {response.status}"}
-                    
+                            else:
+                                return {"error": error.get('description', 'Authentication failed')}
+                        
+                        elif 'success' in first_result:
+                            username = first_result['success']['username']
+                            self.authenticated_bridges[bridge_id] = username
+                            if self.use_event_stream and bridge_id not in self._event_tasks:
+                                self._event_tasks[bridge_id] = asyncio.create_task(self._subscribe_bridge(bridge_id))
+                            
+                            return {
+                                "success": True,
+                                "username": username,
+                                "bridge_id": bridge_id,
+                                "bridge_ip": bridge_ip
+                            }
+                
+                return {"error": f"Authentication failed: HTTP {response.status}"}
+                
         except Exception as e:
             logger.error(f"Hue bridge authentication failed: {e}")
             return {"error": str(e)}
     
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving (device_id, state changes) pushed by the bridges"""
+        queue = asyncio.Queue(maxsize=self.event_queue_size)
+        self._event_subscribers.append(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Stop delivering events to a subscriber queue"""
+        if queue in self._event_subscribers:
+            self._event_subscribers.remove(queue)
+    
+    async def _subscribe_bridge(self, bridge_id: str):
+        """Apply state changes from the bridge's v2 event stream, reconnecting until cancelled"""
+        while bridge_id in self.authenticated_bridges:
+            bridge = self.bridges.get(bridge_id)
+            if bridge:
+                try:
+                    session = await self._get_session()
+                    headers = {
+                        "hue-application-key": self.authenticated_bridges[bridge_id],
+                        "Accept": "text/event-stream"
+                    }
+                    # Bridges serve the v2 API over HTTPS with a self-signed certificate
+                    async with session.get(URL(f"https://{bridge['ip']}/eventstream/clip/v2"), headers=headers,
+                                           timeout=EVENTSTREAM_TIMEOUT, ssl=False) as response:
+                        async for line in response.content:
+                            if line.startswith(b'data:'):
+                                # A malformed payload is skipped, not allowed to end the subscription
+                                try:
+                                    self._apply_events(bridge_id, json_loads(line[5:]))
+                                except Exception as e:
+                                    logger.warning(f"Ignoring malformed Hue event from bridge {bridge_id}: {e}")
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    logger.warning(f"Hue event stream for bridge {bridge_id} dropped: {e}")
+            
+            await asyncio.sleep(self.event_stream_retry)
+    
+    def _apply_events(self, bridge_id: str, events: List[Dict[str, Any]]):
+        """Update cached light state from v2 light events and fan them out to subscribers"""
+        for event in events:
+            if event.get('type') != 'update':
+                continue
+            
+            for resource in event.get('data', []):
+                if resource.get('type') != 'light' or not resource.get('id_v1'):
+                    continue
+                
+                device_id = f"hue_{bridge_id}_{resource['id_v1'].rsplit('/', 1)[-1]}"
+                changes = {}
+                if 'on' in resource:
+                    changes['on'] = resource['on'].get('on')
+                if 'dimming' in resource:
+                    changes['bri'] = _percent_to_hue(resource['dimming'].get('brightness', 0))
+                if resource.get('color_temperature', {}).get('mirek') is not None:
+                    changes['ct'] = resource['color_temperature']['mirek']
+                if not changes:
+                    continue
+                
+                device = self.light_cache.get(device_id)
+                if device is not None:
+                    device['current_state'].update(changes)
+                self._snapshot.pop((bridge_id, "lights"), None)
+                
+                # Slow consumers are dropped rather than buffering without bound
+                for queue in list(self._event_subscribers):
+                    try:
+                        queue.put_nowait((device_id, changes))
+                    except asyncio.QueueFull:
+                        logger.warning("Hue event subscriber too slow, unsubscribing")
+                        self.unsubscribe(queue)
+    
     async def discover_devices(self, user_id: str) -> List[Dict[str, Any]]:
         """Discover all Hue lights and sensors"""
         try:
-            all_devices = []
+            await self.start()
+            bridges = [
+                (bridge_id, username, self.bridges[bridge_id]['ip'])
+                for bridge_id, username in self.authenticated_bridges.items()
+                if bridge_id in self.bridges
+            ]
             
-            for bridge_id, username in self.authenticated_bridges.items():
-                bridge = self.bridges.get(bridge_id)
-                if not bridge:
-                    continue
-                
-                bridge_ip = bridge['ip']
-                
-                async with ClientSession() as session:
-                    # Get lights
-                    async with session.get(f"http://{bridge_ip}/api/{username}/lights") as response:
-                        if response.status == 200:
-                            lights_data = await response.json()
-                            
-                            for light_id, light_info in lights_data.items():
-                                device = {
-                                    "id": f"hue_{bridge_id}_{light_id}",
-                                    "name": light_info.get('name', f'Hue Light {light_id}'),
-                                    "type": "light",
-                                    "manufacturer": "Philips",
-                                    "model": light_info.get('modelid', 'Unknown'),
-                                    "platform": "hue",
-                                    "bridge_id": bridge_id,
-                                    "bridge_ip": bridge_ip,
-                                    "light_id": light_id,
-                                    "capabilities": {
-                                        "on_off": True,
-                                        "brightness": light_info.get('state', {}).get('bri') is not None,
-                                        "color": light_info.get('state', {}).get('hue') is not None,
-                                        "color_temp": light_info.get('state', {}).get('ct') is not None
-                                    },
-                                    "status": "online" if light_info.get('state', {}).get('reachable') else "offline",
-                                    "current_state": light_info.get('state', {}),
-                                    "raw_data": light_info
-                                }
-                                
-                                all_devices.append(device)
-                                self.light_cache[device['id']] = device
-                    
-                    # Get sensors
-                    async with session.get(f"http://{bridge_ip}/api/{username}/sensors") as response:
-                        if response.status == 200:
-                            sensors_data = await response.json()
-                            
-                            for sensor_id, sensor_info in sensors_data.items():
-                                if sensor_info.get('type') in ['ZLLPresence', 'ZLLLightLevel', 'ZLLTemperature']:
-                                    device = {
-                                        "id": f"hue_{bridge_id}_{sensor_id}",
-                                        "name": sensor_info.get('name', f'Hue Sensor {sensor_id}'),
-                                        "type": "sensor",
-                                        "manufacturer": "Philips",
-                                        "model": sensor_info.get('modelid', 'Unknown'),
-                                        "platform": "hue",
-                                        "bridge_id": bridge_id,
-                                        "bridge_ip": bridge_ip,
-                                        "sensor_id": sensor_id,
-                                        "sensor_type": sensor_info.get('type'),
-                                        "status": "online" if sensor_info.get('config', {}).get('reachable') else "offline",
-                                        "current_state": sensor_info.get('state', {}),
-                                        "raw_data": sensor_info
-                                    }
-                                    
-                                    all_devices.append(device)
-                                    self.sensor_cache[device['id']] = device
+            # Bridges are independent, so query them concurrently
+            results = await asyncio.gather(
+                *(self._discover_bridge_devices(*bridge) for bridge in bridges),
+                return_exceptions=True
+            )
+            
+            all_devices = []
+            for (bridge_id, _, _), result in zip(bridges, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Hue device discovery failed for bridge {bridge_id}: {result}")
+                else:
+                    all_devices.extend(result)
             
             logger.info(f"💡 Discovered {len(all_devices)} Hue devices")
             return all_devices
@@ -242,13 +530,104 @@ class PhilipsHueIntegration:
             logger.error(f"Hue device discovery failed: {e}")
             return []
     
+    @staticmethod
+    def _cache_put(cache: "OrderedDict[str, Dict[str, Any]]", device: Dict[str, Any], max_size: int):
+        """Insert or refresh a device, evicting the least recently used beyond max_size"""
+        cache[device['id']] = device
+        cache.move_to_end(device['id'])
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+    
+    @staticmethod
+    def _cache_get(cache: "OrderedDict[str, Dict[str, Any]]", device_id: str) -> Optional[Dict[str, Any]]:
+        """Cached device, marked as recently used"""
+        device = cache.get(device_id)
+        if device is not None:
+            cache.move_to_end(device_id)
+        return device
+    
+    async def _fetch_bridge_json(self, bridge_id: str, username: str, bridge_ip: str, resource: str) -> Optional[Any]:
+        """GET a bridge resource, served from a short-lived snapshot; None unless the bridge answers 200"""
+        key = (bridge_id, resource)
+        cached = self._snapshot.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self._snapshot_ttl:
+            return cached[1]
+        
+        session = await self._get_session()
+        async with session.get(self._bridge_base(bridge_ip, username) / resource) as response:
+            if response.status == 200:
+                data = json_loads(await response.read())
+                self._snapshot[key] = (time.monotonic(), data)
+                return data
+            return None
+    
+    async def _discover_bridge_devices(self, bridge_id: str, username: str, bridge_ip: str) -> List[Dict[str, Any]]:
+        """Discover the lights and sensors of one bridge"""
+        async with self._bridge_sem:
+            lights_data, sensors_data = await asyncio.gather(
+                self._fetch_bridge_json(bridge_id, username, bridge_ip, "lights"),
+                self._fetch_bridge_json(bridge_id, username, bridge_ip, "sensors")
+            )
+        
+        devices = []
+        
+        for light_id, light_info in (lights_data or {}).items():
+            device = {
+                "id": f"hue_{bridge_id}_{light_id}",
+                "name": light_info.get('name', f'Hue Light {light_id}'),
+                "type": "light",
+                "manufacturer": "Philips",
+                "model": light_info.get('modelid', 'Unknown'),
+                "platform": "hue",
+                "bridge_id": bridge_id,
+                "bridge_ip": bridge_ip,
+                "light_id": light_id,
+                "capabilities": {
+                    "on_off": True,
+                    "brightness": light_info.get('state', {}).get('bri') is not None,
+                    "color": light_info.get('state', {}).get('hue') is not None,
+                    "color_temp": light_info.get('state', {}).get('ct') is not None
+                },
+                "status": "online" if light_info.get('state', {}).get('reachable') else "offline",
+                "current_state": light_info.get('state', {})
+            }
+            if self.retain_raw:
+                device["raw_data"] = light_info
+            
+            devices.append(device)
+            self._cache_put(self.light_cache, device, self.light_cache_size)
+        
+        for sensor_id, sensor_info in (sensors_data or {}).items():
+            if sensor_info.get('type') in ['ZLLPresence', 'ZLLLightLevel', 'ZLLTemperature']:
+                device = {
+                    "id": f"hue_{bridge_id}_{sensor_id}",
+                    "name": sensor_info.get('name', f'Hue Sensor {sensor_id}'),
+                    "type": "sensor",
+                    "manufacturer": "Philips",
+                    "model": sensor_info.get('modelid', 'Unknown'),
+                    "platform": "hue",
+                    "bridge_id": bridge_id,
+                    "bridge_ip": bridge_ip,
+                    "sensor_id": sensor_id,
+                    "sensor_type": sensor_info.get('type'),
+                    "status": "online" if sensor_info.get('config', {}).get('reachable') else "offline",
+                    "current_state": sensor_info.get('state', {})
+                }
+                if self.retain_raw:
+                    device["raw_data"] = sensor_info
+                
+                devices.append(device)
+                self._cache_put(self.sensor_cache, device, self.sensor_cache_size)
+        
+        return devices
+    
     async def control_device(self, device_id: str, command: str, parameters: Dict[str, Any] = None) -> Dict[str, Any]:
         """Control Hue device (light or sensor)"""
         try:
             self.commands_sent += 1
             
             # Get device from cache
-            device = self.light_cache.get(device_id) or self.sensor_cache.get(device_id)
+            device = self._cache_get(self.light_cache, device_id) or self._cache_get(self.sensor_cache, device_id)
             if not device:
                 return {"error": "Device not found in Hue cache", "device_id": device_id}
             
@@ -267,73 +646,49 @@ class PhilipsHueIntegration:
             # Execute command
             if device['type'] == 'light':
                 light_id = device['light_id']
-                url = f"http://{bridge_ip}/api/{username}/lights/{light_id}/state"
+                url = self._bridge_base(bridge_ip, username) / "lights" / light_id / "state"
             else:
                 return {"error": "Sensor control not supported"}
             
-            async with ClientSession() as session:
-                async with session.put(url, json=hue_command) as response:
-                    if response.status == 200:
-                        result_data = await response.json()
-                        self.successful_commands += 1
-                        
-                        # Update cache with new state
-                        if device_id in self.light_cache:
-                            self.light_cache[device_id]['current_state'].update(hue_command)
-                            self.light_cache[device_id]['last_updated'] = datetime.utcnow()
-                        
-                        return {
-                            "success": True,
-                            "device_id": device_id,
-                            "command": command,
-                            "new_state": hue_command,
-                            "result": result_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    else:
-                        error_text = await response.text()
-                        return {
-                            "success": False,
-                            "error": f"Command failed: {response.status} - {error_text}",
-                            "device_id": device_id
-                        }
-                        
+            status, result_data = await self._bridge_put(bridge_id, 'lights', url, hue_command)
+            if status == 200:
+                self.successful_commands += 1
+                
+                # The bridge state changed, so the next discovery must not see the old snapshot
+                self._snapshot.pop((bridge_id, "lights"), None)
+                
+                # Update cache with new state
+                if device_id in self.light_cache:
+                    self.light_cache[device_id]['current_state'].update(hue_command)
+                    self.light_cache[device_id]['last_updated'] = datetime.utcnow()
+                
+                return {
+                    "success": True,
+                    "device_id": device_id,
+                    "command": command,
+                    "new_state": hue_command,
+                    "result": result_data,
+                    "timestamp": _iso_now()
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": f"Command failed: {status} - {result_data}",
+                    "device_id": device_id
+                }
+                    
         except Exception as e:
             logger.error(f"Hue device control failed: {e}")
             return {"success": False, "error": str(e), "device_id": device_id}
     
     def _map_command_to_hue(self, command: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Map generic command to Hue API command"""
-        command_map = {
-            "turn_on": {"on": True},
-            "turn_off": {"on": False},
-            "set_brightness": {
-                "on": True,
-                "bri": int(parameters.get('brightness', 50) * 2.54)  # 0-100 to 0-254
-            },
-            "set_color": {
-                "on": True,
-                "hue": int(parameters.get('hue', 0) * 182.04),  # 0-360 to 0-65535
-                "sat": int(parameters.get('saturation', 100) * 2.54)  # 0-100 to 0-254
-            },
-            "set_color_temp": {
-                "on": True,
-                "ct": parameters.get('color_temp', 300)  # Mireds
-            },
-            "set_rgb": {
-                "on": True,
-                **self._rgb_to_hue(
-                    parameters.get('red', 255),
-                    parameters.get('green', 255), 
-                    parameters.get('blue', 255)
-                )
-            }
-        }
-        
-        base_command = command_map.get(command.lower())
-        if not base_command:
+        builder = self._command_builders.get(command.lower())
+        if not builder:
             return None
         
+        base_command = builder(parameters)
+        
         # Add transition time if specified
         if 'transition_time' in parameters:
             base_command['transitiontime'] = int(parameters['transition_time'] * 10)  # Seconds to deciseconds
@@ -343,20 +698,14 @@ class PhilipsHueIntegration:
     def _rgb_to_hue(self, red: int, green: int, blue: int) -> Dict[str, int]:
         """Convert RGB values to Hue HSB format"""
         try:
-            # Normalize RGB values
-            r, g, b = red / 255.0, green / 255.0, blue / 255.0
-            
-            # Convert to HSV
-            h, s, v = colorsys.rgb_to_hsv(r, g, b)
-            
-            # Convert to Hue API format
-            return {
-                "hue": int(h * 65535),      # 0-1 to 0-65535
-                "sat": int(s * 254),        # 0-1 to 0-254
-                "bri": int(v * 254)         # 0-1 to 0-254
-            }
-            
-        except Exception as e:
+            hue, sat, bri = _rgb_to_hsb(
+                min(255, max(0, int(red))),
+                min(255, max(0, int(green))),
+                min(255, max(0, int(blue)))
+            )
+            return {"hue": hue, "sat": sat, "bri": bri}
+            
+        except (TypeError, ValueError) as e:
             logger.error(f"RGB to Hue conversion failed: {e}")
             return {"hue": 0, "sat": 254, "bri": 254}
     
@@ -367,7 +716,7 @@ class PhilipsHueIntegration:
             if not light_ids:
                 return {"error": "No lights specified for scene"}
             
-            first_light = self.light_cache.get(light_ids[0])
+            first_light = self._cache_get(self.light_cache, light_ids[0])
             if not first_light:
                 return {"error": "Light not found"}
             
@@ -385,34 +734,48 @@ class PhilipsHueIntegration:
                 "recycle": False
             }
             
-            async with ClientSession() as session:
-                url = f"http://{bridge_ip}/api/{username}/scenes"
-                
-                async with session.post(url, json=scene_data) as response:
-                    if response.status == 200:
-                        result_data = await response.json()
-                        
-                        if isinstance(result_data, list) and len(result_data) > 0:
-                            success_result = result_data[0].get('success')
-                            if success_result:
-                                scene_id = success_result.get('id')
-                                
-                                # Set light states for scene
-                                for i, (light_id, state) in enumerate(zip(light_ids, states)):
-                                    hue_light_id = light_id.split('_')[-1]
-                                    state_url = f"http://{bridge_ip}/api/{username}/scenes/{scene_id}/lightstates/{hue_light_id}"
-                                    
-                                    await session.put(state_url, json=state)
-                                
-                                return {
-                                    "success": True,
-                                    "scene_id": scene_id,
-                                    "scene_name": scene_name,
-                                    "lights_count": len(light_ids)
-                                }
-                    
-                    return {"error": f"Scene creation failed: {response.status}"}
+            session = await self._get_session()
+            base = self._bridge_base(bridge_ip, username)
+            url = base / "scenes"
+            
+            async with session.post(url, data=json_dumps(scene_data), headers=JSON_HEADERS) as response:
+                if response.status == 200:
+                    result_data = json_loads(await response.read())
                     
+                    if isinstance(result_data, list) and len(result_data) > 0:
+                        success_result = result_data[0].get('success')
+                        if success_result:
+                            scene_id = success_result.get('id')
+                            self._scene_to_bridge[scene_id] = bridge_id
+                            
+                            # Set light states for scene concurrently; the bridge limiter paces the burst
+                            scene_lights = list(zip(light_ids, states))
+                            put_results = await asyncio.gather(
+                                *(
+                                    self._bridge_put(
+                                        bridge_id, 'lights',
+                                        base / "scenes" / scene_id / "lightstates" / light_id.split('_')[-1],
+                                        state
+                                    )
+                                    for light_id, state in scene_lights
+                                ),
+                                return_exceptions=True
+                            )
+                            failed_lights = [
+                                light_id for (light_id, _), put_result in zip(scene_lights, put_results)
+                                if isinstance(put_result, Exception) or put_result[0] != 200
+                            ]
+                            
+                            return {
+                                "success": True,
+                                "scene_id": scene_id,
+                                "scene_name": scene_name,
+                                "lights_count": len(light_ids),
+                                "failed_lights": failed_lights
+                            }
+                
+                return {"error": f"Scene creation failed: {response.status}"}
+                
         except Exception as e:
             logger.error(f"Hue scene creation failed: {e}")
             return {"error": str(e)}
@@ -420,33 +783,31 @@ class PhilipsHueIntegration:
     async def activate_scene(self, scene_id: str) -> Dict[str, Any]:
         """Activate Hue scene"""
         try:
-            # Find bridge for scene (simplified - assumes first authenticated bridge)
+            # Route to the bridge that created the scene, else the first authenticated bridge
             if not self.authenticated_bridges:
                 return {"error": "No authenticated bridges"}
             
-            bridge_id = list(self.authenticated_bridges.keys())[0]
+            bridge_id = self._scene_to_bridge.get(scene_id) or next(iter(self.authenticated_bridges))
             bridge = self.bridges.get(bridge_id)
             username = self.authenticated_bridges.get(bridge_id)
             
             if not bridge or not username:
                 return {"error": "Bridge not available"}
             
-            async with ClientSession() as session:
-                url = f"http://{bridge['ip']}/api/{username}/groups/0/action"
-                command_data = {"scene": scene_id}
-                
-                async with session.put(url, json=command_data) as response:
-                    if response.status == 200:
-                        result_data = await response.json()
-                        return {
-                            "success": True,
-                            "scene_id": scene_id,
-                            "result": result_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    else:
-                        return {"success": False, "error": f"Scene activation failed: {response.status}"}
-                        
+            url = self._bridge_base(bridge['ip'], username) / "groups" / "0" / "action"
+            command_data = {"scene": scene_id}
+            
+            status, result_data = await self._bridge_put(bridge_id, 'groups', url, command_data)
+            if status == 200:
+                return {
+                    "success": True,
+                    "scene_id": scene_id,
+                    "result": result_data,
+                    "timestamp": _iso_now()
+                }
+            else:
+                return {"success": False, "error": f"Scene activation failed: {status}"}
+                    
         except Exception as e:
             logger.error(f"Hue scene activation failed: {e}")
             return {"success": False, "error": str(e)}
@@ -494,7 +855,7 @@ class PhilipsHueIntegration:
                 "total_cost": round(estimated_cost, 2),
                 "estimated_savings": round(estimated_cost * 0.15, 2),  # 15% savings through optimization
                 "device_count": total_lights,
-                "last_updated": datetime.utcnow().isoformat()
+                "last_updated": _iso_now()
             }
             
         except Exception as e:
@@ -505,10 +866,23 @@ class PhilipsHueIntegration:
         """Graceful shutdown of Hue integration"""
         try:
             logger.info("🛑 Shutting down Philips Hue integration")
+            if self._rediscovery_task is not None:
+                self._rediscovery_task.cancel()
+                self._rediscovery_task = None
+            for task in self._event_tasks.values():
+                task.cancel()
+            self._event_tasks.clear()
+            self._event_subscribers.clear()
             self.bridges.clear()
             self.authenticated_bridges.clear()
             self.light_cache.clear()
             self.sensor_cache.clear()
+            self._snapshot.clear()
+            
+            # A session passed in by the caller is closed by its owner
+            if self._owns_session and self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
             logger.info("✅ Philips Hue integration shutdown complete")
         except Exception as e:
             logger.error(f"Hue shutdown error: {e}")
\ No newline at end of file
@@ -5,23 +5,109 @@ Comprehensive SmartThings platform integration with OAuth2 authentication
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, urlencode
 
 import aiohttp
 from aiohttp import ClientSession, ClientTimeout
 
+from ..integrations.base_integration import AsyncTokenBucket, json_dumps, json_dumps_str, json_loads
+
 logger = logging.getLogger(__name__)
 
+# SmartThings OAuth2 scopes requested at authorization
+OAUTH_SCOPES = (
+    "r:devices:*",
+    "x:devices:*",
+    "r:locations:*",
+    "r:scenes:*",
+    "x:scenes:*",
+    "r:rules:*",
+    "x:rules:*",
+    "w:apps:*"
+)
+
+# Event subscriptions registered with every webhook (serialized as-is, never mutated)
+WEBHOOK_SUBSCRIPTIONS = (
+    {"sourceType": "DEVICE", "eventTypes": ("*",)},
+    {"sourceType": "CAPABILITY", "eventTypes": ("*",)}
+)
+
+# Failures an API call can raise: transport errors, timeouts and undecodable bodies
+# (orjson and stdlib JSON decode errors are both ValueErrors)
+API_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+# Request timeouts, shared by every call (discovery also serves as the session default)
+DISCOVERY_TIMEOUT = ClientTimeout(total=30)
+COMMAND_TIMEOUT = ClientTimeout(total=15)
+
+# Response timestamps are reused for up to half a second: [computed_at, iso string]
+_last_iso_ts = [0.0, ""]
+
+def _iso_now() -> str:
+    """Current UTC time as a naive ISO string, recomputed at most every 0.5s"""
+    now = time.time()
+    if now - _last_iso_ts[0] > 0.5:
+        _last_iso_ts[0] = now
+        _last_iso_ts[1] = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None).isoformat()
+    return _last_iso_ts[1]
+
+@lru_cache(maxsize=1)
+def _success_rate(successful: int, failed: int) -> float:
+    """Rounded command success percentage; repeated status probes hit the cache"""
+    total = successful + failed
+    return round(successful / total * 100, 2) if total else 100
+
+def _utc_day() -> int:
+    """Days since the epoch in UTC, used to reset daily counters"""
+    return int(time.time() // 86400)
+
 class SmartThingsIntegration:
     """
     Samsung SmartThings Platform Integration
     Supports devices, scenes, rules, and real-time updates
     """
     
-    def __init__(self, config: Dict[str, Any]):
+    # Commands without arguments map to one shared, read-only capability command
+    _STATIC_COMMAND_MAP: Dict[str, Dict[str, Any]] = {
+        "turn_on": {"capability": "switch", "command": "on"},
+        "turn_off": {"capability": "switch", "command": "off"},
+        "lock": {"capability": "lock", "command": "lock"},
+        "unlock": {"capability": "lock", "command": "unlock"}
+    }
+    
+    # Commands whose arguments come from the caller's parameters
+    _PARAM_COMMAND_BUILDERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+        "set_level": lambda p: {
+            "capability": "switchLevel",
+            "command": "setLevel",
+            "arguments": [p.get('level', 50)]
+        },
+        "set_color": lambda p: {
+            "capability": "colorControl",
+            "command": "setColor",
+            "arguments": [{
+                "hue": p.get('hue', 0),
+                "saturation": p.get('saturation', 100)
+            }]
+        },
+        "set_temperature": lambda p: {
+            "capability": "thermostatCoolingSetpoint",
+            "command": "setCoolingSetpoint",
+            "arguments": [p.get('temperature', 21)]
+        }
+    }
+    
+    def __init__(self, config: Dict[str, Any], session: Optional[ClientSession] = None):
         self.config = config
+        # Keep-alive HTTP session, either shared by the caller or created on first use
+        self._session = session
+        self._owns_session = session is None
         self.client_id = config.get('client_id')
         self.client_secret = config.get('client_secret')
         self.redirect_uri = config.get('redirect_uri')
@@ -33,43 +119,104 @@ class SmartThingsIntegration:
         
         # User tokens storage
         self.user_tokens: Dict[str, str] = {}
+        # User whose token serves calls that don't name one (the last user to authenticate)
+        self._default_user_id: Optional[str] = None
+        # Request headers per user, built once per token
+        self._headers_by_user: Dict[str, Dict[str, str]] = {}
         
         # Device cache
         self.device_cache: Dict[str, Dict[str, Any]] = {}
         self.cache_expiry = timedelta(minutes=5)
-        self.last_cache_update = datetime.min
+        # Cache ages are kept as time.monotonic() readings and only compared, never formatted
+        self._cache_ttl = self.cache_expiry.total_seconds()
+        self.last_cache_update = float('-inf')
+        # Recent get_device_status bodies per (user, device): device_id -> {user_id: (fetched_at,
+        # raw body, timestamp)}, LRU-bounded by device so a pushed event drops every user's entry at once
+        self._status_cache: "OrderedDict[str, Dict[Optional[str], Tuple[float, bytes, str]]]" = OrderedDict()
+        self.status_cache_ttl = config.get('status_cache_ttl', 2.0)
+        self.status_cache_size = config.get('status_cache_size', 1024)
+        # Full API payloads are only kept on cached devices when debugging
+        self.retain_raw = config.get('retain_raw', False)
+        # device_id -> device_info, the same dicts listed in device_cache
+        self._device_index: Dict[str, Dict[str, Any]] = {}
+        
+        # Outbound API calls: bounded concurrency plus SmartThings' per-minute request budget
+        self._api_sem = asyncio.Semaphore(config.get('max_concurrent_api', 16))
+        self._api_limiter = AsyncTokenBucket(
+            rate=config.get('api_requests_per_minute', 350) / 60,
+            capacity=config.get('max_concurrent_api', 16)
+        )
         
         # Statistics
         self.api_calls_today = 0
+        self._api_calls_day = _utc_day()
         self.successful_commands = 0
         self.failed_commands = 0
         
         logger.info("📱 Samsung SmartThings integration initialized")
     
+    async def _get_session(self) -> ClientSession:
+        """Get the keep-alive HTTP session used for all SmartThings API calls"""
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=32,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                ),
+                timeout=DISCOVERY_TIMEOUT,
+                json_serialize=json_dumps_str
+            )
+            self._owns_session = True
+        return self._session
+    
+    @asynccontextmanager
+    async def _api_slot(self):
+        """Hold one API call slot: waits for rate budget, then for a free concurrency slot"""
+        await self._api_limiter.acquire()
+        async with self._api_sem:
+            self._roll_api_day()
+            self.api_calls_today += 1
+            yield
+    
+    def _roll_api_day(self):
+        """Restart api_calls_today when the UTC day changes"""
+        day = _utc_day()
+        if day != self._api_calls_day:
+            self._api_calls_day = day
+            self.api_calls_today = 0
+    
+    def _headers_for(self, user_id: Optional[str]) -> Optional[Dict[str, str]]:
+        """Cached API headers for user_id, or for the default user when none is given"""
+        if user_id is None:
+            user_id = self._default_user_id
+        headers = self._headers_by_user.get(user_id)
+        if headers is None:
+            token = self.user_tokens.get(user_id)
+            if not token:
+                return None
+            headers = self._headers_by_user[user_id] = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+        return headers
+    
+    def _post_json(self, session: ClientSession, url: str, payload: Any, headers: Dict[str, str], **kwargs):
+        """POST a JSON body serialized with the fast encoder; use as ``async with``"""
+        return session.post(url, data=json_dumps(payload), headers=headers, **kwargs)
+    
     async def authenticate(self, user_id: str) -> Dict[str, Any]:
         """Start SmartThings OAuth2 authentication flow"""
         try:
-            # SmartThings OAuth2 scopes
-            scopes = [
-                "r:devices:*",
-                "x:devices:*", 
-                "r:locations:*",
-                "r:scenes:*",
-                "x:scenes:*",
-                "r:rules:*",
-                "x:rules:*",
-                "w:apps:*"
-            ]
-            
-            # Generate OAuth2 URL
-            auth_url = (
-                f"{self.auth_base_url}/authorize?"
-                f"client_id={self.client_id}&"
-                f"response_type=code&"
-                f"scope={' '.join(scopes)}&"
-                f"state={user_id}&"
-                f"redirect_uri={self.redirect_uri}"
-            )
+            params = {
+                "client_id": self.client_id,
+                "response_type": "code",
+                "scope": " ".join(OAUTH_SCOPES),
+                "state": user_id,
+                "redirect_uri": self.redirect_uri
+            }
+            auth_url = f"{self.auth_base_url}/authorize?{urlencode(params, quote_via=quote)}"
             
             return {
                 "auth_url": auth_url,
@@ -93,117 +240,132 @@ class SmartThingsIntegration:
                 "redirect_uri": self.redirect_uri
             }
             
-            async with ClientSession() as session:
-                async with session.post(f"{self.auth_base_url}/token", data=token_data) as response:
-                    if response.status == 200:
-                        token_response = await response.json()
-                        access_token = token_response.get('access_token')
-                        
-                        # Store token for user
-                        self.user_tokens[user_id] = access_token
-                        
-                        return {
-                            "success": True,
-                            "access_token": access_token,
-                            "token_type": token_response.get('token_type', 'Bearer'),
-                            "expires_in": token_response.get('expires_in', 3600)
-                        }
-                    else:
-                        error_data = await response.json()
-                        return {"error": error_data, "success": False}
-                        
-        except Exception as e:
+            session = await self._get_session()
+            async with session.post(f"{self.auth_base_url}/token", data=token_data) as response:
+                if response.status == 200:
+                    token_response = json_loads(await response.read())
+                    access_token = token_response.get('access_token')
+                    
+                    # Store token for user
+                    self.user_tokens[user_id] = access_token
+                    self._headers_by_user.pop(user_id, None)
+                    self._default_user_id = user_id
+                    
+                    return {
+                        "success": True,
+                        "access_token": access_token,
+                        "token_type": token_response.get('token_type', 'Bearer'),
+                        "expires_in": token_response.get('expires_in', 3600)
+                    }
+                else:
+                    error_data = json_loads(await response.read())
+                    return {"error": error_data, "success": False}
+                    
+        except API_ERRORS as e:
             logger.error(f"Token exchange failed: {e}")
             return {"error": str(e), "success": False}
     
-    async def discover_devices(self, user_id: str) -> List[Dict[str, Any]]:
-        """Discover all SmartThings devices for user"""
+    async def discover_devices(self, user_id: str, force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """Discover all SmartThings devices for user, served from cache within cache_expiry"""
         try:
-            user_token = self.user_tokens.get(user_id)
-            if not user_token:
+            headers = self._headers_for(user_id)
+            if not headers:
                 return []
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
+            cached = self.device_cache.get(user_id)
+            if not force_refresh and cached and time.monotonic() - cached['timestamp'] < self._cache_ttl:
+                return cached['devices']
+            
+            session = await self._get_session()
+            # Get user locations
+            async with self._api_slot(), session.get(f"{self.api_base_url}/locations", headers=headers, timeout=DISCOVERY_TIMEOUT) as response:
+                if response.status != 200:
+                    logger.error(f"Failed to get locations: {response.status}")
+                    return []
+                
+                locations = json_loads(await response.read()).get('items', [])
+            
+            # Fetch every location's devices concurrently
+            results = await asyncio.gather(
+                *(self._fetch_location_devices(session, headers, location) for location in locations),
+                return_exceptions=True
+            )
+            
+            all_devices = []
+            for location, result in zip(locations, results):
+                if isinstance(result, Exception):
+                    logger.error(f"SmartThings device discovery failed for location {location.get('locationId')}: {result}")
+                else:
+                    all_devices.extend(result)
+            
+            # Update cache, re-indexing this user's devices
+            previous = self.device_cache.get(user_id)
+            if previous:
+                for device in previous['devices']:
+                    self._device_index.pop(device.get('id'), None)
+            
+            cache_entry = self.device_cache[user_id] = {
+                "devices": all_devices,
+                "timestamp": time.monotonic()
             }
+            for device in all_devices:
+                if device['id']:
+                    self._device_index[device['id']] = device
+            self.last_cache_update = cache_entry['timestamp']
             
-            timeout = ClientTimeout(total=30)
+            logger.info(f"📱 Discovered {len(all_devices)} SmartThings devices")
+            return all_devices
             
-            async with ClientSession(timeout=timeout) as session:
-                # Get user locations
-                async with session.get(f"{self.api_base_url}/locations", headers=headers) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to get locations: {response.status}")
-                        return []
-                    
-                    locations = await response.json()
-                    all_devices = []
-                    
-                    # Get devices for each location
-                    for location in locations.get('items', []):
-                        location_id = location['locationId']
-                        location_name = location.get('name', 'Unknown Location')
-                        
-                        # Get devices in this location
-                        devices_url = f"{self.api_base_url}/devices?locationId={location_id}"
-                        async with session.get(devices_url, headers=headers) as dev_response:
-                            if dev_response.status == 200:
-                                devices_data = await dev_response.json()
-                                
-                                for device in devices_data.get('items', []):
-                                    device_info = {
-                                        "id": device.get('deviceId'),
-                                        "name": device.get('label', device.get('name', 'Unknown Device')),
-                                        "type": device.get('type', 'unknown'),
-                                        "manufacturer": device.get('manufacturerName', 'Unknown'),
-                                        "model": device.get('presentationId', device.get('deviceManufacturerCode')),
-                                        "location": location_name,
-                                        "location_id": location_id,
-                                        "platform": "smartthings",
-                                        "capabilities": device.get('components', [{}])[0].get('capabilities', {}),
-                                        "status": "online" if device.get('status') == 'ONLINE' else "offline",
-                                        "last_activity": device.get('lastActivityTime'),
-                                        "device_network_type": device.get('deviceNetworkType'),
-                                        "raw_data": device
-                                    }
-                                    
-                                    all_devices.append(device_info)
-                    
-                    # Update cache
-                    self.device_cache[user_id] = {
-                        "devices": all_devices,
-                        "timestamp": datetime.utcnow()
-                    }
-                    self.last_cache_update = datetime.utcnow()
-                    
-                    logger.info(f"📱 Discovered {len(all_devices)} SmartThings devices")
-                    return all_devices
-                    
         except asyncio.TimeoutError:
             logger.error("SmartThings device discovery timed out")
             return []
-        except Exception as e:
+        except API_ERRORS as e:
             logger.error(f"SmartThings device discovery failed: {e}")
             return []
     
-    async def control_device(self, device_id: str, command: str, parameters: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def _fetch_location_devices(self, session: ClientSession, headers: Dict[str, str],
+                                      location: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get the devices in one SmartThings location"""
+        location_id = location['locationId']
+        location_name = location.get('name', 'Unknown Location')
+        
+        devices_url = f"{self.api_base_url}/devices?locationId={location_id}"
+        async with self._api_slot(), session.get(devices_url, headers=headers, timeout=DISCOVERY_TIMEOUT) as dev_response:
+            if dev_response.status != 200:
+                return []
+            devices_data = json_loads(await dev_response.read())
+        
+        devices = []
+        for device in devices_data.get('items', []):
+            device_info = {
+                "id": device.get('deviceId'),
+                "name": device.get('label', device.get('name', 'Unknown Device')),
+                "type": device.get('type', 'unknown'),
+                "manufacturer": device.get('manufacturerName', 'Unknown'),
+                "model": device.get('presentationId', device.get('deviceManufacturerCode')),
+                "location": location_name,
+                "location_id": location_id,
+                "platform": "smartthings",
+                "capabilities": device.get('components', [{}])[0].get('capabilities', {}),
+                "status": "online" if device.get('status') == 'ONLINE' else "offline",
+                "last_activity": device.get('lastActivityTime'),
+                "device_network_type": device.get('deviceNetworkType')
+            }
+            if self.retain_raw:
+                device_info["raw_data"] = device
+            
+            devices.append(device_info)
+        
+        return devices
+    
+    async def control_device(self, device_id: str, command: str, parameters: Dict[str, Any] = None,
+                             user_id: Optional[str] = None) -> Dict[str, Any]:
         """Control SmartThings device"""
         try:
-            # Find user token for device (simplified - in production would need proper user mapping)
-            user_token = None
-            for uid, token in self.user_tokens.items():
-                user_token = token
-                break
-            
-            if not user_token:
+            headers = self._headers_for(user_id)
+            if not headers:
                 return {"error": "No authentication token available"}
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
-            }
-            
             # Map command to SmartThings capability command
             capability_command = self._map_command_to_capability(command, parameters or {})
             
@@ -219,223 +381,181 @@ class SmartThingsIntegration:
                 }]
             }
             
-            timeout = ClientTimeout(total=15)
+            session = await self._get_session()
+            url = f"{self.api_base_url}/devices/{device_id}/commands"
             
-            async with ClientSession(timeout=timeout) as session:
-                url = f"{self.api_base_url}/devices/{device_id}/commands"
-                
-                async with session.post(url, headers=headers, json=command_data) as response:
-                    if response.status == 200:
-                        result_data = await response.json()
-                        self.successful_commands += 1
-                        
-                        return {
-                            "success": True,
-                            "device_id": device_id,
-                            "command": command,
-                            "result": result_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    else:
-                        error_data = await response.text()
-                        self.failed_commands += 1
-                        
-                        return {
-                            "success": False,
-                            "error": f"Command failed: {response.status} - {error_data}",
-                            "device_id": device_id,
-                            "command": command
-                        }
-                        
-        except Exception as e:
+            async with self._api_slot(), self._post_json(session, url, command_data, headers, timeout=COMMAND_TIMEOUT) as response:
+                if response.status == 200:
+                    result_data = json_loads(await response.read())
+                    self.successful_commands += 1
+                    self._status_cache.pop(device_id, None)
+                    
+                    return {
+                        "success": True,
+                        "device_id": device_id,
+                        "command": command,
+                        "result": result_data,
+                        "timestamp": _iso_now()
+                    }
+                else:
+                    error_data = await response.text()
+                    self.failed_commands += 1
+                    
+                    return {
+                        "success": False,
+                        "error": f"Command failed: {response.status} - {error_data}",
+                        "device_id": device_id,
+                        "command": command
+                    }
+                    
+        except API_ERRORS as e:
             logger.error(f"SmartThings device control failed: {e}")
             self.failed_commands += 1
             return {"success": False, "error": str(e), "device_id": device_id}
     
     def _map_command_to_capability(self, command: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Map generic command to SmartThings capability command"""
-        command_map = {
-            "turn_on": {
-                "capability": "switch",
-                "command": "on"
-            },
-            "turn_off": {
-                "capability": "switch", 
-                "command": "off"
-            },
-            "set_level": {
-                "capability": "switchLevel",
-                "command": "setLevel",
-                "arguments": [parameters.get('level', 50)]
-            },
-            "set_color": {
-                "capability": "colorControl",
-                "command": "setColor",
-                "arguments": [{
-                    "hue": parameters.get('hue', 0),
-                    "saturation": parameters.get('saturation', 100)
-                }]
-            },
-            "set_temperature": {
-                "capability": "thermostatCoolingSetpoint",
-                "command": "setCoolingSetpoint",
-                "arguments": [parameters.get('temperature', 21)]
-            },
-            "lock": {
-                "capability": "lock",
-                "command": "lock"
-            },
-            "unlock": {
-                "capability": "lock",
-                "command": "unlock"
-            }
-        }
-        
-        return command_map.get(command.lower())
+        command = command.lower()
+        static_command = self._STATIC_COMMAND_MAP.get(command)
+        if static_command is not None:
+            return static_command
+        builder = self._PARAM_COMMAND_BUILDERS.get(command)
+        return builder(parameters) if builder else None
     
-    async def get_device_status(self, device_id: str) -> Dict[str, Any]:
-        """Get current device status from SmartThings"""
+    async def get_device_status(self, device_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get current device status from SmartThings, reusing a result fetched within status_cache_ttl"""
         try:
-            user_token = None
-            for uid, token in self.user_tokens.items():
-                user_token = token
-                break
-            
-            if not user_token:
+            if user_id is None:
+                user_id = self._default_user_id
+            headers = self._headers_for(user_id)
+            if not headers:
                 return {"error": "No authentication token available"}
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
-            }
+            # Cached bodies are re-parsed so every caller gets its own result tree
+            device_entries = self._status_cache.get(device_id)
+            cached = device_entries.get(user_id) if device_entries else None
+            if cached and time.monotonic() - cached[0] < self.status_cache_ttl:
+                self._status_cache.move_to_end(device_id)
+                return self._status_result(device_id, json_loads(cached[1]), cached[2])
             
-            async with ClientSession() as session:
-                url = f"{self.api_base_url}/devices/{device_id}/status"
-                
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        status_data = await response.json()
-                        return {
-                            "success": True,
-                            "device_id": device_id,
-                            "status": status_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    else:
-                        return {"success": False, "error": f"Status check failed: {response.status}"}
-                        
-        except Exception as e:
+            session = await self._get_session()
+            url = f"{self.api_base_url}/devices/{device_id}/status"
+            
+            async with self._api_slot(), session.get(url, headers=headers) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    timestamp = _iso_now()
+                    result = self._status_result(device_id, json_loads(body), timestamp)
+                    
+                    device_entries = self._status_cache.setdefault(device_id, {})
+                    device_entries[user_id] = (time.monotonic(), body, timestamp)
+                    self._status_cache.move_to_end(device_id)
+                    if len(self._status_cache) > self.status_cache_size:
+                        self._status_cache.popitem(last=False)
+                    return result
+                else:
+                    return {"success": False, "error": f"Status check failed: {response.status}"}
+                    
+        except API_ERRORS as e:
             logger.error(f"SmartThings device status failed: {e}")
             return {"success": False, "error": str(e)}
     
-    async def execute_scene(self, scene_id: str) -> Dict[str, Any]:
+    @staticmethod
+    def _status_result(device_id: str, status_data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """get_device_status success payload"""
+        return {
+            "success": True,
+            "device_id": device_id,
+            "status": status_data,
+            "timestamp": timestamp
+        }
+    
+    async def execute_scene(self, scene_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
         """Execute SmartThings scene"""
         try:
-            user_token = None
-            for uid, token in self.user_tokens.items():
-                user_token = token
-                break
-            
-            if not user_token:
+            headers = self._headers_for(user_id)
+            if not headers:
                 return {"error": "No authentication token available"}
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
-            }
+            session = await self._get_session()
+            url = f"{self.api_base_url}/scenes/{scene_id}/execute"
             
-            async with ClientSession() as session:
-                url = f"{self.api_base_url}/scenes/{scene_id}/execute"
-                
-                async with session.post(url, headers=headers) as response:
-                    if response.status == 200:
-                        result_data = await response.json()
-                        return {
-                            "success": True,
-                            "scene_id": scene_id,
-                            "result": result_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    else:
-                        return {"success": False, "error": f"Scene execution failed: {response.status}"}
-                        
-        except Exception as e:
+            async with self._api_slot(), session.post(url, headers=headers) as response:
+                if response.status == 200:
+                    result_data = json_loads(await response.read())
+                    return {
+                        "success": True,
+                        "scene_id": scene_id,
+                        "result": result_data,
+                        "timestamp": _iso_now()
+                    }
+                else:
+                    return {"success": False, "error": f"Scene execution failed: {response.status}"}
+                    
+        except API_ERRORS as e:
             logger.error(f"SmartThings scene execution failed: {e}")
             return {"success": False, "error": str(e)}
     
     async def get_scenes(self, user_id: str) -> List[Dict[str, Any]]:
         """Get available SmartThings scenes"""
         try:
-            user_token = self.user_tokens.get(user_id)
-            if not user_token:
+            headers = self._headers_for(user_id)
+            if not headers:
                 return []
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
-            }
-            
-            async with ClientSession() as session:
-                async with session.get(f"{self.api_base_url}/scenes", headers=headers) as response:
-                    if response.status == 200:
-                        scenes_data = await response.json()
-                        
-                        scenes = []
-                        for scene in scenes_data.get('items', []):
-                            scenes.append({
-                                "id": scene.get('sceneId'),
-                                "name": scene.get('sceneName'),
-                                "icon": scene.get('sceneIcon'),
-                                "location_id": scene.get('locationId'),
-                                "last_executed": scene.get('lastExecutedDate'),
-                                "platform": "smartthings"
-                            })
-                        
-                        return scenes
-                    else:
-                        logger.error(f"Failed to get scenes: {response.status}")
-                        return []
-                        
-        except Exception as e:
+            session = await self._get_session()
+            async with self._api_slot(), session.get(f"{self.api_base_url}/scenes", headers=headers) as response:
+                if response.status == 200:
+                    scenes_data = json_loads(await response.read())
+                    
+                    scenes = []
+                    for scene in scenes_data.get('items', []):
+                        scenes.append({
+                            "id": scene.get('sceneId'),
+                            "name": scene.get('sceneName'),
+                            "icon": scene.get('sceneIcon'),
+                            "location_id": scene.get('locationId'),
+                            "last_executed": scene.get('lastExecutedDate'),
+                            "platform": "smartthings"
+                        })
+                    
+                    return scenes
+                else:
+                    logger.error(f"Failed to get scenes: {response.status}")
+                    return []
+                    
+        except API_ERRORS as e:
             logger.error(f"Failed to get SmartThings scenes: {e}")
             return []
     
     async def setup_webhook(self, user_id: str) -> Dict[str, Any]:
         """Set up webhook for real-time device updates"""
         try:
-            user_token = self.user_tokens.get(user_id)
-            if not user_token:
+            headers = self._headers_for(user_id)
+            if not headers:
                 return {"error": "No authentication token available"}
             
             webhook_config = {
                 "targetUrl": f"{self.webhook_url}/smartthings",
                 "targetType": "WEBHOOK",
-                "subscriptions": [
-                    {"sourceType": "DEVICE", "eventTypes": ["*"]},
-                    {"sourceType": "CAPABILITY", "eventTypes": ["*"]}
-                ]
+                "subscriptions": WEBHOOK_SUBSCRIPTIONS
             }
             
-            headers = {
-                "Authorization": f"Bearer {user_token}",
-                "Content-Type": "application/json"
-            }
+            session = await self._get_session()
+            url = f"{self.api_base_url}/installedapps/{self.config.get('app_id', 'default')}/subscriptions"
             
-            async with ClientSession() as session:
-                url = f"{self.api_base_url}/installedapps/{self.config.get('app_id', 'default')}/subscriptions"
-                
-                async with session.post(url, headers=headers, json=webhook_config) as response:
-                    if response.status == 200:
-                        webhook_data = await response.json()
-                        return {
-                            "success": True,
-                            "webhook_id": webhook_data.get('id'),
-                            "target_url": self.webhook_url
-                        }
-                    else:
-                        return {"success": False, "error": f"Webhook setup failed: {response.status}"}
-                        
-        except Exception as e:
+            async with self._api_slot(), self._post_json(session, url, webhook_config, headers) as response:
+                if response.status == 200:
+                    webhook_data = json_loads(await response.read())
+                    return {
+                        "success": True,
+                        "webhook_id": webhook_data.get('id'),
+                        "target_url": self.webhook_url
+                    }
+                else:
+                    return {"success": False, "error": f"Webhook setup failed: {response.status}"}
+                    
+        except API_ERRORS as e:
             logger.error(f"SmartThings webhook setup failed: {e}")
             return {"success": False, "error": str(e)}
     
@@ -444,6 +564,8 @@ class SmartThingsIntegration:
         try:
             events = event_data.get('events', [])
             processed_events = []
+            # One timestamp for the whole batch
+            now_iso = _iso_now()
             
             for event in events:
                 event_type = event.get('eventType')
@@ -467,10 +589,12 @@ class SmartThingsIntegration:
                     }
                     
                     processed_events.append(processed_event)
+                    # Pushed state supersedes any polled status
+                    self._status_cache.pop(device_id, None)
                     
                     # Update device cache if available
                     if device_id and capability and attribute:
-                        self._update_device_cache(device_id, capability, attribute, value)
+                        self._update_device_cache(device_id, capability, attribute, value, now_iso)
             
             return {
                 "success": True,
@@ -482,21 +606,20 @@ class SmartThingsIntegration:
             logger.error(f"SmartThings webhook event processing failed: {e}")
             return {"success": False, "error": str(e)}
     
-    def _update_device_cache(self, device_id: str, capability: str, attribute: str, value: Any):
-        """Update device state in cache"""
+    def _update_device_cache(self, device_id: str, capability: str, attribute: str, value: Any,
+                             now_iso: Optional[str] = None):
+        """Update device state in cache, stamped with the batch time when given"""
         try:
-            # Update device state in cache for faster access
-            for user_id, cache_data in self.device_cache.items():
-                for device in cache_data.get('devices', []):
-                    if device.get('id') == device_id:
-                        if 'current_state' not in device:
-                            device['current_state'] = {}
-                        
-                        device['current_state'][f"{capability}.{attribute}"] = {
-                            "value": value,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                        break
+            device = self._device_index.get(device_id)
+            if device is None:
+                return
+            
+            # State events say nothing about added, removed or renamed devices,
+            # so the discovery TTL is left to run its course
+            device.setdefault('current_state', {})[f"{capability}.{attribute}"] = {
+                "value": value,
+                "timestamp": now_iso or _iso_now()
+            }
                         
         except Exception as e:
             logger.error(f"Failed to update device cache: {e}")
@@ -516,7 +639,7 @@ class SmartThingsIntegration:
                     "climate": {"kwh": 6.8, "cost": 2.04},
                     "appliances": {"kwh": 1.5, "cost": 0.45}
                 },
-                "last_updated": datetime.utcnow().isoformat()
+                "last_updated": _iso_now()
             }
             
         except Exception as e:
@@ -525,8 +648,7 @@ class SmartThingsIntegration:
     
     def get_status(self) -> Dict[str, Any]:
         """Get SmartThings integration status"""
-        success_rate = (self.successful_commands / (self.successful_commands + self.failed_commands) * 100) if (self.successful_commands + self.failed_commands) > 0 else 100
-        
+        self._roll_api_day()
         return {
             "platform": "Samsung SmartThings",
             "status": "connected" if self.user_tokens else "disconnected",
@@ -534,8 +656,8 @@ class SmartThingsIntegration:
             "api_calls_today": self.api_calls_today,
             "successful_commands": self.successful_commands,
             "failed_commands": self.failed_commands,
-            "success_rate": round(success_rate, 2),
-            "cache_status": "fresh" if (datetime.utcnow() - self.last_cache_update) < self.cache_expiry else "stale",
+            "success_rate": _success_rate(self.successful_commands, self.failed_commands),
+            "cache_status": "fresh" if time.monotonic() - self.last_cache_update < self._cache_ttl else "stale",
             "capabilities": [
                 "Device discovery and control",
                 "Scene execution",
@@ -550,9 +672,15 @@ class SmartThingsIntegration:
         """Graceful shutdown of SmartThings integration"""
         try:
             logger.info("🛑 Shutting down SmartThings integration")
-            # Cleanup resources, close connections, etc.
             self.user_tokens.clear()
+            self._default_user_id = None
+            self._headers_by_user.clear()
             self.device_cache.clear()
+            self._device_index.clear()
+            self._status_cache.clear()
+            if self._owns_session and self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
             logger.info("✅ SmartThings integration shutdown complete")
         except Exception as e:
             logger.error(f"SmartThings shutdown error: {e}")
\ No newline at end of file